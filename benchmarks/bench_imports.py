@@ -0,0 +1,76 @@
+"""
+Measures the cold import time of each page's module-level imports in a fresh
+interpreter and checks it against a per-page budget.
+
+    python -m benchmarks.bench_imports
+    python -m benchmarks.bench_imports --repeat 5 --budget 0.8
+
+Exits with status 1 when a page goes over its budget.
+"""
+import argparse
+import ast
+import glob
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 초 단위, 페이지 파일 이름 기준 (없으면 DEFAULT_BUDGET)
+DEFAULT_BUDGET = 1.2
+BUDGETS = {
+    "Home.py": 0.8,
+}
+
+
+def module_imports(path):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    return "\n".join(
+        ast.unparse(node)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def import_seconds(source):
+    code = f"import time\nstart = time.perf_counter()\n{source}\nprint(time.perf_counter() - start)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, help="override every page budget")
+    args = parser.parse_args()
+
+    paths = [os.path.join(ROOT, "Home.py")] + sorted(glob.glob(os.path.join(ROOT, "pages", "*.py")))
+    over = False
+    for path in paths:
+        name = os.path.basename(path)
+        budget = args.budget or BUDGETS.get(name, DEFAULT_BUDGET)
+        try:
+            seconds = statistics.median(
+                import_seconds(module_imports(path)) for _ in range(args.repeat)
+            )
+        except RuntimeError as e:
+            print(f"{name:<26} error: {e}")
+            over = True
+            continue
+        status = "ok" if seconds <= budget else "OVER"
+        over = over or seconds > budget
+        print(f"{name:<26} {seconds:>7.3f}s  budget {budget:.2f}s  {status}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
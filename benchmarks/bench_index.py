@@ -0,0 +1,81 @@
+"""
+Recall and latency of the utils.index_formats kinds against the flat index.
+
+    python -m benchmarks.bench_index --count 200000 --dim 1536
+    python -m benchmarks.bench_index --count 1000000 --dim 384 --kinds ivf_pq hnsw_sq8
+
+Vectors are synthetic and clustered (like real embeddings) so IVF has structure
+to exploit. Reports build time, file size, open time, query p50/p95 and
+recall@k against exact search.
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from utils.index_formats import INDEX_KINDS, DiskIndex, build_index, save_index
+
+
+def clustered_vectors(count, dim, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.3 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--kinds", nargs="+", default=list(INDEX_KINDS), choices=INDEX_KINDS)
+    args = parser.parse_args()
+
+    # 질문도 같은 군집에서 뽑아야 최근접 이웃이 의미가 있음
+    vectors = clustered_vectors(args.count + args.queries, args.dim)
+    vectors, queries = vectors[: args.count], vectors[args.count :]
+    texts = [f"chunk {i}" for i in range(args.count)]
+    metadatas = [{} for _ in range(args.count)]
+    truth = None
+
+    print(
+        f"{'kind':<10} {'build s':>8} {'MiB':>8} {'open ms':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(args.k):>9}"
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        for kind in ["flat"] + [kind for kind in args.kinds if kind != "flat"]:
+            path = os.path.join(workdir, kind)
+            start = time.perf_counter()
+            index = build_index(vectors, kind)
+            build_seconds = time.perf_counter() - start
+            save_index(path, index, texts, metadatas, kind)
+            del index
+            size = os.path.getsize(os.path.join(path, "index.faiss")) / 2**20
+
+            start = time.perf_counter()
+            disk_index = DiskIndex(path)
+            open_ms = (time.perf_counter() - start) * 1000
+
+            timings = []
+            found = []
+            for query in queries:
+                start = time.perf_counter()
+                _, ids = disk_index.search(query, args.k)
+                timings.append((time.perf_counter() - start) * 1000)
+                found.append(ids[0])
+            found = np.array(found)
+            if truth is None:
+                truth = found
+            recall = np.mean(
+                [len(set(a) & set(b)) / args.k for a, b in zip(found, truth)]
+            )
+            print(
+                f"{kind:<10} {build_seconds:>8.2f} {size:>8.1f} {open_ms:>8.2f} "
+                f"{np.percentile(timings, 50):>8.3f} {np.percentile(timings, 95):>8.3f} {recall:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Compares parse time and peak memory of utils.loaders against UnstructuredFileLoader.
+
+    python -m benchmarks.bench_loaders sample.pdf sample.txt sample.docx
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from utils.loaders import iter_pages, iter_unstructured
+
+
+def measure(load, file_path, repeat):
+    timings = []
+    peak = 0
+    chars = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        chars = sum(len(doc.page_content) for doc in load(file_path))
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(timings), peak, chars
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'file':<30} {'parser':<12} {'seconds':>9} {'peak MiB':>9} {'chars':>10}")
+    for file_path in args.files:
+        name = os.path.basename(file_path)
+        for label, load in [("fast", iter_pages), ("unstructured", iter_unstructured)]:
+            seconds, peak, chars = measure(load, file_path, args.repeat)
+            print(f"{name:<30} {label:<12} {seconds:>9.3f} {peak / 2**20:>9.1f} {chars:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""
+End-to-end benchmark of the ingestion and query paths of the GPT pages, run
+headlessly against the deterministic fakes in benchmarks/fakes.py.
+
+    python -m benchmarks.bench_rag --sizes 10 100 500 --output bench_rag.json
+    python -m benchmarks.bench_rag --baseline bench_rag.json
+    python -m benchmarks.bench_rag --llm-cache replay --cassette quiz.json
+
+Each scenario follows the same steps as its page (loader, splitter, FAISS,
+prompts and chain layout) with the models and the docs site swapped for fakes.
+Stages: load, split, embed, index, retrieve, generate. The tiktoken encodings
+must already be in the local tiktoken cache; nothing else touches the network.
+"""
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+import requests
+import xml.etree.ElementTree as ET
+from langchain.document_loaders import TextLoader, WebBaseLoader
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+from langchain.schema import StrOutputParser
+from langchain.vectorstores.faiss import FAISS
+from benchmarks.fakes import (
+    FakeChatModel,
+    FakeEmbeddings,
+    fake_text,
+    fake_transcribe,
+    serve_fake_ollama,
+    serve_fake_site,
+)
+from utils import llm_cache, partitions, router
+from utils.context import pack_context
+from utils.ingest_filter import IngestFilter
+from utils.loaders import iter_pages
+from utils.memory import ConversationMemory
+from utils.splitters import StreamingTokenSplitter, recursive_splitter
+from utils.streaming import JsonArrayStream
+
+QUESTIONS = [
+    "What does the document say about latency?",
+    "Summarize the clauses about the cache.",
+    "Which model is used for the index?",
+    "How many requests does the gateway allow?",
+    "Is there anything about meetings?",
+]
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(function):
+        SCENARIOS[name] = function
+        return function
+
+    return register
+
+
+class Stages:
+    def __init__(self):
+        self.results = {}
+        self.info = {}
+
+    @contextmanager
+    def stage(self, name):
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result = self.results.setdefault(name, {"seconds": 0.0, "peak_mib": 0.0})
+            result["seconds"] += seconds
+            result["peak_mib"] = max(result["peak_mib"], peak / 2**20)
+
+
+def write_corpus(directory, pages, words_per_page=400):
+    path = os.path.join(directory, f"corpus-{pages}.txt")
+    with open(path, "w") as f:
+        for i in range(pages):
+            text = fake_text(f"page-{i}", words_per_page).split(" ")
+            f.write("\n".join(" ".join(text[j : j + 12]) for j in range(0, len(text), 12)))
+            f.write("\n")
+    return path
+
+
+def embed_and_index(stages, docs, embeddings, k=4):
+    texts = [doc.page_content for doc in docs]
+    with stages.stage("embed"):
+        vectors = embeddings.embed_documents(texts)
+    with stages.stage("index"):
+        vectorstore = FAISS.from_embeddings(
+            list(zip(texts, vectors)),
+            embeddings,
+            metadatas=[doc.metadata for doc in docs],
+        )
+    return vectorstore.as_retriever(search_kwargs={"k": k})
+
+
+def load_and_split_file(stages, path):
+    with stages.stage("load"):
+        pages = list(iter_pages(path))
+    with stages.stage("split"):
+        splitter = StreamingTokenSplitter(separator="\n", chunk_size=600, chunk_overlap=100)
+        ingest_filter = IngestFilter()
+        docs = ingest_filter.dedupe(splitter.split_documents(ingest_filter.strip(pages)))
+    stages.info["ingest_filter"] = ingest_filter.report()
+    return docs
+
+
+@scenario("document")
+def document_gpt(stages, size, workdir, fakes, queries):
+    # pages/01_DocumentGPT.py
+    docs = load_and_split_file(stages, write_corpus(workdir, size))
+    retriever = embed_and_index(stages, docs, fakes["embeddings"], k=8)
+    memory = ConversationMemory(mode="window", max_token_limit=500)
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "Answer the question using ONLY the following context.\n\nContext: {context}"),
+            MessagesPlaceholder(variable_name="history"),
+            ("human", "{question}"),
+        ]
+    )
+    llm = fakes["llm"]
+    if fakes.get("ollama_url"):
+        from utils.ollama_runtime import ManagedChatOllama
+
+        llm = ManagedChatOllama(base_url=fakes["ollama_url"], model="mistral:latest", temperature=0.1)
+        with stages.stage("warm_up"):
+            llm.warm_up(background=False)
+    chain = prompt | llm
+    for question in queries:
+        with stages.stage("retrieve"):
+            context = pack_context(retriever.get_relevant_documents(question), token_budget=2000)
+        with stages.stage("generate"):
+            history = memory.load_memory_variables({"input": question})["history"]
+            response = chain.invoke(
+                {"context": context, "question": question, "history": history}
+            )
+            memory.save_context({"input": question}, {"output": response.content})
+    return len(docs)
+
+
+@scenario("private")
+def private_gpt(stages, size, workdir, fakes, queries):
+    # pages/02_PrivateGPT.py
+    docs = load_and_split_file(stages, write_corpus(workdir, size))
+    retriever = embed_and_index(stages, docs, fakes["embeddings"], k=8)
+    prompt = ChatPromptTemplate.from_template(
+        "Answer the question using ONLY the following context.\n\nContext: {context}\nQuestion:{question}"
+    )
+    llm = fakes["llm"]
+    if fakes.get("ollama_url"):
+        from utils.ollama_runtime import ManagedChatOllama
+
+        llm = ManagedChatOllama(base_url=fakes["ollama_url"], model="mistral:latest", temperature=0.1)
+        with stages.stage("warm_up"):
+            llm.warm_up(background=False)
+    chain = prompt | llm
+    for question in queries:
+        with stages.stage("retrieve"):
+            context = pack_context(retriever.get_relevant_documents(question), token_budget=1500)
+        with stages.stage("generate"):
+            chain.invoke({"context": context, "question": question})
+    return len(docs)
+
+
+@scenario("quiz")
+def quiz_gpt(stages, size, workdir, fakes, queries):
+    # pages/03_QuizGPT.py
+    docs = load_and_split_file(stages, write_corpus(workdir, size))
+    prompt = PromptTemplate.from_template(
+        "Make a {difficulty} quiz based on the following context:\n{context}"
+    )
+    function = {"name": "create_quiz", "parameters": {"type": "object"}}
+    stream = JsonArrayStream()
+    chunks = llm_cache.stream(
+        fakes["llm"],
+        prompt.format_prompt(
+            difficulty="Eazy", context="\n".join(doc.page_content for doc in docs)
+        ).to_messages(),
+        function_call={"name": "create_quiz"},
+        functions=[function],
+    )
+    # 첫 문제가 보일 때까지와 나머지를 따로 잼
+    with stages.stage("first_question"):
+        for chunk in chunks:
+            if stream.feed(chunk.additional_kwargs["function_call"]["arguments"]):
+                break
+    with stages.stage("generate"):
+        for chunk in chunks:
+            stream.feed(chunk.additional_kwargs["function_call"]["arguments"])
+        stream.result()
+    return len(docs)
+
+
+@scenario("site")
+def site_gpt(stages, size, workdir, fakes, queries):
+    # pages/04_SiteGPT.py
+    with serve_fake_site(
+        pages_per_product=max(size // 4, 1),
+        latency=fakes["http_latency"],
+        duplicate_every=fakes["site_duplicate_every"],
+    ) as base_url:
+        with stages.stage("load"):
+            root = ET.fromstring(requests.get(f"{base_url}/sitemap-0.xml").content)
+            namespaces = {"ns": "http://www.sitemaps.org/schemas/sitemap/0.9"}
+            urls = [
+                url.text
+                for url in root.findall(".//ns:loc", namespaces)
+                if partitions.product_for_url(url.text)
+            ]
+            docs_by_product = {}
+            for url in urls:
+                docs_by_product.setdefault(partitions.product_for_url(url), []).extend(
+                    WebBaseLoader(url).load()
+                )
+    # 반복 블록 제거 후 제품별 파티션과 질문 분류 (utils/ingest_filter.py, utils/partitions.py)
+    ingest_filter = IngestFilter(sample_pages=None)
+    with stages.stage("split"):
+        list(ingest_filter.strip(doc for docs in docs_by_product.values() for doc in docs))
+    stores = {}
+    centroids = {}
+    chunks = 0
+    for product, product_docs in docs_by_product.items():
+        with stages.stage("split"):
+            docs = ingest_filter.dedupe(
+                recursive_splitter(chunk_size=1000, chunk_overlap=200).split_documents(
+                    product_docs
+                )
+            )
+        texts = [doc.page_content for doc in docs]
+        with stages.stage("embed"):
+            vectors = fakes["embeddings"].embed_documents(texts)
+        with stages.stage("index"):
+            stores[product] = partitions.FAISSPartition(
+                FAISS.from_embeddings(
+                    list(zip(texts, vectors)),
+                    fakes["embeddings"],
+                    metadatas=[doc.metadata for doc in docs],
+                )
+            )
+            centroids[product] = partitions.centroid(vectors)
+        chunks += len(docs)
+    stages.info["ingest_filter"] = ingest_filter.report()
+    retriever = partitions.PartitionedRetriever(
+        partitions=stores,
+        classifier=partitions.QueryClassifier(centroids),
+        embeddings=fakes["embeddings"],
+    )
+    answers_prompt = ChatPromptTemplate.from_template(
+        "Using ONLY the following context, answer the user's question.\n\nContext: {context}\n\nQuestion: {question}\n\nScore (0-5):"
+    )
+    choose_prompt = ChatPromptTemplate.from_messages(
+        [("system", "Use ONLY the following pre-existing answers.\n\nAnswers: {answers}"), ("human", "{question}")]
+    )
+    for question in queries:
+        with stages.stage("retrieve"):
+            found = retriever.get_relevant_documents(question)
+        with stages.stage("generate"):
+            answers = [
+                answer.content
+                for answer in (answers_prompt | fakes["router"].runnable("sitegpt/answer")).batch(
+                    [{"question": question, "context": doc.page_content} for doc in found]
+                )
+            ]
+            (choose_prompt | fakes["router"].runnable("sitegpt/choose")).invoke(
+                {"question": question, "answers": "\n\n".join(answers)}
+            )
+    return chunks
+
+
+@scenario("meeting")
+def meeting_gpt(stages, size, workdir, fakes, queries):
+    # pages/05_MeetingGPT.py, with the audio chunks replaced by fake transcriptions
+    transcript_path = os.path.join(workdir, f"transcript-{size}.txt")
+    with stages.stage("load"):
+        with open(transcript_path, "w") as text_file:
+            for i in range(max(size // 10, 1)):
+                text_file.write(fake_transcribe(f"chunk_{i}", fakes["transcribe_latency"])["text"])
+    with stages.stage("split"):
+        splitter = recursive_splitter(chunk_size=800, chunk_overlap=100)
+        docs = TextLoader(transcript_path).load_and_split(text_splitter=splitter)
+    first_summary_chain = (
+        ChatPromptTemplate.from_template('Write a concise summary of the following:\n"{text}"\nCONCISE SUMMARY:')
+        | fakes["router"].runnable("meetinggpt/summarize")
+        | StrOutputParser()
+    )
+    refine_chain = (
+        ChatPromptTemplate.from_template(
+            "Existing summary: {existing_summary}\n------------\n{context}\n------------\n"
+            "Given the new context, refine the original summary."
+        )
+        | fakes["router"].runnable("meetinggpt/refine")
+        | StrOutputParser()
+    )
+    with stages.stage("generate"):
+        summary = first_summary_chain.invoke({"text": docs[0].page_content})
+        for doc in docs[1:]:
+            summary = refine_chain.invoke({"existing_summary": summary, "context": doc.page_content})
+    retriever = embed_and_index(stages, docs, fakes["embeddings"])
+    for question in queries:
+        with stages.stage("retrieve"):
+            retriever.get_relevant_documents(question)
+    return len(docs)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {
+            (run["scenario"], run["size"]): run for run in json.load(f)["results"]
+        }
+    print(f"\nvs {baseline_path}")
+    for run in results:
+        previous = baseline.get((run["scenario"], run["size"]))
+        if not previous:
+            continue
+        for name, stage in run["stages"].items():
+            before = previous["stages"].get(name)
+            if before and before["seconds"]:
+                ratio = stage["seconds"] / before["seconds"]
+                flag = "  <-- slower" if ratio > 1.1 else ""
+                print(f"{run['scenario']:<10} {run['size']:>6} {name:<10} x{ratio:5.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--queries", type=int, default=len(QUESTIONS))
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds to first token")
+    parser.add_argument(
+        "--fast-llm-latency", type=float, default=0.05, help="first token latency of the fast tier"
+    )
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embedding batch")
+    parser.add_argument(
+        "--ollama-stub",
+        type=float,
+        metavar="LOAD_SECONDS",
+        help="run the private scenario against a local Ollama stub with this model load time",
+    )
+    parser.add_argument("--http-latency", type=float, default=0.01)
+    parser.add_argument(
+        "--site-duplicate-every",
+        type=int,
+        default=0,
+        help="make every n-th page of each fake docs product a copy of its first page",
+    )
+    parser.add_argument("--transcribe-latency", type=float, default=0.5)
+    parser.add_argument(
+        "--llm-cache",
+        default="off",
+        choices=llm_cache.MODES,
+        help="record/replay use --cassette; cache uses a fresh cache per run",
+    )
+    parser.add_argument("--cassette", default=llm_cache.LLM_CASSETTE)
+    parser.add_argument("--output", default="bench_rag.json")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    args = parser.parse_args()
+
+    llm = FakeChatModel(first_token_latency=args.llm_latency, token_latency=args.token_latency)
+    fakes = {
+        "llm": llm,
+        "router": router.Router(
+            {
+                "fast": FakeChatModel(
+                    first_token_latency=args.fast_llm_latency, token_latency=args.token_latency
+                ),
+                "strong": llm,
+            }
+        ),
+        "embeddings": FakeEmbeddings(batch_latency=args.embed_latency),
+        "http_latency": args.http_latency,
+        "site_duplicate_every": args.site_duplicate_every,
+        "transcribe_latency": args.transcribe_latency,
+    }
+    queries = (QUESTIONS * args.queries)[: args.queries]
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir, ExitStack() as stack:
+        if args.ollama_stub is not None:
+            fakes["ollama_url"], _ = stack.enter_context(
+                serve_fake_ollama(load_latency=args.ollama_stub, token_latency=args.token_latency)
+            )
+        llm_cache.install(
+            args.llm_cache, path=os.path.join(workdir, "llm.sqlite"), cassette=args.cassette
+        )
+        for name in args.scenarios:
+            for size in args.sizes:
+                stages = Stages()
+                start = time.perf_counter()
+                chunks = SCENARIOS[name](stages, size, workdir, fakes, queries)
+                total = time.perf_counter() - start
+                query_seconds = sum(
+                    stages.results.get(stage, {}).get("seconds", 0.0)
+                    for stage in ("retrieve", "generate")
+                )
+                run = {
+                    "scenario": name,
+                    "size": size,
+                    "chunks": chunks,
+                    "seconds": total,
+                    "stages": stages.results,
+                    "chunks_per_second": chunks / total if total else None,
+                    "queries_per_second": len(queries) / query_seconds
+                    if query_seconds and name != "quiz"
+                    else None,
+                    **stages.info,
+                }
+                results.append(run)
+                stage_summary = "  ".join(
+                    f"{stage}={values['seconds']:.3f}s/{values['peak_mib']:.1f}MiB"
+                    for stage, values in stages.results.items()
+                )
+                print(f"{name:<10} {size:>6} {chunks:>6} chunks  {stage_summary}")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "results": results,
+        "model_routes": router.stats.summary(),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
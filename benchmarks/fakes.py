@@ -0,0 +1,415 @@
+"""
+Deterministic stand-ins for the OpenAI/Ollama models and the Cloudflare docs site.
+Every fake sleeps for a configurable latency so the benchmarks have realistic shapes
+without touching the network.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List
+import numpy as np
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from langchain.schema.embeddings import Embeddings
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+
+WORDS = (
+    "cloudflare worker vector index gateway model token latency request cache "
+    "summary meeting contract clause quiz answer question document page chunk"
+).split()
+
+
+def _seed(text):
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def fake_text(seed_text, words):
+    rng = np.random.default_rng(_seed(seed_text))
+    return " ".join(WORDS[i] for i in rng.integers(0, len(WORDS), words))
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Answers with deterministic text derived from the prompt. When called with
+    `functions` it returns a function_call whose arguments are a small quiz.
+    """
+
+    response_tokens: int = 60
+    first_token_latency: float = 0.2
+    token_latency: float = 0.005
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _tokens(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        return fake_text(prompt, self.response_tokens).split(" ")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if "functions" in kwargs:
+            time.sleep(self.first_token_latency + self.token_latency * self.response_tokens)
+            return ChatResult(
+                generations=[
+                    ChatGeneration(
+                        message=AIMessage(
+                            content="",
+                            additional_kwargs={
+                                "function_call": {
+                                    "name": kwargs["functions"][0]["name"],
+                                    "arguments": json.dumps(fake_quiz(messages)),
+                                }
+                            },
+                        )
+                    )
+                ]
+            )
+        text = ""
+        for chunk in self._stream(messages, stop, run_manager, **kwargs):
+            text += chunk.message.content
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_latency)
+        if "functions" in kwargs:
+            # OpenAI처럼 함수 이름 다음에 arguments JSON을 조각내서 보냄
+            arguments = json.dumps(fake_quiz(messages))
+            name = kwargs["functions"][0]["name"]
+            for i in range(0, len(arguments), 16):
+                time.sleep(self.token_latency)
+                function_call = {"arguments": arguments[i : i + 16]}
+                if i == 0:
+                    function_call["name"] = name
+                if run_manager:
+                    run_manager.on_llm_new_token("")
+                yield ChatGenerationChunk(
+                    message=AIMessageChunk(
+                        content="", additional_kwargs={"function_call": function_call}
+                    )
+                )
+            return
+        for i, token in enumerate(self._tokens(messages)):
+            time.sleep(self.token_latency)
+            token = token if i == 0 else " " + token
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def fake_quiz(messages, questions=5):
+    prompt = "\n".join(str(message.content) for message in messages)
+    return {
+        "questions": [
+            {
+                "question": fake_text(f"{prompt}{i}", 8) + "?",
+                "answers": [
+                    {"answer": fake_text(f"{prompt}{i}{j}", 2), "correct": j == 0}
+                    for j in range(4)
+                ],
+            }
+            for i in range(questions)
+        ]
+    }
+
+
+class FakeEmbeddings(Embeddings):
+    """Hash-seeded unit vectors, so identical texts always embed identically."""
+
+    def __init__(self, size=256, batch_latency=0.05, text_latency=0.0005):
+        self.size = size
+        self.batch_latency = batch_latency
+        self.text_latency = text_latency
+
+    def _vector(self, text):
+        vector = np.random.default_rng(_seed(text)).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.batch_latency + self.text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.batch_latency)
+        return self._vector(text)
+
+
+def fake_transcribe(audio_chunk, latency=0.5):
+    time.sleep(latency)
+    return {"text": fake_text(audio_chunk, 1500) + " "}
+
+
+@contextmanager
+def serve_fake_site(pages_per_product=10, words_per_page=800, latency=0.01, duplicate_every=0):
+    """
+    Serves a sitemap and docs pages shaped like developers.cloudflare.com on a
+    local port. Yields the base url. Every page repeats the same sidebar of
+    links, and with `duplicate_every` every n-th page of a product is a copy
+    of its first page (like versioned or moved docs pages).
+    """
+    products = ["ai-gateway", "vectorize", "workers-ai", "pages"]
+    paths = [f"/{product}/page-{i}/" for product in products for i in range(pages_per_product)]
+    sidebar = "\n".join(
+        f"<div class='sidebar-link'>{fake_text(f'link-{i}', 4)}</div>" for i in range(40)
+    )
+
+    def body_seed(path):
+        product, page = path.strip("/").split("/")
+        if duplicate_every and int(page.split("-")[1]) % duplicate_every == duplicate_every - 1:
+            return f"/{product}/page-0/"
+        return path
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path == "/sitemap-0.xml":
+                urls = "".join(
+                    f"<url><loc>{base_url}{path}</loc><lastmod>2024-01-01</lastmod></url>"
+                    for path in paths
+                )
+                body = (
+                    '<?xml version="1.0" encoding="UTF-8"?>'
+                    f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+                )
+                content_type = "application/xml"
+            elif self.path in paths:
+                body = (
+                    "<html><body><header>Docs Products Blog</header>\n"
+                    f"<div class='sidebar'>\n{sidebar}\n</div>\n"
+                    f"<main><h1>{self.path}</h1>\n"
+                    f"<p>{fake_text(body_seed(self.path), words_per_page)}</p></main>\n"
+                    "<footer>Cloudflare footer</footer></body></html>"
+                )
+                content_type = "text/html"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args: Any):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield base_url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# 이 옵션이 바뀔 때만 Ollama가 모델을 다시 올림
+RUNNER_OPTIONS = ("num_ctx", "num_batch", "num_gpu", "main_gpu", "low_vram", "num_thread")
+
+
+def _seconds(keep_alive):
+    if isinstance(keep_alive, (int, float)):
+        return float(keep_alive)
+    units = {"s": 1, "m": 60, "h": 3600}
+    return float(keep_alive[:-1]) * units[keep_alive[-1]]
+
+
+@contextmanager
+def serve_fake_ollama(
+    load_latency=2.0,
+    prompt_token_latency=0.001,
+    token_latency=0.005,
+    response_tokens=60,
+    parallel=1,
+):
+    """
+    Serves Ollama's /api/generate on a local port. Yields the base url and a
+    dict of counters. Like Ollama it loads the model on the first request, when
+    the runner options change or after keep_alive expires, runs `parallel` requests
+    at a time, and only evaluates the prompt words after the longest prefix
+    shared with the previous prompt of the slot (KV cache reuse).
+    """
+    state = {"options": None, "expires": 0.0, "loads": 0, "requests": 0, "active": 0, "max_active": 0}
+    lock = threading.Lock()
+    slots = [[] for _ in range(parallel)]
+    free = list(range(parallel))
+    available = threading.Semaphore(parallel)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/api/generate":
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            available.acquire()
+            with lock:
+                slot = free.pop()
+                state["requests"] += 1
+                state["active"] += 1
+                state["max_active"] = max(state["max_active"], state["active"])
+            try:
+                self._generate(body, slot)
+            finally:
+                with lock:
+                    state["active"] -= 1
+                    free.append(slot)
+                available.release()
+
+        def _generate(self, body, slot):
+            start = time.perf_counter()
+            load = 0.0
+            with lock:
+                options = {
+                    name: value
+                    for name, value in (body.get("options") or {}).items()
+                    if name in RUNNER_OPTIONS and value is not None
+                }
+                reload = state["options"] != options or time.time() > state["expires"]
+                if reload:
+                    state["options"] = options
+                    state["loads"] += 1
+                    for cached in slots:
+                        cached.clear()
+            if reload:
+                time.sleep(load_latency)
+                load = load_latency
+            with lock:
+                state["expires"] = time.time() + _seconds(body.get("keep_alive", "5m"))
+            words = body.get("prompt", "").split()
+            shared = 0
+            for cached, word in zip(slots[slot], words):
+                if cached != word:
+                    break
+                shared += 1
+            slots[slot][:] = words
+            evaluated = len(words) - shared
+            time.sleep(evaluated * prompt_token_latency)
+            final = {
+                "model": body["model"],
+                "done": True,
+                "load_duration": int(load * 1e9),
+                "prompt_eval_count": evaluated,
+                "eval_count": response_tokens if words else 0,
+            }
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            if not words or body.get("stream") is False:
+                data = json.dumps({**final, "response": ""}).encode("utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            lines = [
+                {"model": body["model"], "response": f"{token} ", "done": False}
+                for token in fake_text(body["prompt"], response_tokens).split(" ")
+            ]
+            for line in [*lines, final]:
+                if not line["done"]:
+                    time.sleep(token_latency)
+                else:
+                    line["total_duration"] = int((time.perf_counter() - start) * 1e9)
+                data = (json.dumps(line) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args: Any):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def serve_fake_openai(latency=0.05, slow_fraction=0.05, slow_latency=3.0, dimensions=64):
+    """
+    Serves OpenAI's /v1/embeddings and /v1/chat/completions on a local port.
+    Yields the base url (for `openai_api_base`) and a dict of counters. A
+    `slow_fraction` of the requests, picked with a fixed seed, take
+    `slow_latency` instead of `latency`, like the upstream latency tail.
+    """
+    state = {"requests": 0, "slow": 0}
+    lock = threading.Lock()
+    rng = random.Random(0)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                state["requests"] += 1
+                slow = rng.random() < slow_fraction
+                state["slow"] += int(slow)
+            time.sleep(slow_latency if slow else latency)
+            path = self.path.rstrip("/")
+            if path.endswith("/embeddings"):
+                inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                embeddings = FakeEmbeddings(size=dimensions)
+                response = {
+                    "object": "list",
+                    "model": body["model"],
+                    "data": [
+                        {
+                            "object": "embedding",
+                            "index": i,
+                            "embedding": embeddings._vector(json.dumps(item)),
+                        }
+                        for i, item in enumerate(inputs)
+                    ],
+                    "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+                }
+            elif path.endswith("/chat/completions"):
+                prompt = json.dumps(body["messages"])
+                response = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": fake_text(prompt, 40)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 40, "total_tokens": 50},
+                }
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(response).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args: Any):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/v1", state
+    finally:
+        server.shutdown()
+        server.server_close()
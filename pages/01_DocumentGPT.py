@@ -1,15 +1,16 @@
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.embeddings import CacheBackedEmbeddings, OpenAIEmbeddings
 from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-from langchain.storage import LocalFileStore
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
-from langchain.chat_models import ChatOpenAI
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain.memory import ConversationSummaryBufferMemory
-import openai
 import streamlit as st
+from utils.collection import Collection, collection_names, slug
+from utils.context import pack_context
+from utils.chat import ChatCallbackHandler, paint_history, send_message
+from utils.memory import ConversationMemory
+from utils import jobs, resources, tracing
+
+# 넉넉히 검색한 뒤 pack_context로 프롬프트에 들어갈 만큼만 남김
+RETRIEVAL_K = 8
+CONTEXT_TOKEN_BUDGET = 2000
+NEW_COLLECTION = "New collection..."
 
 st.set_page_config(
     page_title="DocumentGPT",
@@ -17,69 +18,60 @@ st.set_page_config(
 )
 
 
-class ChatCallbackHandler(BaseCallbackHandler):
-    message = ""
-
-    def on_llm_start(self, *args, **kwargs):
-        self.message_box = st.empty()
-
-    def on_llm_end(self, *args, **kwargs):
-        save_message(self.message, "ai")
-
-    def on_llm_new_token(self, token, *args, **kwargs):
-        self.message += token
-        self.message_box.markdown(self.message)
+def index_collection(collection, openai_api_key):
+    # 문서마다 백그라운드 작업 하나, 이미 처리된 문서는 끝난 작업을 그대로 재사용
+    from utils.vector_service import VECTOR_SERVICE_URL
 
-@st.cache_data(show_spinner="Embedding file...")
-def embed_file(file, openai_api_key):
-    file_content = file.read()
-    file_path = f"./.cache/files/{file.name}"
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-    cache_dir = LocalFileStore(f"./.cache/embeddings/{file.name}")
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator="\n",
-        chunk_size=600,
-        chunk_overlap=100,
+    documents = list(collection.documents.values())
+    # 벡터 서비스에서는 컬렉션 하나가 namespace 하나, 문서는 digest로 필터링
+    namespace = f"documentgpt/{slug(collection.name)}" if VECTOR_SERVICE_URL else None
+    results = jobs.follow_many(
+        "index_document",
+        [
+            (
+                f"{namespace or 'documentgpt'}/{document['digest']}",
+                {
+                    "file_path": document["file_path"],
+                    "index_path": f"./.cache/indexes/documentgpt/{document['digest']}",
+                    "provider": "openai",
+                    "embedding_params": {"openai_api_key": openai_api_key},
+                    "metadata": {"document": document["name"], "digest": document["digest"]},
+                    "namespace": namespace,
+                    "append": True,
+                },
+            )
+            for document in documents
+        ],
+        label="Embedding files...",
     )
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
-    retriever = vectorstore.as_retriever()
-    return retriever
+    return {
+        document["digest"]: result
+        for document, result in zip(documents, results)
+        if result is not None
+    }
 
 
-def save_message(message, role):
-    st.session_state["messages"].append({"message": message, "role": role})
+@st.cache_resource(show_spinner="Loading index...", max_entries=8)
+def open_retriever(results, openai_api_key):
+    from utils.ingest import load_collection
 
-
-def send_message(message, role, save=True):
-    with st.chat_message(role):
-        st.markdown(message)
-    if save:
-        save_message(message, role)
-
-
-def paint_history():
-    for message in st.session_state["messages"]:
-        send_message(
-            message["message"],
-            message["role"],
-            save=False,
-        )
+    embeddings = resources.embeddings("openai", openai_api_key=openai_api_key)
+    return load_collection(results, embeddings, k=RETRIEVAL_K)
 
 
 def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
+    # 겹치는 청크는 합치고 중복은 제거한 뒤 관련도 순으로 토큰 예산만큼 채움
+    return pack_context(docs, token_budget=CONTEXT_TOKEN_BUDGET)
 
 
 def save_memory(input, output):
     st.session_state["memory"].save_context({"input": input}, {"output": output})
 
-def load_memory(_):
-    return memory_tmp.load_memory_variables({})["history"]
+
+def load_memory(question):
+    return st.session_state["memory"].load_memory_variables({"input": question})[
+        "history"
+    ]
 
 st.title("DocumentGPT")
 
@@ -89,33 +81,49 @@ Welcome!
             
 Use this chatbot to ask questions to an AI about your files!
 
-Upload your files on the sidebar.
+Pick or create a collection and upload your files (or a zip of them) on the sidebar.
 """
 )
 
 with st.sidebar:
     st.markdown("[🔗 Git Repo Link](https://github.com/geunsu-son/fullstack-gpt)")
     openai_api_key = st.text_input("Enter your OpenAI API key", type="password")
-    file = st.file_uploader(
-        "Upload a .txt .pdf or .docx file",
-        type=["pdf", "txt", "docx"],
+    # summary: 백그라운드 요약 / window, retrieval: LLM 호출 없음
+    memory_mode = st.selectbox("Conversation memory", ConversationMemory.modes)
+    choice = st.selectbox("Collection", collection_names() + [NEW_COLLECTION])
+    collection = Collection(
+        st.text_input("Collection name", value="default")
+        if choice == NEW_COLLECTION
+        else choice
+    )
+    files = st.file_uploader(
+        "Upload .txt .pdf or .docx files, or a .zip of them",
+        type=["pdf", "txt", "docx", "zip"],
+        accept_multiple_files=True,
     )
+    # 업로드는 세션마다 한 번만 컬렉션에 추가
+    added_uploads = st.session_state.setdefault("added_uploads", set())
+    for file in files or []:
+        if (collection.name, file.file_id) not in added_uploads:
+            collection.add(file.name, file)
+            added_uploads.add((collection.name, file.file_id))
+            collection.save()
 
 if not openai_api_key:
     st.warning("Please enter your OpenAI API key in the sidebar.")
 else:
-    llm = ChatOpenAI(
-            temperature=0.1,
-            streaming=True,
-            callbacks=[ChatCallbackHandler()],
-            openai_api_key=openai_api_key,
-        )
+    llm = resources.chat_model(
+        "openai",
+        temperature=0.1,
+        streaming=True,
+        openai_api_key=openai_api_key,
+    )
 
-    llm_for_memory = ChatOpenAI(
-            temperature=0.1,
-            streaming=True,
-            openai_api_key=openai_api_key,
-        )
+    llm_for_memory = resources.chat_model(
+        "openai",
+        temperature=0.1,
+        openai_api_key=openai_api_key,
+    )
 
     prompt = ChatPromptTemplate.from_messages(
         [
@@ -132,14 +140,42 @@ else:
         ]
     )
 
-    if file:
-        retriever = embed_file(file, openai_api_key)
+    # 컬렉션이나 메모리 방식이 바뀌면 대화를 새로 시작
+    if st.session_state.get("chat_scope") != (collection.name, memory_mode):
+        st.session_state["chat_scope"] = (collection.name, memory_mode)
+        st.session_state["messages"] = []
+        st.session_state["memory"] = ConversationMemory(
+            mode=memory_mode,
+            llm=llm_for_memory,
+            max_token_limit=500,
+        )
+
+    if len(collection):
+        with tracing.trace("DocumentGPT/ingest", store=st.session_state):
+            results = index_collection(collection, openai_api_key)
+        if not results:
+            st.stop()
+        with st.sidebar:
+            scope = st.multiselect(
+                "Search only in",
+                list(results),
+                format_func=lambda digest: collection.documents[digest]["name"],
+            )
+            # 반복되는 머리말/꼬리말과 중복 청크는 임베딩하지 않음 (utils/ingest_filter.py)
+            saved = sum(
+                (result.get("filter") or {}).get("embeddings_saved", 0)
+                for result in results.values()
+            )
+            if saved:
+                st.caption(f"Skipped about {saved} boilerplate or duplicate chunks.")
+        retriever = open_retriever(
+            [results[digest] for digest in scope or results], openai_api_key
+        )
         send_message("I'm ready! Ask away!", "ai", save=False)
         paint_history()
-        message = st.chat_input("Ask anything about your file...")
+        message = st.chat_input("Ask anything about your files...")
         if message:
             send_message(message, "human")
-            memory_tmp = st.session_state["memory"]
             chain = (
                 {
                     "context": retriever | RunnableLambda(format_docs),
@@ -149,15 +185,18 @@ else:
                 | prompt
                 | llm
             )
-            with st.chat_message("ai"):
-                response = chain.invoke(message)
+            with st.chat_message("ai"), tracing.trace(
+                "DocumentGPT/query", store=st.session_state
+            ) as trace:
+                response = chain.invoke(
+                    message,
+                    config={
+                        "callbacks": [ChatCallbackHandler(), trace.callback_handler()]
+                    },
+                )
                 save_memory(message, response.content)
 
     else:
         st.info("Please upload a document to continue.")
-        st.session_state["messages"] = []
-        st.session_state["memory"] = ConversationSummaryBufferMemory(
-            llm=llm_for_memory,
-            max_token_limit=500,
-            return_messages=True,
-        )
\ No newline at end of file
+
+    tracing.trace_panel("DocumentGPT")
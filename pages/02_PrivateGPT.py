@@ -1,13 +1,15 @@
 from langchain.prompts import ChatPromptTemplate
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.embeddings import CacheBackedEmbeddings, OllamaEmbeddings
 from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-from langchain.storage import LocalFileStore
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
-from langchain.chat_models import ChatOllama
-from langchain.callbacks.base import BaseCallbackHandler
+import hashlib
+import os
 import streamlit as st
+from utils.context import pack_context
+from utils.chat import ChatCallbackHandler, paint_history, send_message
+from utils import jobs, ollama_runtime, resources, tracing
+
+# 넉넉히 검색한 뒤 pack_context로 프롬프트에 들어갈 만큼만 남김
+RETRIEVAL_K = 8
+CONTEXT_TOKEN_BUDGET = 1500
 
 st.set_page_config(
     page_title="PrivateGPT",
@@ -15,75 +17,58 @@ st.set_page_config(
 )
 
 
-class ChatCallbackHandler(BaseCallbackHandler):
-    message = ""
-
-    def on_llm_start(self, *args, **kwargs):
-        self.message_box = st.empty()
-
-    def on_llm_end(self, *args, **kwargs):
-        save_message(self.message, "ai")
-
-    def on_llm_new_token(self, token, *args, **kwargs):
-        self.message += token
-        self.message_box.markdown(self.message)
-
-
-llm = ChatOllama(
+llm = resources.chat_model(
+    "ollama",
     model="mistral:latest",
     temperature=0.1,
     streaming=True,
-    callbacks=[
-        ChatCallbackHandler(),
-    ],
 )
+# 첫 질문 전에 모델을 미리 메모리에 올려 둠
+llm.warm_up()
 
 
-@st.cache_data(show_spinner="Embedding file...")
 def embed_file(file):
-    file_content = file.read()
-    file_path = f"./.cache/private_files/{file.name}"
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-    cache_dir = LocalFileStore(f"./.cache/private_embeddings/{file.name}")
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator="\n",
-        chunk_size=600,
-        chunk_overlap=100,
+    # 파싱과 임베딩은 백그라운드 워커가 처리하고 여기서는 진행 상황만 표시
+    from utils.vector_service import VECTOR_SERVICE_URL
+
+    file_content = file.getvalue()
+    digest = hashlib.sha1(file_content).hexdigest()[:16]
+    file_path = f"./.cache/private_files/{digest}_{file.name}"
+    if not os.path.exists(file_path):
+        with open(file_path, "wb") as f:
+            f.write(file_content)
+    result = jobs.follow(
+        "index_document",
+        {
+            "file_path": file_path,
+            "index_path": f"./.cache/indexes/privategpt/{digest}",
+            "provider": "ollama",
+            "embedding_params": {"model": "mistral:latest"},
+            # 같은 파일은 모든 레플리카가 하나의 인덱스를 공유
+            "namespace": f"privategpt/{digest}" if VECTOR_SERVICE_URL else None,
+        },
+        key=f"privategpt/{digest}",
+        label="Embedding file...",
     )
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
-    embeddings = OllamaEmbeddings(model="mistral:latest")
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
-    retriever = vectorstore.as_retriever()
-    return retriever
+    if result is None:
+        return None
+    return open_retriever(result)
 
 
-def save_message(message, role):
-    st.session_state["messages"].append({"message": message, "role": role})
+@st.cache_resource(show_spinner=False)
+def open_retriever(result):
+    from utils.ingest import load_retriever
 
-
-def send_message(message, role, save=True):
-    with st.chat_message(role):
-        st.markdown(message)
-    if save:
-        save_message(message, role)
-
-
-def paint_history():
-    for message in st.session_state["messages"]:
-        send_message(
-            message["message"],
-            message["role"],
-            save=False,
-        )
+    embeddings = resources.embeddings("ollama", model="mistral:latest")
+    return load_retriever(result, embeddings, k=RETRIEVAL_K)
 
 
 def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
+    # 겹치는 청크는 합치고 중복은 제거한 뒤 관련도 순으로 토큰 예산만큼 채움
+    return pack_context(docs, token_budget=CONTEXT_TOKEN_BUDGET)
 
 # 채팅 모델이 아니기 떄문에 String 형태로 프롬프트 수정
+# 지시문과 context를 앞에, 질문을 맨 뒤에 두어 Ollama가 같은 앞부분의 KV 캐시를 재사용
 prompt = ChatPromptTemplate.from_template(
     """Answer the question using ONLY the following context and not your training data. If you don't know the answer just say you don't know. DON'T make anything up.
     
@@ -112,7 +97,10 @@ with st.sidebar:
     )
 
 if file:
-    retriever = embed_file(file)
+    with tracing.trace("PrivateGPT/ingest", store=st.session_state):
+        retriever = embed_file(file)
+    if retriever is None:
+        st.stop()
     send_message("I'm ready! Ask away!", "ai", save=False)
     paint_history()
     message = st.chat_input("Ask anything about your file...")
@@ -126,9 +114,17 @@ if file:
             | prompt
             | llm
         )
-        with st.chat_message("ai"):
-            chain.invoke(message)
+        with st.chat_message("ai"), tracing.trace(
+            "PrivateGPT/query", store=st.session_state
+        ) as trace:
+            chain.invoke(
+                message,
+                config={"callbacks": [ChatCallbackHandler(), trace.callback_handler()]},
+            )
 
 
 else:
     st.session_state["messages"] = []
+
+ollama_runtime.status_panel(llm.runtime)
+tracing.trace_panel("PrivateGPT")
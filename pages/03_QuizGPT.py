@@ -1,11 +1,9 @@
 import streamlit as st
 import json
 import os
-from langchain.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.retrievers import WikipediaRetriever
+from utils import resources, router, tracing
+from utils.streaming import JsonArrayStream
 
 # Streamlit 설정
 st.set_page_config(page_title="QuizGPT", page_icon="❓")
@@ -13,24 +11,24 @@ st.title("QuizGPT")
 
 @st.cache_data(show_spinner="Loading file...")
 def split_file(file):
+    from utils.loaders import load_and_split
+
     file_content = file.read()
     file_path = f"./.cache/quiz_files/{file.name}"
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     with open(file_path, "wb") as f:
         f.write(file_content)
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator="\n",
-        chunk_size=600,
-        chunk_overlap=100,
-    )
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
+    splitter = resources.token_splitter(chunk_size=600, chunk_overlap=100)
+    docs = load_and_split(file_path, splitter)
     return docs
 
 @st.cache_data(show_spinner="Searching Wikipedia...")
 def wiki_search(term):
+    from langchain.retrievers import WikipediaRetriever
+
     retriever = WikipediaRetriever(top_k_results=5)
-    docs = retriever.get_relevant_documents(term)
+    with tracing.span("wikipedia", kind="external", term=term):
+        docs = retriever.get_relevant_documents(term)
     return docs
 
 # 사이드바 설정
@@ -44,11 +42,13 @@ with st.sidebar:
     if choice == "파일 업로드":
         file = st.file_uploader("파일을 업로드하세요 (.txt, .pdf, .docx)", type=["pdf", "txt", "docx"])
         if file:
-            docs = split_file(file)
+            with tracing.trace("QuizGPT/load", store=st.session_state):
+                docs = split_file(file)
     else:
         topic = st.text_input("Wikipedia에서 검색할 주제 입력")
         if topic:
-            docs = wiki_search(topic)
+            with tracing.trace("QuizGPT/load", store=st.session_state):
+                docs = wiki_search(topic)
 
 if not openai_api_key:
     st.warning("Please enter your OpenAI API key in the sidebar")
@@ -103,19 +103,42 @@ quiz_function = {
 }
 
 # LLM 설정
-llm = ChatOpenAI(api_key=openai_api_key, temperature=0.1).bind(
-    function_call={"name": "create_quiz"}, functions=[quiz_function]
-)
-
-quiz_chain = quiz_prompt | llm
+models = resources.router("openai", api_key=openai_api_key, temperature=0.1)
+quiz_call = {"function_call": {"name": "create_quiz"}, "functions": [quiz_function]}
 
 cache_dir = './.cache/quiz_files'
 os.makedirs(cache_dir, exist_ok=True)
 
+def render_preview(box, idx, question):
+    box.markdown(
+        f"**{idx}. {question['question']}**\n"
+        + "\n".join(f"- {answer['answer']}" for answer in question["answers"])
+    )
+
+
 if "response_to_json" not in st.session_state:
     context = "\n".join([doc.page_content for doc in docs])
-    response = quiz_chain.invoke({"difficulty": difficulty, "context": context})
-    st.session_state.response_to_json = json.loads(response.additional_kwargs["function_call"]["arguments"])
+    # function call 인자를 스트리밍 받으면서 완성된 문제부터 바로 보여줌
+    stream = JsonArrayStream()
+    preview = st.empty()
+    box = preview.container()
+    questions = 0
+    with tracing.trace("QuizGPT/generate", store=st.session_state) as trace:
+        # 같은 주제로 다시 만들면 llm 캐시에서 바로 가져옴
+        for chunk in models.stream(
+            "quizgpt/generate",
+            quiz_prompt.format_prompt(difficulty=difficulty, context=context).to_messages(),
+            config={"callbacks": [trace.callback_handler()]},
+            **quiz_call,
+        ):
+            function_call = chunk.additional_kwargs.get("function_call", {})
+            for question in stream.feed(function_call.get("arguments", "")):
+                questions += 1
+                if questions == 1:
+                    tracing.add_event("first_question")
+                render_preview(box, questions, question)
+    preview.empty()
+    st.session_state.response_to_json = stream.result()
 
 cache_file_path = os.path.join(cache_dir, "latest_quiz.json")
 with open(cache_file_path, "w") as cache_file:
@@ -142,3 +165,6 @@ with st.form("quiz_form"):
             st.success("축하합니다! 만점입니다!")
         else:
             st.error(f"{correct_answers}/{len(st.session_state.response_to_json['questions'])} 맞췄습니다. 다시 시도해보세요!")
+
+tracing.trace_panel("QuizGPT")
+router.stats_panel("QuizGPT")
@@ -1,17 +1,22 @@
-from langchain.document_loaders import SitemapLoader
 from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
+from langchain.schema import Document
 import streamlit as st
 import requests
 import xml.etree.ElementTree as ET
-from urllib.parse import urlparse
-from langchain.document_loaders import WebBaseLoader
 import os
 from datetime import datetime
+from utils import partitions, resources, router, tracing
+from utils.chat import ChatCallbackHandler
+from utils.ingest_filter import IngestFilter
+from utils.vector_service import VECTOR_SERVICE_URL, VectorServiceClient
+
+SERVICE_NAMESPACE = "sitegpt/cloudflare"
+# flat: 기존 FAISS + index.pkl / sq8, ivf_sq8, ivf_pq, hnsw, hnsw_sq8: utils.index_formats
+INDEX_FORMAT = os.environ.get("VECTOR_INDEX_FORMAT", "flat")
+VECTOR_STORE_DIR = "./.cache/vector_store"
+# 제품마다 별도 인덱스 (utils/partitions.py)
+INDEX_BACKEND = "service" if VECTOR_SERVICE_URL else INDEX_FORMAT
 
 st.set_page_config(
     page_title="SiteGPT",
@@ -32,19 +37,32 @@ with st.sidebar:
     st.markdown("[🔗 Git Repo Link](https://github.com/geunsu-son/fullstack-gpt)")
     openai_api_key = st.text_input("Enter your OpenAI API key", type="password")
     if st.button("벡터 저장소 새로고침"):
-        if os.path.exists("./.cache/vector_store"):
+        if os.path.exists(VECTOR_STORE_DIR):
             import shutil
-            shutil.rmtree("./.cache/vector_store")
-        st.cache_data.clear()
+            shutil.rmtree(VECTOR_STORE_DIR)
+        if VECTOR_SERVICE_URL:
+            for product in partitions.PRODUCTS:
+                VectorServiceClient().delete(f"{SERVICE_NAMESPACE}/{product}")
+        # 불러온 retriever는 아래에서 load_cloudflare_docs를 부르기 전에 비움
+        st.session_state["reload_cloudflare_docs"] = True
         st.success("벡터 저장소가 삭제되었습니다. 페이지를 새로고침하면 문서를 다시 로드합니다.")
 
 if not openai_api_key:
     st.warning("Please enter your OpenAI API key in the sidebar")
     st.stop()
 
-# Initialize LLM with the API key from sidebar
-llm = ChatOpenAI(
+# 문서별 답변은 빠른 모델, 최종 답변은 강한 모델 (utils/router.py의 ROUTES)
+models = resources.router(
+    "openai",
+    temperature=0.1,
+    api_key=openai_api_key,
+)
+
+# 최종 답변은 토큰 단위로 스트리밍
+streaming_models = resources.router(
+    "openai",
     temperature=0.1,
+    streaming=True,
     api_key=openai_api_key,
 )
 
@@ -65,23 +83,26 @@ answers_prompt = ChatPromptTemplate.from_template(
 )
 
 
-def get_answers(inputs):
+def get_answers(inputs, config):
     docs = inputs["docs"]
     question = inputs["question"]
-    answers_chain = answers_prompt | llm
+    answers_chain = answers_prompt | models.runnable("sitegpt/answer")
+    # 문서별 답변은 서로 독립적이라 동시에 요청
+    answers = answers_chain.batch(
+        [{"question": question, "context": doc.page_content} for doc in docs],
+        config=config,
+    )
     return {
         "question": question,
         "answers": [
             {
-                "answer": answers_chain.invoke(
-                    {"question": question, "context": doc.page_content}
-                ).content,
+                "answer": answer.content,
                 "source": doc.metadata.get("source", "Unknown"),
                 # lastmod가 없을 경우 현재 날짜 사용
                 "date": doc.metadata.get("lastmod", datetime.now().strftime("%Y-%m-%d")),
                 "product": doc.metadata.get("product", "Unknown")
             }
-            for doc in docs
+            for doc, answer in zip(docs, answers)
         ],
     }
 
@@ -113,10 +134,10 @@ choose_prompt = ChatPromptTemplate.from_messages(
 )
 
 
-def choose_answer(inputs):
+def choose_answer(inputs, config):
     answers = inputs["answers"]
     question = inputs["question"]
-    choose_chain = choose_prompt | llm
+    choose_chain = choose_prompt | streaming_models.runnable("sitegpt/choose")
     
     # Sort answers by score and date
     condensed = "\n\n".join(
@@ -128,41 +149,106 @@ def choose_answer(inputs):
         {
             "question": question,
             "answers": condensed,
-        }
+        },
+        config=config,
     )
 
 
 def parse_page(soup):
-    header = soup.find("header")
-    footer = soup.find("footer")
-    if header:
-        header.decompose()
-    if footer:
-        footer.decompose()
-    return (
-        str(soup.get_text())
-        .replace("\n", " ")
-        .replace("\xa0", " ")
-        .replace("CloseSearch Submit Blog", "")
+    # 머리말, 꼬리말, 메뉴는 태그로 지우고 페이지마다 반복되는 나머지 줄은 IngestFilter가 지움
+    for tag in soup.find_all(["header", "footer", "nav", "aside", "script", "style"]):
+        tag.decompose()
+    lines = (
+        " ".join(line.replace("\xa0", " ").split()) for line in soup.get_text("\n").split("\n")
+    )
+    return "\n".join(line for line in lines if line).replace("CloseSearch Submit Blog", "")
+
+
+def partition_path(product):
+    if INDEX_BACKEND == "flat":
+        return os.path.join(VECTOR_STORE_DIR, f"cloudflare_docs_store_{product}")
+    return os.path.join(VECTOR_STORE_DIR, f"cloudflare_docs_{INDEX_FORMAT}_{product}")
+
+
+def partition_exists(product):
+    if INDEX_BACKEND == "service":
+        return VectorServiceClient().exists(f"{SERVICE_NAMESPACE}/{product}")
+    if INDEX_BACKEND == "flat":
+        return os.path.exists(partition_path(product))
+    from utils import index_formats
+
+    return index_formats.index_exists(partition_path(product))
+
+
+def open_partition(product, embeddings):
+    if INDEX_BACKEND == "service":
+        return partitions.ServicePartition(
+            VectorServiceClient(), f"{SERVICE_NAMESPACE}/{product}"
+        )
+    if INDEX_BACKEND == "flat":
+        from langchain.vectorstores.faiss import FAISS
+
+        return partitions.FAISSPartition(FAISS.load_local(partition_path(product), embeddings))
+    from utils import index_formats
+
+    return partitions.DiskPartition(index_formats.DiskIndex(partition_path(product)))
+
+
+def build_partition(product, docs, vectors, embeddings):
+    # 중심 벡터 계산에도 쓰므로 임베딩은 한 번만 하고 인덱스에 그대로 넣음
+    texts = [doc.page_content for doc in docs]
+    metadatas = [doc.metadata for doc in docs]
+    if INDEX_BACKEND == "service":
+        client = VectorServiceClient()
+        client.add(f"{SERVICE_NAMESPACE}/{product}", texts, metadatas, vectors)
+        return partitions.ServicePartition(client, f"{SERVICE_NAMESPACE}/{product}")
+    if INDEX_BACKEND == "flat":
+        from langchain.vectorstores.faiss import FAISS
+
+        vector_store = FAISS.from_embeddings(
+            list(zip(texts, vectors)), embeddings, metadatas=metadatas
+        )
+        vector_store.save_local(partition_path(product))
+        return partitions.FAISSPartition(vector_store)
+    from utils import index_formats
+
+    index = index_formats.build_index(vectors, INDEX_FORMAT)
+    index_formats.save_index(partition_path(product), index, texts, metadatas, INDEX_FORMAT)
+    return partitions.DiskPartition(index_formats.DiskIndex(partition_path(product)))
+
+
+def partitioned_retriever(manifest, stores, embeddings):
+    classifier = partitions.QueryClassifier(
+        {product: entry["centroid"] for product, entry in manifest.items()}
+    )
+    return partitions.PartitionedRetriever(
+        partitions=stores, classifier=classifier, embeddings=embeddings, k=4
     )
 
-@st.cache_data(show_spinner="Loading Cloudflare documentation...")
-def load_cloudflare_docs():
+
+# retriever는 임베딩 클라이언트를 들고 있어 pickle 대신 객체 그대로 캐시
+@st.cache_resource(show_spinner="Loading Cloudflare documentation...")
+def load_cloudflare_docs(openai_api_key):
+    # bs4 기반 로더는 문서를 불러올 때만 import
+    from langchain.document_loaders import WebBaseLoader
+
+    embeddings = resources.embeddings("openai", openai_api_key=openai_api_key)
     try:
-        # 저장된 벡터 저장소 확인
-        vector_store_dir = "./.cache/vector_store"
-        os.makedirs(vector_store_dir, exist_ok=True)
-        vector_store_path = os.path.join(vector_store_dir, "cloudflare_docs_store")
-        
-        if os.path.exists(vector_store_path):
+        # 저장된 파티션 확인 (공유 검색 서비스에 있으면 크롤링 없이 사용)
+        manifest_path = os.path.join(
+            VECTOR_STORE_DIR, f"cloudflare_partitions_{INDEX_BACKEND}.json"
+        )
+        manifest = partitions.load_manifest(manifest_path)
+        if manifest and all(partition_exists(product) for product in manifest):
             st.write("저장된 벡터 저장소를 불러오는 중...")
-            vector_store = FAISS.load_local(vector_store_path, OpenAIEmbeddings(openai_api_key=openai_api_key))
-            return vector_store.as_retriever(search_kwargs={"k": 4})
+            stores = {product: open_partition(product, embeddings) for product in manifest}
+            return partitioned_retriever(manifest, stores, embeddings)
         
         # 1. sitemap에서 URL 목록 가져오기
         sitemap_url = 'https://developers.cloudflare.com/sitemap-0.xml'
         
-        response = requests.get(sitemap_url)
+        with tracing.span("sitemap", kind="external"):
+            response = requests.get(sitemap_url)
         root = ET.fromstring(response.content)
         namespaces = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
         
@@ -173,16 +259,18 @@ def load_cloudflare_docs():
             lastmod_date = lastmod.text if lastmod is not None else datetime.now().strftime("%Y-%m-%d")
             urls_with_dates.append((url.text, lastmod_date))
         
-        # 2. URL 필터링
-        filter_patterns = ["ai-gateway", "vectorize", "workers-ai"]
-        filtered_urls = [(url, date) for url, date in urls_with_dates 
-                        if any(pattern in url for pattern in filter_patterns)]
+        # 2. URL 필터링 (제품은 utils/partitions.py의 PRODUCTS)
+        filtered_urls = [
+            (url, date, partitions.product_for_url(url))
+            for url, date in urls_with_dates
+            if partitions.product_for_url(url)
+        ]
         
         # 3. 필터링된 URL에서 문서 수집
-        all_docs = []
+        docs_by_product = {}
         status_container = st.empty()
         
-        for idx, (url, lastmod_date) in enumerate(filtered_urls):
+        for idx, (url, lastmod_date, product) in enumerate(filtered_urls):
             status_container.text(f"문서 로딩 중... ({idx + 1}/{len(filtered_urls)})")
             try:
                 loader = WebBaseLoader(
@@ -190,47 +278,69 @@ def load_cloudflare_docs():
                     default_parser="lxml",
                     bs_kwargs={"parser": "lxml", "features": "lxml"}
                 )
-                docs = loader.load()
+                with tracing.span("load_page", kind="external", url=url):
+                    soup = loader.scrape()
                 
                 # 메타데이터 추가
-                for doc in docs:
-                    doc.metadata["lastmod"] = lastmod_date
-                    if "ai-gateway" in url:
-                        doc.metadata["product"] = "AI Gateway"
-                    elif "vectorize" in url:
-                        doc.metadata["product"] = "Cloudflare Vectorize"
-                    elif "workers-ai" in url:
-                        doc.metadata["product"] = "Workers AI"
-                all_docs.extend(docs)
+                doc = Document(
+                    page_content=parse_page(soup),
+                    metadata={
+                        "source": url,
+                        "title": soup.title.get_text() if soup.title else "",
+                        "lastmod": lastmod_date,
+                        "product": partitions.PRODUCTS[product]["name"],
+                    },
+                )
+                docs_by_product.setdefault(product, []).append(doc)
             except Exception as e:
                 continue
         
         status_container.empty()
         
-        if not all_docs:
+        if not docs_by_product:
             st.error("문서를 불러오는데 실패했습니다.")
             return None
         
-        # 4. 문서 분할
-        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        # 4. 모든 페이지에 반복되는 블록을 지운 뒤 제품별로 분할, 중복 제거, 임베딩, 인덱스 생성
+        ingest_filter = IngestFilter(sample_pages=None)
+        with tracing.span("strip_boilerplate"):
+            list(ingest_filter.strip(doc for docs in docs_by_product.values() for doc in docs))
+        splitter = resources.recursive_splitter(
             chunk_size=1000,
             chunk_overlap=200,
         )
-        split_docs = splitter.split_documents(all_docs)
-        
-        # 5. 벡터 저장소 생성 및 저장
-        embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-        vector_store = FAISS.from_documents(split_docs, embeddings)
-        vector_store.save_local(vector_store_path)
+        manifest = {}
+        stores = {}
+        for product, product_docs in docs_by_product.items():
+            with tracing.span("split", product=product, documents=len(product_docs)):
+                split_docs = ingest_filter.dedupe(splitter.split_documents(product_docs))
+            with tracing.span(
+                "embed_and_index", kind="external", product=product, chunks=len(split_docs)
+            ):
+                vectors = embeddings.embed_documents([doc.page_content for doc in split_docs])
+                stores[product] = build_partition(product, split_docs, vectors, embeddings)
+            manifest[product] = {
+                "chunks": len(split_docs),
+                "centroid": partitions.centroid(vectors).tolist(),
+            }
+        partitions.save_manifest(manifest_path, manifest)
+        report = ingest_filter.report()
+        st.caption(
+            f"반복 블록 {report['boilerplate_lines']}줄, 중복 청크 {report['duplicates']}개를 제거해 "
+            f"임베딩 약 {report['embeddings_saved']}개를 줄였습니다."
+        )
         
-        return vector_store.as_retriever(search_kwargs={"k": 4})
+        return partitioned_retriever(manifest, stores, embeddings)
         
     except Exception as e:
         st.error(f"처리 중 오류가 발생했습니다: {str(e)}")
         return None
 
 # Main interface
-retriever = load_cloudflare_docs()
+if st.session_state.pop("reload_cloudflare_docs", False):
+    load_cloudflare_docs.clear()
+with tracing.trace("SiteGPT/load", store=st.session_state):
+    retriever = load_cloudflare_docs(openai_api_key)
 
 if retriever is None:
     st.stop()
@@ -267,14 +377,25 @@ query = st.text_input(
 )
 
 if query:
-    with st.spinner("문서를 검색하고 답변을 생성하고 있습니다..."):
-        chain = (
-            {
-                "docs": retriever,
-                "question": RunnablePassthrough(),
-            }
-            | RunnableLambda(get_answers)
-            | RunnableLambda(choose_answer)
+    answers_chain = {
+        "docs": retriever,
+        "question": RunnablePassthrough(),
+    } | RunnableLambda(get_answers)
+    with tracing.trace("SiteGPT/query", store=st.session_state) as trace:
+        with st.spinner("문서를 검색하고 답변을 생성하고 있습니다..."):
+            answers = answers_chain.invoke(
+                query, config={"callbacks": [trace.callback_handler()]}
+            )
+        # 최종 답변은 생성되는 대로 화면에 표시
+        RunnableLambda(choose_answer).invoke(
+            answers,
+            config={
+                "callbacks": [
+                    ChatCallbackHandler(save=False, escape_dollars=True),
+                    trace.callback_handler(),
+                ]
+            },
         )
-        result = chain.invoke(query)
-        st.markdown(result.content.replace("$", "\\$"))
+
+tracing.trace_panel("SiteGPT")
+router.stats_panel("SiteGPT")
@@ -1,93 +1,49 @@
-from langchain.storage import LocalFileStore
 import streamlit as st
-import subprocess
-import math
-from pydub import AudioSegment
-import glob
-import openai
+import hashlib
 import os
-from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import StrOutputParser
-from langchain.vectorstores.faiss import FAISS
-from langchain.embeddings import CacheBackedEmbeddings, OpenAIEmbeddings
+from utils import jobs, resources, router, tracing
 
-llm = ChatOpenAI(
-    temperature=0.1,
-)
-
-has_transcript = os.path.exists("./.cache/podcast.txt")
-
-splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-    chunk_size=800,
-    chunk_overlap=100,
-)
 
+@st.cache_resource(show_spinner="Embedding transcript...")
+def embed_file(file_path, openai_api_key):
+    from langchain.vectorstores.faiss import FAISS
+    from utils.vector_service import (
+        VECTOR_SERVICE_URL,
+        namespace_name,
+        service_retriever,
+    )
 
-@st.cache_data()
-def embed_file(file_path):
-    cache_dir = LocalFileStore(f"./.cache/embeddings/{file.name}")
-    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+    splitter = resources.recursive_splitter(
         chunk_size=800,
         chunk_overlap=100,
     )
     loader = TextLoader(file_path)
+    cached_embeddings = resources.cached_embeddings("openai", **api_key_params(openai_api_key))
+    if VECTOR_SERVICE_URL:
+        namespace = namespace_name("meetinggpt", os.path.basename(file_path))
+        return service_retriever(
+            namespace,
+            lambda: loader.load_and_split(text_splitter=splitter),
+            cached_embeddings,
+        )
     docs = loader.load_and_split(text_splitter=splitter)
-    embeddings = OpenAIEmbeddings()
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(embeddings, cache_dir)
     vectorstore = FAISS.from_documents(docs, cached_embeddings)
     retriever = vectorstore.as_retriever()
     return retriever
 
 
-@st.cache_data()
-def transcribe_chunks(chunk_folder, destination):
-    if has_transcript:
-        return
-    files = glob.glob(f"{chunk_folder}/*.mp3")
-    files.sort()
-    for file in files:
-        with open(file, "rb") as audio_file, open(destination, "a") as text_file:
-            transcript = openai.Audio.transcribe(
-                "whisper-1",
-                audio_file,
-            )
-            text_file.write(transcript["text"])
-
-
-@st.cache_data()
-def extract_audio_from_video(video_path):
-    if has_transcript:
-        return
-    audio_path = video_path.replace("mp4", "mp3")
-    command = [
-        "ffmpeg",
-        "-y",
-        "-i",
-        video_path,
-        "-vn",
-        audio_path,
-    ]
-    subprocess.run(command)
-
-
-@st.cache_data()
-def cut_audio_in_chunks(audio_path, chunk_size, chunks_folder):
-    if has_transcript:
-        return
-    track = AudioSegment.from_mp3(audio_path)
-    chunk_len = chunk_size * 60 * 1000
-    chunks = math.ceil(len(track) / chunk_len)
-    for i in range(chunks):
-        start_time = i * chunk_len
-        end_time = (i + 1) * chunk_len
-        chunk = track[start_time:end_time]
-        chunk.export(
-            f"./{chunks_folder}/chunk_{i}.mp3",
-            format="mp3",
-        )
+def api_key_params(openai_api_key):
+    # 키를 입력하지 않으면 OPENAI_API_KEY 환경 변수를 씀
+    return {"openai_api_key": openai_api_key} if openai_api_key else {}
+
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
 
 
 st.set_page_config(
@@ -95,6 +51,11 @@ st.set_page_config(
     page_icon="💼",
 )
 
+splitter = resources.recursive_splitter(
+    chunk_size=800,
+    chunk_overlap=100,
+)
+
 st.markdown(
     """
 # MeetingGPT
@@ -106,26 +67,40 @@ Get started by uploading a video file in the sidebar.
 )
 
 with st.sidebar:
+    openai_api_key = st.text_input("Enter your OpenAI API key", type="password")
     video = st.file_uploader(
         "Video",
         type=["mp4", "avi", "mkv", "mov"],
     )
 
+# 첫 구간 요약은 빠른 모델, 요약을 다듬는 refine 단계는 강한 모델 (utils/router.py의 ROUTES)
+models = resources.router("openai", temperature=0.1, **api_key_params(openai_api_key))
+
 if video:
-    chunks_folder = "./.cache/chunks"
-    with st.status("Loading video...") as status:
-        video_content = video.read()
-        video_path = f"./.cache/{video.name}"
-        audio_path = video_path.replace("mp4", "mp3")
-        transcript_path = video_path.replace("mp4", "txt")
-        with open(video_path, "wb") as f:
-            f.write(video_content)
-        status.update(label="Extracting audio...")
-        extract_audio_from_video(video_path)
-        status.update(label="Cutting audio segments...")
-        cut_audio_in_chunks(audio_path, 10, chunks_folder)
-        status.update(label="Transcribing audio...")
-        transcribe_chunks(chunks_folder, transcript_path)
+    with tracing.trace("MeetingGPT/ingest", store=st.session_state):
+        # 오디오 추출, 분할, 전사는 백그라운드 워커가 처리
+        video_content = video.getvalue()
+        digest = hashlib.sha1(video_content).hexdigest()[:16]
+        video_path = f"./.cache/{digest}_{video.name}"
+        if not os.path.exists(video_path):
+            with open(video_path, "wb") as f:
+                f.write(video_content)
+        result = jobs.follow(
+            "transcribe_video",
+            {
+                "video_path": video_path,
+                "chunks_folder": f"./.cache/chunks/{digest}",
+                "transcript_path": os.path.splitext(video_path)[0] + ".txt",
+                "chunk_minutes": 10,
+                # Whisper API 백엔드가 쓰는 키, 작업이 끝나면 payload와 함께 지워짐
+                "transcribe_params": {"api_key": openai_api_key or None},
+            },
+            key=f"meetinggpt/{digest}",
+            label="Loading video...",
+        )
+    if result is None:
+        st.stop()
+    transcript_path = result["transcript_path"]
 
     transcript_tab, summary_tab, qa_tab = st.tabs(
         [
@@ -136,60 +111,95 @@ if video:
     )
 
     with transcript_tab:
+        stats = result.get("transcription")
+        if stats and stats["real_time_factor"] is not None:
+            st.caption(
+                f"Transcribed {stats['audio_seconds'] / 60:.1f} min of audio with the"
+                f" {stats['backend']} backend in {stats['transcribe_seconds']:.0f}s"
+                f" (real-time factor {stats['real_time_factor']:.2f})"
+            )
+        vad_stats = result.get("vad")
+        if vad_stats and vad_stats["removed_fraction"] > 0:
+            silence = vad_stats["original_seconds"] - vad_stats["speech_seconds"]
+            st.caption(
+                f"Skipped {silence / 60:.1f} min of silence"
+                f" ({vad_stats['removed_fraction']:.0%} of the audio) before transcribing"
+            )
         with open(transcript_path, "r") as file:
-            st.write(file.read())
+            transcript = file.read()
+        # 청크마다 원본 영상에서의 시작 시각을 붙임 (잘라낸 침묵도 반영된 위치)
+        starts = result.get("chunk_starts")
+        chars = result.get("chunk_chars")
+        if starts and chars:
+            for start, begin, end in zip(starts, chars, chars[1:] + [len(transcript)]):
+                st.caption(format_timestamp(start))
+                st.write(transcript[begin:end])
+        else:
+            st.write(transcript)
 
     with summary_tab:
         start = st.button("Generate summary")
         if start:
-            loader = TextLoader(transcript_path)
-
-            docs = loader.load_and_split(text_splitter=splitter)
-
-            first_summary_prompt = ChatPromptTemplate.from_template(
-                """
-                Write a concise summary of the following:
-                "{text}"
-                CONCISE SUMMARY:                
-            """
-            )
+            with tracing.trace("MeetingGPT/summary", store=st.session_state) as trace:
+                loader = TextLoader(transcript_path)
 
-            first_summary_chain = first_summary_prompt | llm | StrOutputParser()
+                docs = loader.load_and_split(text_splitter=splitter)
 
-            summary = first_summary_chain.invoke(
-                {"text": docs[0].page_content},
-            )
-
-            refine_prompt = ChatPromptTemplate.from_template(
+                first_summary_prompt = ChatPromptTemplate.from_template(
+                    """
+                    Write a concise summary of the following:
+                    "{text}"
+                    CONCISE SUMMARY:                
                 """
-                Your job is to produce a final summary.
-                We have provided an existing summary up to a certain point: {existing_summary}
-                We have the opportunity to refine the existing summary (only if needed) with some more context below.
-                ------------
-                {context}
-                ------------
-                Given the new context, refine the original summary.
-                If the context isn't useful, RETURN the original summary.
-                """
-            )
-
-            refine_chain = refine_prompt | llm | StrOutputParser()
-
-            with st.status("Summarizing...") as status:
-                for i, doc in enumerate(docs[1:]):
-                    status.update(label=f"Processing document {i+1}/{len(docs)-1} ")
-                    summary = refine_chain.invoke(
-                        {
-                            "existing_summary": summary,
-                            "context": doc.page_content,
-                        }
-                    )
-                    st.write(summary)
-            st.write(summary)
+                )
+
+                first_summary_chain = (
+                    first_summary_prompt | models.runnable("meetinggpt/summarize") | StrOutputParser()
+                )
+
+                summary = first_summary_chain.invoke(
+                    {"text": docs[0].page_content},
+                    config={"callbacks": [trace.callback_handler()]},
+                )
+
+                refine_prompt = ChatPromptTemplate.from_template(
+                    """
+                    Your job is to produce a final summary.
+                    We have provided an existing summary up to a certain point: {existing_summary}
+                    We have the opportunity to refine the existing summary (only if needed) with some more context below.
+                    ------------
+                    {context}
+                    ------------
+                    Given the new context, refine the original summary.
+                    If the context isn't useful, RETURN the original summary.
+                    """
+                )
+
+                refine_chain = refine_prompt | models.runnable("meetinggpt/refine") | StrOutputParser()
+
+                with st.status("Summarizing...") as status:
+                    for i, doc in enumerate(docs[1:]):
+                        status.update(label=f"Processing document {i+1}/{len(docs)-1} ")
+                        summary = refine_chain.invoke(
+                            {
+                                "existing_summary": summary,
+                                "context": doc.page_content,
+                            },
+                            config={"callbacks": [trace.callback_handler()]},
+                        )
+                        st.write(summary)
+                st.write(summary)
 
     with qa_tab:
-        retriever = embed_file(transcript_path)
+        with tracing.trace("MeetingGPT/qa", store=st.session_state) as trace:
+            retriever = embed_file(transcript_path, openai_api_key)
 
-        docs = retriever.invoke("do they talk about marcus aurelius?")
+            docs = retriever.invoke(
+                "do they talk about marcus aurelius?",
+                config={"callbacks": [trace.callback_handler()]},
+            )
 
         st.write(docs)
+
+tracing.trace_panel("MeetingGPT")
+router.stats_panel("MeetingGPT")
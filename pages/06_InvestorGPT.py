@@ -1,118 +1,74 @@
 from langchain.schema import SystemMessage
+import asyncio
+import threading
 import streamlit as st
-import os
-import requests
-from typing import Type
-from langchain.chat_models import ChatOpenAI
-from langchain.tools import BaseTool
-from pydantic import BaseModel, Field
-from langchain.agents import initialize_agent, AgentType
-from langchain.utilities import DuckDuckGoSearchAPIWrapper
-
-llm = ChatOpenAI(temperature=0.1, model_name="gpt-3.5-turbo-1106")
-
-alpha_vantage_api_key = os.environ.get("ALPHA_VANTAGE_API_KEY")
-
-
-class StockMarketSymbolSearchToolArgsSchema(BaseModel):
-    query: str = Field(
-        description="The query you will search for.Example query: Stock Market Symbol for Apple Company"
+from utils import resources, tracing
+
+# parallel: 한 단계에서 여러 도구를 호출하고 비동기로 동시에 실행
+AGENT_MODES = ["parallel", "sequential"]
+
+
+@st.cache_resource(show_spinner=False)
+def get_event_loop():
+    # 캐시된 에이전트의 비동기 클라이언트(httpx 연결 풀)는 처음 쓴 이벤트 루프에 묶이므로
+    # 실행마다 asyncio.run으로 새 루프를 만들지 않고 백그라운드 스레드의 루프 하나를 계속 씀
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="investorgpt-loop", daemon=True).start()
+    return loop
+
+
+def run_in_loop(coroutine):
+    # run_coroutine_threadsafe는 호출한 쪽의 contextvars(trace)를 복사해 task를 만듦
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+@st.cache_resource(show_spinner=False)
+def get_agent(mode="parallel"):
+    from langchain.agents import initialize_agent, AgentType
+    from utils.investor_tools import (
+        CompanyIncomeStatementTool,
+        CompanyOverviewTool,
+        CompanyStockPerformanceTool,
+        StockMarketSymbolSearchTool,
     )
 
-
-class StockMarketSymbolSearchTool(BaseTool):
-    name = "StockMarketSymbolSearchTool"
-    description = """
-    Use this tool to find the stock market symbol for a company.
-    It takes a query as an argument.
-    
-    """
-    args_schema: Type[
-        StockMarketSymbolSearchToolArgsSchema
-    ] = StockMarketSymbolSearchToolArgsSchema
-
-    def _run(self, query):
-        ddg = DuckDuckGoSearchAPIWrapper()
-        return ddg.run(query)
-
-
-class CompanyOverviewArgsSchema(BaseModel):
-    symbol: str = Field(
-        description="Stock symbol of the company.Example: AAPL,TSLA",
-    )
-
-
-class CompanyOverviewTool(BaseTool):
-    name = "CompanyOverview"
-    description = """
-    Use this to get an overview of the financials of the company.
-    You should enter a stock symbol.
-    """
-    args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
-
-    def _run(self, symbol):
-        r = requests.get(
-            f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={alpha_vantage_api_key}"
-        )
-        return r.json()
-
-
-class CompanyIncomeStatementTool(BaseTool):
-    name = "CompanyIncomeStatement"
-    description = """
-    Use this to get the income statement of a company.
-    You should enter a stock symbol.
-    """
-    args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
-
-    def _run(self, symbol):
-        r = requests.get(
-            f"https://www.alphavantage.co/query?function=INCOME_STATEMENT&symbol={symbol}&apikey={alpha_vantage_api_key}"
-        )
-        return r.json()["annualReports"]
-
-
-class CompanyStockPerformanceTool(BaseTool):
-    name = "CompanyStockPerformance"
-    description = """
-    Use this to get the weekly performance of a company stock.
-    You should enter a stock symbol.
-    """
-    args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
-
-    def _run(self, symbol):
-        r = requests.get(
-            f"https://www.alphavantage.co/query?function=TIME_SERIES_WEEKLY&symbol={symbol}&apikey={alpha_vantage_api_key}"
-        )
-        response = r.json()
-        return list(response["Weekly Time Series"].items())[:200]
-
-
-agent = initialize_agent(
-    llm=llm,
-    verbose=True,
-    agent=AgentType.OPENAI_FUNCTIONS,
-    handle_parsing_errors=True,
-    tools=[
-        CompanyIncomeStatementTool(),
-        CompanyStockPerformanceTool(),
-        StockMarketSymbolSearchTool(),
-        CompanyOverviewTool(),
-    ],
-    agent_kwargs={
-        "system_message": SystemMessage(
-            content="""
-            You are a hedge fund manager.
+    return initialize_agent(
+        llm=resources.chat_model(
+            "openai", temperature=0.1, model_name="gpt-3.5-turbo-1106"
+        ),
+        verbose=True,
+        agent=AgentType.OPENAI_MULTI_FUNCTIONS
+        if mode == "parallel"
+        else AgentType.OPENAI_FUNCTIONS,
+        handle_parsing_errors=True,
+        tools=[
+            CompanyIncomeStatementTool(),
+            CompanyStockPerformanceTool(),
+            StockMarketSymbolSearchTool(),
+            CompanyOverviewTool(),
+        ],
+        agent_kwargs={
+            "system_message": SystemMessage(
+                content="""
+                You are a hedge fund manager.
             
-            You evaluate a company and provide your opinion and reasons why the stock is a buy or not.
+                You evaluate a company and provide your opinion and reasons why the stock is a buy or not.
             
-            Consider the performance of a stock, the company overview and the income statement.
+                Consider the performance of a stock, the company overview and the income statement.
+
+                Once you know the stock symbol, request the overview, the income statement and the stock performance together in a single step.
             
-            Be assertive in your judgement and recommend the stock or advise the user against it.
-        """
-        )
-    },
-)
+                Be assertive in your judgement and recommend the stock or advise the user against it.
+            """
+            )
+        },
+    )
+
 
 st.set_page_config(
     page_title="InvestorGPT",
@@ -129,8 +85,19 @@ st.markdown(
 """
 )
 
+with st.sidebar:
+    mode = st.selectbox("Agent mode", AGENT_MODES)
+
 company = st.text_input("Write the name of the company you are interested on.")
 
 if company:
-    result = agent.invoke(company)
+    with tracing.trace("InvestorGPT/agent", store=st.session_state) as trace:
+        # ainvoke로 실행해야 같은 단계의 도구 호출들이 _arun으로 동시에 실행됨
+        result = run_in_loop(
+            get_agent(mode).ainvoke(
+                company, config={"callbacks": [trace.callback_handler()]}
+            )
+        )
     st.write(result["output"].replace("$", "\$"))
+
+tracing.trace_panel("InvestorGPT")
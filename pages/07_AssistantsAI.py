@@ -3,6 +3,7 @@ from openai import OpenAI
 import time
 import json
 import os
+from utils import model_client, tracing
 
 # 페이지 설정
 st.set_page_config(
@@ -27,7 +28,8 @@ st.write("""연구하고 싶은 주제나 키워드를 입력하세요. AI가 
 # OpenAI 클라이언트 초기화 함수 (캐싱)
 @st.cache_resource
 def get_openai_client(api_key: str):
-    return OpenAI(api_key=api_key)
+    # Assistants 호출도 다른 페이지와 같은 분당 요청 한도와 deadline을 씀
+    return model_client.openai_client(api_key)
 
 # Assistant 초기화 함수 (캐싱)
 @st.cache_resource
@@ -162,7 +164,9 @@ if prompt := st.chat_input("연구하고 싶은 주제나 질문을 입력하세
         st.markdown(prompt)
 
     # Assistant 응답 처리
-    with st.chat_message("assistant"):
+    with st.chat_message("assistant"), tracing.trace(
+        "AssistantsAI/run", store=st.session_state
+    ):
         message_placeholder = st.empty()
         status_placeholder = st.empty()
         
@@ -197,13 +201,15 @@ if prompt := st.chat_input("연구하고 싶은 주제나 질문을 입력하세
             )
             
             # 실행 완료 대기
-            while run.status in ["queued", "in_progress"]:
-                status_placeholder.text(f"상태: {run.status}")
-                run = openai_client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                time.sleep(1)
+            with tracing.span("run", kind="external"):
+                while run.status in ["queued", "in_progress"]:
+                    status_placeholder.text(f"상태: {run.status}")
+                    run = openai_client.beta.threads.runs.retrieve(
+                        thread_id=thread.id,
+                        run_id=run.id
+                    )
+                    tracing.count("polls")
+                    time.sleep(1)
             
             # 도구 호출 처리
             if run.status == "requires_action":
@@ -211,6 +217,7 @@ if prompt := st.chat_input("연구하고 싶은 주제나 질문을 입력하세
                 tool_outputs = []
                 
                 for tool_call in tool_calls:
+                    tracing.add_event("tool_call", name=tool_call.function.name)
                     args = json.loads(tool_call.function.arguments)
                     if tool_call.function.name == "save_research_to_text":
                         output = save_research_to_text(args["content"], args["filename"])
@@ -233,13 +240,15 @@ if prompt := st.chat_input("연구하고 싶은 주제나 질문을 입력하세
                 )
                 
                 # 실행 완료 대기
-                while run.status in ["queued", "in_progress"]:
-                    status_placeholder.text(f"상태: {run.status}")
-                    run = openai_client.beta.threads.runs.retrieve(
-                        thread_id=thread.id,
-                        run_id=run.id
-                    )
-                    time.sleep(1)
+                with tracing.span("run_after_tools", kind="external"):
+                    while run.status in ["queued", "in_progress"]:
+                        status_placeholder.text(f"상태: {run.status}")
+                        run = openai_client.beta.threads.runs.retrieve(
+                            thread_id=thread.id,
+                            run_id=run.id
+                        )
+                        tracing.count("polls")
+                        time.sleep(1)
             
             # 응답 메시지 가져오기
             messages = openai_client.beta.threads.messages.list(thread_id=thread.id)
@@ -258,6 +267,8 @@ if prompt := st.chat_input("연구하고 싶은 주제나 질문을 입력하세
         finally:
             status_placeholder.empty()
 
+tracing.trace_panel("AssistantsAI")
+
 # 대화 기록 초기화 버튼
 if st.sidebar.button("대화 기록 초기화"):
     st.session_state.messages = []
@@ -0,0 +1,20 @@
+import os
+import re
+import tiktoken
+
+# 테스트의 rate limit 버킷은 프로세스 안에만 둠 (.cache의 공유 DB를 건드리지 않음)
+os.environ["RATE_LIMIT_DB"] = ""
+
+
+class WordEncoding:
+    """
+    Offline stand-in for a tiktoken encoding: one token per word or other
+    character. The tests check how text is split and packed, not the exact
+    BPE counts, and must not download the encoding files.
+    """
+
+    def encode(self, text, allowed_special=set(), disallowed_special="all"):
+        return re.findall(r"\w+|\W", text)
+
+
+tiktoken.get_encoding = lambda encoding_name: WordEncoding()
@@ -0,0 +1,38 @@
+from langchain.schema import Document
+from utils.context import drop_near_duplicates, merge_chunks, pack_context
+from utils.tokens import count_tokens
+
+# 두 번째 청크는 첫 번째 청크의 끝(스플리터의 chunk_overlap)으로 시작함
+SHARED = (
+    "Indexes store the embeddings of your documents and return the ones closest "
+    "to the query vector."
+)
+FIRST = "Vectorize is a globally distributed vector database. " + SHARED
+SECOND = SHARED + " Queries accept a topK parameter and optional metadata filters."
+
+
+def doc(text, source="docs.pdf"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_pack_context_merges_overlapping_chunks():
+    context = pack_context([doc(FIRST), doc(SECOND)])
+    assert context == FIRST + SECOND[len(SHARED) :]
+
+
+def test_pack_context_drops_near_duplicates_from_other_sources():
+    context = pack_context([doc(FIRST, "a.pdf"), doc(FIRST + " Updated daily.", "b.pdf")])
+    assert context == FIRST
+
+
+def test_pack_context_keeps_relevance_order_within_budget():
+    other = "Workers AI runs inference on the edge."
+    context = pack_context(
+        [doc(other, "b.pdf"), doc(FIRST, "a.pdf")], token_budget=count_tokens(other)
+    )
+    assert context == other
+
+
+def test_drop_near_duplicates_keeps_distinct_passages():
+    passages = merge_chunks([doc(FIRST, "a.pdf"), doc("Something else entirely here.", "b.pdf")])
+    assert len(drop_near_duplicates(passages)) == 2
@@ -0,0 +1,58 @@
+import random
+from langchain.schema import Document
+from utils.ingest_filter import IngestFilter, MinHashIndex
+
+WORDS = [f"word{i}" for i in range(500)]
+
+
+def text(seed, length=120):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def edit(source, changes, seed=0):
+    # 단어 몇 개만 바꾼 사본
+    rng = random.Random(seed)
+    words = source.split(" ")
+    for i in rng.sample(range(len(words)), changes):
+        words[i] = "changed"
+    return " ".join(words)
+
+
+def test_exact_and_near_duplicates_are_dropped():
+    index = MinHashIndex(threshold=0.85)
+    original = text(1)
+    assert index.add(original)
+    assert not index.add(original)
+    assert not index.add(edit(original, 1))
+
+
+def test_distinct_texts_are_kept():
+    index = MinHashIndex(threshold=0.85)
+    assert all(index.add(text(seed)) for seed in range(50))
+
+
+def test_heavily_edited_copies_are_kept():
+    index = MinHashIndex(threshold=0.85)
+    original = text(2)
+    assert index.add(original)
+    assert index.add(edit(original, 40))
+
+
+def test_dedupe_counts_dropped_chunks():
+    chunks = [Document(page_content=content) for content in [text(3), text(4), text(3)]]
+    ingest_filter = IngestFilter()
+    kept = ingest_filter.dedupe(chunks)
+    assert [doc.page_content for doc in kept] == [text(3), text(4)]
+    assert ingest_filter.report()["duplicates"] == 1
+
+
+def test_strip_removes_lines_repeated_across_pages():
+    navigation = "Home | Products | Documentation | Pricing | Support"
+    pages = [
+        Document(page_content=f"{navigation}\nUnique content of page {i}.") for i in range(4)
+    ]
+    stripped = list(IngestFilter().strip(pages))
+    assert [page.page_content for page in stripped] == [
+        f"Unique content of page {i}." for i in range(4)
+    ]
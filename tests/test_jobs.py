@@ -0,0 +1,46 @@
+import threading
+import time
+import pytest
+from utils import jobs
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "STALE_AFTER", 0.3)
+    monkeypatch.setattr(jobs, "HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setitem(jobs.HANDLERS, "sleep", "tests:sleep")
+    monkeypatch.setitem(jobs._handlers, "sleep", lambda context, payload: time.sleep(payload))
+    return jobs.JobQueue(str(tmp_path / "jobs.sqlite"))
+
+
+def test_running_job_is_not_reclaimed(queue):
+    job_id = queue.submit("sleep", 1.0)
+    job = queue.claim("worker-1")
+    runner = threading.Thread(target=jobs.run_job, args=(queue, job))
+    runner.start()
+    # 진행 보고 없이 STALE_AFTER보다 오래 실행돼도 heartbeat가 있으면 다시 할당하지 않음
+    deadline = time.time() + 0.8
+    while time.time() < deadline:
+        assert queue.claim("worker-2") is None
+        time.sleep(0.05)
+    runner.join()
+    assert queue.get(job_id)["status"] == "done"
+
+
+def test_job_of_a_dead_worker_is_reclaimed(queue):
+    job_id = queue.submit("sleep", 0)
+    assert queue.claim("worker-1")["id"] == job_id
+    assert queue.claim("worker-2") is None
+    time.sleep(0.4)
+    assert queue.claim("worker-2")["id"] == job_id
+
+
+def test_done_job_is_run_again_when_its_result_was_deleted(queue, tmp_path, monkeypatch):
+    index_path = tmp_path / "index"
+    index_path.mkdir()
+    monkeypatch.setitem(jobs._handlers, "sleep", lambda context, payload: {"index_path": payload})
+    job_id = queue.submit("sleep", str(index_path), key="doc")
+    jobs.run_job(queue, queue.claim("worker-1"))
+    assert queue.submit("sleep", str(index_path), key="doc") == job_id
+    index_path.rmdir()
+    assert queue.submit("sleep", str(index_path), key="doc") != job_id
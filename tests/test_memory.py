@@ -0,0 +1,40 @@
+from langchain.schema import AIMessage, HumanMessage
+from utils.memory import ConversationMemory
+
+
+def test_pruning_keeps_whole_turns():
+    # 긴 질문 하나만 빼도 한도 안에 들어오는 경우에도 답과 함께 빠져야 함
+    memory = ConversationMemory(mode="retrieval", max_token_limit=11)
+    memory.save_context({"input": "one two three four five"}, {"output": "ok"})
+    memory.save_context({"input": "hi"}, {"output": "yo"})
+    assert [type(message) for message, _ in memory.archive] == [HumanMessage, AIMessage]
+    assert [message.content for message, _ in memory.buffer] == ["hi", "yo"]
+    assert memory.buffer_tokens == sum(tokens for _, tokens in memory.buffer)
+
+
+def test_relevant_turns_pair_questions_with_their_answers():
+    memory = ConversationMemory(mode="retrieval", max_token_limit=11, retrieval_k=1)
+    memory.save_context({"input": "what is the latency of the cache"}, {"output": "ten ms"})
+    memory.save_context({"input": "and what does it cost per month"}, {"output": "free"})
+    memory.save_context({"input": "thanks"}, {"output": "welcome"})
+    history = memory.load_memory_variables({"input": "latency again?"})["history"]
+    assert [message.content for message in history] == [
+        "what is the latency of the cache",
+        "ten ms",
+        "thanks",
+        "welcome",
+    ]
+
+
+def test_archive_keeps_only_the_latest_turns():
+    memory = ConversationMemory(mode="retrieval", max_token_limit=2, max_archive_turns=2)
+    for i in range(5):
+        memory.save_context({"input": f"question {i}"}, {"output": f"answer {i}"})
+    assert [message.content for message, _ in memory.archive] == [
+        "question 2",
+        "answer 2",
+        "question 3",
+        "answer 3",
+    ]
+    history = memory.load_memory_variables({"input": "question 0"})["history"]
+    assert "question 0" not in [message.content for message in history]
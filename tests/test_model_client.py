@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+import pytest
+from utils import model_client, rate_limit
+from utils.model_client import AsyncOperation, Operation
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+class SlowResource:
+    """Stands in for `client.chat.completions`: answers after `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = []
+        self.release = threading.Event()
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        self.release.wait(self.delay)
+        return {"choices": []}
+
+
+class AsyncSlowResource(SlowResource):
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        await asyncio.sleep(self.delay)
+        return {"choices": []}
+
+
+def test_request_timeout_shorter_than_deadline_wins():
+    # 라우터 fast 티어(timeout 30)가 chat 작업 한도(90)보다 먼저 끊겨야 함
+    resource = SlowResource(delay=5)
+    operation = Operation(resource, "chat", rate_limit.chat_tokens, timeout=0.2)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError, match="0.2s deadline"):
+        operation.create(model="gpt-3.5-turbo", messages=MESSAGES)
+    assert time.perf_counter() - start < 1
+    assert 0.15 < resource.calls[0]["timeout"] <= 0.2
+    resource.release.set()
+
+
+def test_deadline_shorter_than_request_timeout_wins(monkeypatch):
+    monkeypatch.setitem(model_client.OPERATIONS, "chat", {"deadline": 0.2, "hedge": False})
+    resource = SlowResource(delay=5)
+    operation = Operation(resource, "chat", rate_limit.chat_tokens, timeout=30)
+    with pytest.raises(TimeoutError):
+        operation.create(model="gpt-3.5-turbo", messages=MESSAGES)
+    assert 0.15 < resource.calls[0]["timeout"] <= 0.2
+    resource.release.set()
+
+
+def test_without_request_timeout_uses_deadline():
+    resource = SlowResource(delay=0)
+    operation = Operation(resource, "chat", rate_limit.chat_tokens)
+    assert operation.create(model="gpt-3.5-turbo", messages=MESSAGES) == {"choices": []}
+    deadline = model_client.OPERATIONS["chat"]["deadline"]
+    assert deadline - 1 < resource.calls[0]["timeout"] <= deadline
+
+
+def test_async_request_timeout():
+    resource = AsyncSlowResource(delay=5)
+    operation = AsyncOperation(resource, "chat", rate_limit.chat_tokens, timeout=0.2)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        asyncio.run(operation.create(model="gpt-3.5-turbo", messages=MESSAGES))
+    assert time.perf_counter() - start < 1
+    assert 0.15 < resource.calls[0]["timeout"] <= 0.2
+
+
+class StreamingResource:
+    """Streams `chunks` words, `delay` seconds apart."""
+
+    def __init__(self, chunks, delay):
+        self.chunks = chunks
+        self.delay = delay
+        self.closed = False
+
+    def create(self, **kwargs):
+        return self
+
+    def __iter__(self):
+        for i in range(self.chunks):
+            time.sleep(self.delay)
+            yield f"word{i}"
+
+    def close(self):
+        self.closed = True
+
+
+def test_deadline_covers_reading_the_stream():
+    resource = StreamingResource(chunks=20, delay=0.05)
+    operation = Operation(resource, "chat", rate_limit.chat_tokens, timeout=0.3)
+    stream = operation.create(model="gpt-3.5-turbo", messages=MESSAGES, stream=True)
+    words = []
+    with pytest.raises(TimeoutError):
+        for word in stream:
+            words.append(word)
+    assert 0 < len(words) < 20
+    assert resource.closed
+
+
+def test_losing_hedge_gets_only_the_time_left(monkeypatch):
+    monkeypatch.setitem(
+        model_client.OPERATIONS,
+        "embeddings",
+        {"deadline": 0.5, "hedge": True, "hedge_after": 0.2},
+    )
+    resource = SlowResource(delay=5)
+    operation = Operation(resource, "embeddings", rate_limit.embedding_tokens)
+    with pytest.raises(TimeoutError):
+        operation.create(model="text-embedding-ada-002", input=["hello"])
+    primary, hedge = resource.calls
+    assert hedge["timeout"] < primary["timeout"] - 0.15
+    resource.release.set()
+
+
+def test_calls_that_start_after_the_deadline_are_not_sent():
+    resource = SlowResource(delay=0)
+    operation = Operation(resource, "chat", rate_limit.chat_tokens)
+    future = operation._submit(
+        {"model": "gpt-3.5-turbo"}, time.perf_counter() - 1, "chat", 90
+    )
+    with pytest.raises(TimeoutError):
+        future.result()
+    assert resource.calls == []
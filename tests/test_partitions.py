@@ -0,0 +1,78 @@
+import numpy as np
+from langchain.schema import Document
+from utils.partitions import PartitionedRetriever, QueryClassifier
+
+PARTITIONS = ["ai-gateway", "vectorize", "workers-ai"]
+
+
+class FixedEmbeddings:
+    def __init__(self, vector):
+        self.vector = vector
+
+    def embed_query(self, text):
+        return self.vector
+
+
+class FixedPartition:
+    """Returns one document at a fixed distance and counts its searches."""
+
+    def __init__(self, name, distance):
+        self.name = name
+        self.distance = distance
+        self.searches = 0
+
+    def search(self, vector, k):
+        self.searches += 1
+        return [(Document(page_content=self.name), self.distance)]
+
+
+def classify(question):
+    return QueryClassifier().classify(question, [1.0, 0.0], PARTITIONS)
+
+
+def test_keywords_match_whole_words_only():
+    assert classify("How do I reindex my data?") == (PARTITIONS, "all")
+    assert classify("How do I create an index?") == (["vectorize"], "keyword")
+    assert classify("Does the cache have a fallbacks option?") == (PARTITIONS, "all")
+
+
+def test_korean_keywords_allow_particles():
+    assert classify("게이트웨이를 어떻게 설정하나요?") == (["ai-gateway"], "keyword")
+
+
+def test_several_products_search_everything():
+    assert classify("Can Workers AI read a Vectorize index?") == (PARTITIONS, "all")
+
+
+def test_centroids_pick_the_closest_partitions():
+    classifier = QueryClassifier(
+        {"ai-gateway": [1.0, 0.0], "vectorize": [0.0, 1.0], "workers-ai": [0.7, 0.7]},
+        margin=0.05,
+    )
+    products, method = classifier.classify("Something else", np.array([0.0, 2.0]), PARTITIONS)
+    assert (products, method) == (["vectorize"], "centroid")
+
+
+def make_retriever(distances):
+    partitions = {slug: FixedPartition(slug, distances[slug]) for slug in PARTITIONS}
+    retriever = PartitionedRetriever(
+        partitions=partitions,
+        classifier=QueryClassifier(),
+        embeddings=FixedEmbeddings([1.0, 0.0]),
+        k=2,
+    )
+    return retriever, partitions
+
+
+def test_close_match_searches_only_the_routed_partition():
+    retriever, partitions = make_retriever({"ai-gateway": 0.9, "vectorize": 0.2, "workers-ai": 0.1})
+    docs = retriever.get_relevant_documents("How do I create an index?")
+    assert [doc.page_content for doc in docs] == ["vectorize"]
+    assert partitions["workers-ai"].searches == 0
+
+
+def test_weak_match_searches_every_partition():
+    retriever, partitions = make_retriever({"ai-gateway": 0.9, "vectorize": 0.8, "workers-ai": 0.1})
+    docs = retriever.get_relevant_documents("How do I create an index?")
+    assert [doc.page_content for doc in docs] == ["workers-ai", "vectorize"]
+    assert all(partition.searches == 1 for partition in partitions.values())
@@ -0,0 +1,105 @@
+import pytest
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+from utils import router
+from utils.router import Router
+
+TIERS = {
+    "fast": {"model": "fast-model", "max_prompt_tokens": 50, "fallback": "strong"},
+    "strong": {"model": "strong-model", "max_prompt_tokens": 1000, "fallback": None},
+}
+ROUTES = {"test/map": "fast", "test/final": "strong"}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Answers `answer` word by word, or raises `error` after `chunks_before_error` words."""
+
+    answer: str = "ok"
+    error: Exception = None
+    chunks_before_error: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "scripted-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        for i, word in enumerate(self.answer.split(" ")):
+            if self.error is not None and i == self.chunks_before_error:
+                raise self.error
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+        if self.error is not None:
+            raise self.error
+
+
+def make_router(fast=None, strong=None):
+    return Router(
+        {
+            "fast": fast or ScriptedChatModel(answer="fast"),
+            "strong": strong or ScriptedChatModel(answer="strong"),
+        },
+        tiers=TIERS,
+        routes=ROUTES,
+    )
+
+
+def test_choose_moves_long_prompts_to_a_tier_that_fits():
+    models = make_router()
+    assert models.choose("test/map", 10) == "fast"
+    assert models.choose("test/map", 500) == "strong"
+    # 어느 tier에도 안 들어가면 원래 tier 그대로
+    assert models.choose("test/map", 5000) == "fast"
+    assert models.choose("unknown/step", 10) == "strong"
+
+
+def test_timeout_falls_back_to_the_fallback_tier():
+    fast = ScriptedChatModel(error=TimeoutError("fast call exceeded its 30s deadline"))
+    models = make_router(fast=fast)
+    assert models.invoke("test/map", "hello").content == "strong"
+    assert fast.calls == 1
+    row = next(row for row in router.stats.summary("test/map") if row["tier"] == "strong")
+    assert row["fallbacks"] >= 1
+
+
+def test_timeout_without_fallback_is_raised():
+    models = make_router(strong=ScriptedChatModel(error=TimeoutError()))
+    with pytest.raises(TimeoutError):
+        models.invoke("test/final", "hello")
+
+
+def test_models_the_key_cannot_use_fall_back():
+    openai = pytest.importorskip("openai")
+    assert {openai.NotFoundError, openai.PermissionDeniedError} <= set(router.fallback_errors())
+
+
+def test_other_errors_do_not_fall_back():
+    strong = ScriptedChatModel(answer="strong")
+    models = make_router(fast=ScriptedChatModel(error=ValueError("bad request")), strong=strong)
+    with pytest.raises(ValueError):
+        models.invoke("test/map", "hello")
+    assert strong.calls == 0
+
+
+def test_stream_falls_back_before_the_first_chunk():
+    models = make_router(fast=ScriptedChatModel(answer="a b", error=TimeoutError()))
+    assert "".join(chunk.content for chunk in models.stream("test/map", "hello")) == "strong "
+
+
+def test_stream_does_not_fall_back_after_the_first_chunk():
+    models = make_router(
+        fast=ScriptedChatModel(answer="a b c", error=TimeoutError(), chunks_before_error=1)
+    )
+    chunks = []
+    with pytest.raises(TimeoutError):
+        for chunk in models.stream("test/map", "hello"):
+            chunks.append(chunk.content)
+    assert chunks == ["a "]
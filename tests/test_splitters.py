@@ -0,0 +1,77 @@
+import random
+import pytest
+from langchain.schema import Document
+from langchain.text_splitter import CharacterTextSplitter
+from utils.splitters import StreamingTokenSplitter
+
+WORDS = "cloudflare vector index worker gateway cache model token latency request".split()
+
+
+def make_pages(count, seed=0):
+    rng = random.Random(seed)
+    pages = []
+    for i in range(count):
+        lines = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30)))
+            for _ in range(rng.randint(0, 12))
+        ]
+        # 빈 줄과 빈 페이지도 섞음
+        if i % 5 == 0:
+            lines.insert(rng.randint(0, len(lines)), "")
+        pages.append(Document(page_content="\n".join(lines), metadata={"page": i}))
+    return pages
+
+
+def reference_chunks(pages, separator, chunk_size, chunk_overlap):
+    splitter = CharacterTextSplitter.from_tiktoken_encoder(
+        separator=separator, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    text = separator.join(page.page_content for page in pages)
+    return splitter.split_text(text)
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(600, 100), (50, 10), (20, 0), (30, 30)])
+def test_same_chunks_as_character_text_splitter(chunk_size, chunk_overlap):
+    pages = make_pages(40)
+    splitter = StreamingTokenSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = [doc.page_content for doc in splitter.split_documents(pages)]
+    assert chunks == reference_chunks(pages, "\n", chunk_size, chunk_overlap)
+
+
+def test_parallel_counting_gives_the_same_chunks():
+    pages = make_pages(60, seed=1)
+    serial = StreamingTokenSplitter(chunk_size=80, chunk_overlap=20, processes=1)
+    parallel = StreamingTokenSplitter(
+        chunk_size=80, chunk_overlap=20, processes=2, parallel_threshold=10
+    )
+    assert [doc.page_content for doc in parallel.split_documents(pages)] == [
+        doc.page_content for doc in serial.split_documents(pages)
+    ]
+
+
+def test_parallel_counting_reads_pages_as_chunks_are_consumed():
+    read = []
+
+    def pages():
+        for page in make_pages(400, seed=3):
+            read.append(page)
+            yield page
+
+    splitter = StreamingTokenSplitter(
+        chunk_size=80, chunk_overlap=20, processes=2, parallel_threshold=10, batch_size=4
+    )
+    next(splitter.split_pages(pages()))
+    # 워커 2개 x 두 배치 x 4페이지 정도만 미리 읽음 (첫 청크를 채우는 데 필요한 만큼 더)
+    assert len(read) < 100
+
+
+def test_chunks_keep_the_metadata_of_their_first_page():
+    pages = make_pages(10, seed=2)
+    for doc in StreamingTokenSplitter(chunk_size=50, chunk_overlap=0).split_documents(pages):
+        page = pages[doc.metadata["page"]].page_content
+        assert page.strip() and doc.page_content.split("\n")[0] in page
+
+
+def test_overlap_larger_than_chunk_is_rejected():
+    with pytest.raises(ValueError):
+        StreamingTokenSplitter(chunk_size=10, chunk_overlap=20)
@@ -0,0 +1,44 @@
+import json
+import pytest
+from utils.streaming import JsonArrayStream
+
+QUESTIONS = {
+    "questions": [
+        {
+            "question": 'What does "{ [" print?',
+            "answers": [{"answer": "a \\\"quote\\\" and } ]", "correct": True}],
+        },
+        {"question": "Second?", "answers": [{"answer": "yes", "correct": False}]},
+        {"question": "Third?", "answers": []},
+    ]
+}
+TEXT = json.dumps(QUESTIONS)
+
+
+def feed_all(chunks):
+    stream = JsonArrayStream()
+    completed = []
+    for chunk in chunks:
+        completed.extend(stream.feed(chunk))
+    return stream, completed
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(TEXT)])
+def test_items_are_the_same_for_any_chunk_size(size):
+    stream, completed = feed_all(TEXT[i : i + size] for i in range(0, len(TEXT), size))
+    assert completed == QUESTIONS["questions"]
+    assert stream.result() == QUESTIONS
+
+
+def test_items_split_at_every_position():
+    # 문자열, 이스케이프, 괄호 어디에서 잘려도 같은 결과
+    for cut in range(1, len(TEXT)):
+        _, completed = feed_all([TEXT[:cut], TEXT[cut:]])
+        assert completed == QUESTIONS["questions"], cut
+
+
+def test_item_is_returned_by_the_chunk_that_closes_it():
+    stream = JsonArrayStream()
+    first_end = TEXT.rindex("}", 0, TEXT.index('{"question": "Second?"'))
+    assert stream.feed(TEXT[:first_end]) == []
+    assert stream.feed(TEXT[first_end : first_end + 1]) == [QUESTIONS["questions"][0]]
@@ -0,0 +1,24 @@
+import threading
+import time
+import requests
+from utils import tracing
+
+
+def test_otlp_export_does_not_block_the_request(monkeypatch):
+    release = threading.Event()
+    sent = []
+
+    def slow_post(url, json, timeout):
+        release.wait(5)
+        sent.append(url)
+
+    monkeypatch.setattr(tracing, "OTLP_ENDPOINT", "http://collector:4318")
+    monkeypatch.setattr(requests, "post", slow_post)
+    start = time.perf_counter()
+    with tracing.trace("test/export"):
+        with tracing.span("step"):
+            pass
+    assert time.perf_counter() - start < 0.5
+    release.set()
+    tracing._otlp_queue().join()
+    assert sent == ["http://collector:4318/v1/traces"]
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from utils.vad import OffsetMap, speech_regions, trim_silence
+
+RATE = 16000
+
+
+def audio(*parts, seed=0):
+    # (초, 음성 여부) 구간을 이어 붙인 합성 오디오: 음성은 440Hz 사인파, 침묵은 약한 잡음
+    rng = np.random.default_rng(seed)
+    pieces = []
+    for seconds, speech in parts:
+        n = int(seconds * RATE)
+        noise = rng.normal(0, 20, n)
+        tone = 8000 * np.sin(2 * np.pi * 440 * np.arange(n) / RATE) if speech else 0
+        pieces.append(noise + tone)
+    return np.concatenate(pieces).astype(np.int16)
+
+
+def test_speech_regions_are_padded_and_long_silences_cut():
+    samples = audio((2, False), (3, True), (4, False), (1, True), (2, False))
+    regions = speech_regions(samples, RATE, padding=0.3)
+    assert len(regions) == 2
+    assert regions[0] == pytest.approx((1.7, 5.3), abs=0.05)
+    assert regions[1] == pytest.approx((8.7, 10.3), abs=0.05)
+
+
+def test_short_silences_are_kept():
+    samples = audio((1, False), (2, True), (0.5, False), (2, True), (1, False))
+    regions = speech_regions(samples, RATE, min_silence=1.0, padding=0.1)
+    assert len(regions) == 1
+    assert regions[0] == pytest.approx((0.9, 5.6), abs=0.05)
+
+
+def test_offset_map_points_back_at_the_original_time(tmp_path):
+    offsets = OffsetMap.from_regions([(1.0, 2.0), (5.0, 7.0)])
+    assert offsets.trimmed_seconds == 3.0
+    assert offsets.to_original(0.0) == 1.0
+    assert offsets.to_original(0.5) == 1.5
+    assert offsets.to_original(1.5) == 5.5
+    # 잘린 오디오 끝을 넘어가면 마지막 구간 끝에 멈춤
+    assert offsets.to_original(10.0) == 7.0
+    offsets.save(tmp_path / "offsets.json")
+    assert OffsetMap.load(tmp_path / "offsets.json").to_original(1.5) == 5.5
+
+
+def test_trim_silence_removes_the_silent_stretches():
+    pydub = pytest.importorskip("pydub")
+    samples = audio((2, False), (3, True), (4, False), (1, True), (2, False))
+    track = pydub.AudioSegment(
+        data=samples.tobytes(), sample_width=2, frame_rate=RATE, channels=1
+    )
+    trimmed, offsets, stats = trim_silence(track, padding=0.3)
+    assert stats["regions"] == 2
+    assert stats["original_seconds"] == pytest.approx(12.0)
+    assert len(trimmed) / 1000 == pytest.approx(offsets.trimmed_seconds, abs=0.01)
+    assert stats["removed_fraction"] == pytest.approx(1 - 5.2 / 12, abs=0.02)
+    assert offsets.to_original(0.0) == pytest.approx(1.7, abs=0.05)
@@ -0,0 +1,35 @@
+import pytest
+from utils.vector_service import Namespace, NamespaceStore
+
+
+def add_docs(namespace, n=3):
+    namespace.add(
+        [f"doc {i}" for i in range(n)],
+        [{"i": i} for i in range(n)],
+        [[float(i), 1.0] for i in range(n)],
+    )
+
+
+def test_namespaces_in_use_are_not_evicted(tmp_path):
+    store = NamespaceStore(str(tmp_path), max_loaded=1)
+    with store.use("a", dim=2) as a:
+        add_docs(a)
+        with store.use("b", dim=2) as b:
+            add_docs(b)
+            # 한도를 넘어도 사용 중인 a는 열려 있어야 함
+            assert [result["text"] for result in a.search([0.0, 1.0], k=1)] == ["doc 0"]
+        assert list(store.loaded) == ["a"]
+    with store.use("b") as b:
+        assert b.count == 3
+    assert list(store.loaded) == ["b"]
+    assert a.vectors is None
+
+
+def test_search_on_a_closed_namespace_raises_key_error(tmp_path):
+    namespace = Namespace(str(tmp_path / "a"), dim=2)
+    add_docs(namespace)
+    namespace.close()
+    with pytest.raises(KeyError):
+        namespace.search([0.0, 1.0])
+    with pytest.raises(KeyError):
+        add_docs(namespace)
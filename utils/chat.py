@@ -0,0 +1,99 @@
+import time
+from langchain.callbacks.base import BaseCallbackHandler
+import streamlit as st
+from utils import tracing
+
+
+def save_message(message, role):
+    st.session_state["messages"].append({"message": message, "role": role})
+
+
+def send_message(message, role, save=True):
+    with st.chat_message(role):
+        st.markdown(message)
+    if save:
+        save_message(message, role)
+
+
+def paint_history():
+    for message in st.session_state["messages"]:
+        send_message(
+            message["message"],
+            message["role"],
+            save=False,
+        )
+
+
+class ChatCallbackHandler(BaseCallbackHandler):
+    """
+    Streams LLM tokens into a chat message without re-rendering on every token.
+
+    Tokens are collected in a list and the placeholder is only repainted when
+    `flush_interval` seconds have passed or enough tokens are pending. The
+    pending threshold grows with the answer (`flush_ratio`), so the total
+    rendering work stays linear in the answer length. The complete message is
+    rendered once more and saved in `on_llm_end` (taken from the result when
+    it came from the llm cache without streaming). `escape_dollars` keeps
+    prices like "$5" from being rendered as LaTeX.
+    """
+
+    def __init__(
+        self,
+        flush_interval=0.15,
+        flush_size=16,
+        flush_ratio=0.25,
+        save=True,
+        escape_dollars=False,
+    ):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.flush_ratio = flush_ratio
+        self.save = save
+        self.escape_dollars = escape_dollars
+        self.tokens = []
+        self.message = ""
+
+    def on_llm_start(self, *args, **kwargs):
+        self.tokens = []
+        self.message = ""
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.renders = 0
+        self.render_seconds = 0.0
+        self.message_box = st.empty()
+
+    def on_llm_new_token(self, token, *args, **kwargs):
+        self.tokens.append(token)
+        self.pending += 1
+        threshold = max(self.flush_size, int(len(self.tokens) * self.flush_ratio))
+        if (
+            self.pending >= threshold
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self.render("".join(self.tokens) + "▌")
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def render(self, text):
+        start = time.perf_counter()
+        if self.escape_dollars:
+            text = text.replace("$", "\\$")
+        self.message_box.markdown(text)
+        self.renders += 1
+        self.render_seconds += time.perf_counter() - start
+
+    def on_llm_end(self, response, *args, **kwargs):
+        # 캐시된 응답은 토큰 스트리밍 없이 끝나므로 결과에서 가져옴
+        self.message = "".join(self.tokens) or response.generations[0][0].text
+        self.render(self.message)
+        tracing.add_event(
+            "render",
+            renders=self.renders,
+            seconds=self.render_seconds,
+            tokens=len(self.tokens),
+        )
+        if self.save:
+            save_message(self.message, "ai")
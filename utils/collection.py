@@ -0,0 +1,112 @@
+"""
+Named document collections for DocumentGPT.
+
+A collection is a JSON manifest under .cache/collections listing its documents
+(display name, content digest, stored file). Every document is indexed by its
+own background job, so the files of a collection are ingested in parallel and
+a file that is in two collections is only embedded once. Queries merge the
+indexes of the documents in scope.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+COLLECTIONS_DIR = "./.cache/collections"
+FILES_DIR = "./.cache/files"
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".docx")
+COPY_BLOCK = 1 << 20
+
+
+def slug(name):
+    return re.sub(r"[^\w.-]", "_", name.strip()).strip(".") or "default"
+
+
+def collection_names(root=COLLECTIONS_DIR):
+    if not os.path.isdir(root):
+        return []
+    names = []
+    for entry in sorted(os.listdir(root)):
+        if entry.endswith(".json"):
+            with open(os.path.join(root, entry)) as f:
+                names.append(json.load(f)["name"])
+    return names
+
+
+def store_file(name, fileobj, files_dir=FILES_DIR):
+    """
+    Copies `fileobj` to files_dir in blocks while hashing it, so large files
+    and zip members never have to fit in memory. Returns (digest, path).
+    """
+    os.makedirs(files_dir, exist_ok=True)
+    sha1 = hashlib.sha1()
+    with tempfile.NamedTemporaryFile(dir=files_dir, delete=False) as temp:
+        while block := fileobj.read(COPY_BLOCK):
+            sha1.update(block)
+            temp.write(block)
+    digest = sha1.hexdigest()[:16]
+    path = os.path.join(files_dir, f"{digest}_{slug(os.path.basename(name))}")
+    if os.path.exists(path):
+        os.remove(temp.name)
+    else:
+        os.replace(temp.name, path)
+    return digest, path
+
+
+def expand_upload(name, fileobj):
+    """Yields (name, file object) for an upload, or for each supported file in a zip."""
+    if not name.lower().endswith(".zip"):
+        yield name, fileobj
+        return
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            member = info.filename
+            if (
+                info.is_dir()
+                or member.startswith("__MACOSX/")
+                or not member.lower().endswith(SUPPORTED_EXTENSIONS)
+            ):
+                continue
+            with archive.open(info) as member_file:
+                yield f"{name}/{member}", member_file
+
+
+class Collection:
+    def __init__(self, name, root=COLLECTIONS_DIR):
+        self.name = name
+        self.root = root
+        self.path = os.path.join(root, f"{slug(name)}.json")
+        self.documents = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.documents = json.load(f)["documents"]
+
+    def add(self, name, fileobj):
+        """Stores an uploaded file (or every file of a zip) and returns the new documents."""
+        added = []
+        for member, member_file in expand_upload(name, fileobj):
+            digest, path = store_file(member, member_file)
+            if digest not in self.documents:
+                self.documents[digest] = {"name": member, "digest": digest, "file_path": path}
+                added.append(self.documents[digest])
+        return added
+
+    def remove(self, digest):
+        self.documents.pop(digest, None)
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        temp = f"{self.path}.tmp"
+        with open(temp, "w") as f:
+            json.dump({"name": self.name, "documents": self.documents}, f, indent=2)
+        os.replace(temp, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.documents = {}
+
+    def __len__(self):
+        return len(self.documents)
@@ -0,0 +1,96 @@
+import re
+from functools import lru_cache
+from utils.tokens import count_tokens
+
+# 인접 청크의 겹침을 찾을 때 사용하는 B의 앞부분 길이 (문자)
+OVERLAP_PROBE = 80
+
+
+@lru_cache(maxsize=4096)
+def chunk_tokens(text):
+    return count_tokens(text)
+
+
+def _shingles(text, size=5):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def _merge_overlap(first, second):
+    """
+    Returns first + second without the text they share, if the end of `first`
+    is the start of `second` (the splitter's chunk_overlap), otherwise None.
+    """
+    probe = second[:OVERLAP_PROBE]
+    start = first.find(probe)
+    while start != -1:
+        shared = len(first) - start
+        if second.startswith(first[start:]):
+            return first + second[shared:]
+        start = first.find(probe, start + 1)
+    if second in first:
+        return first
+    return None
+
+
+def _same_source(a, b):
+    return a.metadata.get("source") == b.metadata.get("source")
+
+
+def merge_chunks(docs):
+    """
+    Folds chunks of the same source that overlap or contain each other into one
+    passage. Each passage keeps the best (lowest) retrieval rank of its parts.
+    """
+    passages = []
+    for rank, doc in enumerate(docs):
+        text = doc.page_content
+        for passage in passages:
+            if not _same_source(passage["doc"], doc):
+                continue
+            merged = _merge_overlap(passage["text"], text) or _merge_overlap(
+                text, passage["text"]
+            )
+            if merged is not None:
+                passage["text"] = merged
+                break
+        else:
+            passages.append({"doc": doc, "text": text, "rank": rank})
+    return passages
+
+
+def drop_near_duplicates(passages, threshold=0.8):
+    """
+    Drops passages whose shingles are mostly contained in a more relevant
+    passage (containment rather than Jaccard, so a chunk repeated inside a
+    merged passage is caught too).
+    """
+    kept = []
+    for passage in sorted(passages, key=lambda passage: passage["rank"]):
+        shingles = _shingles(passage["text"])
+        if any(
+            len(shingles & other) / max(min(len(shingles), len(other)), 1) >= threshold
+            for other in (item["shingles"] for item in kept)
+        ):
+            continue
+        kept.append({**passage, "shingles": shingles})
+    return kept
+
+
+def pack_context(docs, token_budget=2000, separator="\n\n", duplicate_threshold=0.8):
+    """
+    Builds the prompt context from retrieved chunks (most relevant first):
+    merges adjacent/overlapping chunks, drops near-duplicate passages and adds
+    passages in relevance order while they fit in `token_budget`.
+    """
+    passages = drop_near_duplicates(merge_chunks(docs), duplicate_threshold)
+    separator_tokens = count_tokens(separator)
+    packed = []
+    used = 0
+    for passage in passages:
+        tokens = chunk_tokens(passage["text"]) + (separator_tokens if packed else 0)
+        if used + tokens > token_budget:
+            continue
+        packed.append(passage["text"])
+        used += tokens
+    return separator.join(packed)
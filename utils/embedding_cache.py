@@ -0,0 +1,212 @@
+"""
+Embedding cache shared by every page and worker.
+
+    python -m utils.embedding_cache stats
+    python -m utils.embedding_cache clear
+
+Vectors are keyed by (model, sha1 of the text) and stored as packed float32
+blobs in one SQLite table, so a document's chunks are looked up with a few
+batched queries instead of one file per chunk. Entries remember when they were
+last used and the least recently used ones are dropped once the cache grows
+past `max_bytes`.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./.cache/embeddings.sqlite")
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 1 << 30))
+# SQLite의 바인딩 변수 개수 제한보다 작게
+LOOKUP_BATCH = 500
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def model_name(embeddings):
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    return f"{type(embeddings).__name__}:{model}"
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                model TEXT,
+                key TEXT,
+                vector BLOB,
+                last_used REAL,
+                PRIMARY KEY (model, key)
+            ) WITHOUT ROWID
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        # 히트율은 모든 프로세스를 합쳐서 보고
+        self.db.executemany(
+            "INSERT OR IGNORE INTO meta VALUES (?, 0)", [("bytes",), ("hits",), ("misses",)]
+        )
+        self.db.commit()
+
+    # st.cache_data로 저장되는 retriever 안에 들어가므로 경로만 pickle
+    def __getstate__(self):
+        return {"path": self.path, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get_many(self, model, keys):
+        """Returns the cached vector (np.float32 array) or None for each key."""
+        found = {}
+        now = time.time()
+        with self.lock:
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start : start + LOOKUP_BATCH]
+                placeholders = ",".join("?" for _ in batch)
+                rows = self.db.execute(
+                    f"SELECT key, vector FROM vectors WHERE model = ? AND key IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                found.update(rows)
+            self.db.executemany(
+                "UPDATE vectors SET last_used = ? WHERE model = ? AND key = ?",
+                [(now, model, key) for key in found],
+            )
+            hits = sum(1 for key in keys if key in found)
+            self._add("hits", hits)
+            self._add("misses", len(keys) - hits)
+            self.db.commit()
+        return [
+            np.frombuffer(found[key], dtype=np.float32) if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, model, keys, vectors):
+        now = time.time()
+        rows = [
+            (model, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in zip(keys, vectors)
+        ]
+        with self.lock:
+            added = 0
+            for row in rows:
+                cursor = self.db.execute("INSERT OR IGNORE INTO vectors VALUES (?, ?, ?, ?)", row)
+                added += len(row[2]) if cursor.rowcount else 0
+            self._add("bytes", added)
+            self.db.commit()
+            self._evict()
+
+    def _evict(self, low_water=0.9):
+        # 가장 오래 쓰이지 않은 것부터 지워 max_bytes의 90%까지 줄임
+        excess = self.nbytes - self.max_bytes
+        if excess <= 0:
+            return
+        excess += self.max_bytes * (1 - low_water)
+        evicted = []
+        freed = 0
+        rows = self.db.execute(
+            "SELECT model, key, length(vector) FROM vectors ORDER BY last_used"
+        )
+        for model, key, size in rows:
+            if freed >= excess:
+                break
+            evicted.append((model, key))
+            freed += size
+        self.db.executemany("DELETE FROM vectors WHERE model = ? AND key = ?", evicted)
+        self._add("bytes", -freed)
+        self.db.commit()
+
+    def _add(self, name, value):
+        self.db.execute(
+            "UPDATE meta SET value = MAX(value + ?, 0) WHERE name = ?", (value, name)
+        )
+
+    def _meta(self, name):
+        return self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    @property
+    def nbytes(self):
+        return self._meta("bytes")
+
+    def stats(self):
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            hits, misses = self._meta("hits"), self._meta("misses")
+            return {
+                "entries": entries,
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM vectors")
+            self.db.execute("UPDATE meta SET value = 0")
+            self.db.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that looks every text up in the cache first and only
+    sends the missing (deduplicated) texts to the model. Queries are not cached,
+    same as CacheBackedEmbeddings.
+    """
+
+    def __init__(self, embeddings, cache, model=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or model_name(embeddings)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        from utils import tracing
+
+        keys = [text_key(text) for text in texts]
+        vectors = self.cache.get_many(self.model, keys)
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+        tracing.count("embedding_cache_hits", len(texts) - sum(v is None for v in vectors))
+        tracing.count("embedding_cache_misses", len(missing))
+        if missing:
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(self.model, list(missing), embedded)
+            embedded = dict(zip(missing, embedded))
+            vectors = [
+                embedded[key] if vector is None else vector
+                for key, vector in zip(keys, vectors)
+            ]
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", default=EMBEDDING_CACHE_PATH)
+    args = parser.parse_args()
+    cache = EmbeddingCache(args.path)
+    if args.command == "clear":
+        cache.clear()
+    print(cache.stats())
@@ -0,0 +1,176 @@
+"""
+Compact on-disk vector indexes for large corpora.
+
+The FAISS stores built with FAISS.from_documents are flat float32 indexes held
+fully in RAM with a pickled docstore. `build_index()` offers quantized IVF/HNSW
+formats instead, `save_index()` writes the FAISS index next to a SQLite
+docstore, and `load_index()` memory-maps the index so opening it costs almost
+nothing and only the touched pages are read.
+
+    kind        factory            bytes/vector (d=1536)
+    flat        Flat               6144
+    sq8         SQ8                1536
+    ivf_sq8     IVF{n},SQ8         1536
+    ivf_pq      IVF{n},PQ{m}x8     m = d/8 (192)
+    hnsw        HNSW32             6144 + graph
+    hnsw_sq8    HNSW32_SQ8         1536 + graph
+"""
+import json
+import math
+import os
+import sqlite3
+from typing import Any, List
+import faiss
+import numpy as np
+from langchain.schema import BaseRetriever, Document
+
+INDEX_KINDS = ("flat", "sq8", "ivf_sq8", "ivf_pq", "hnsw", "hnsw_sq8")
+# PQ 코드북(256개 중심) 학습에 필요한 최소 벡터 수
+MIN_PQ_TRAINING = 256 * 39
+
+
+def _nlist(count):
+    # 리스트당 최소 39개의 학습 벡터를 확보
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def _pq_subquantizers(dim, bytes_per_vector=None):
+    target = bytes_per_vector or max(dim // 8, 1)
+    return max(m for m in range(1, min(target, dim) + 1) if dim % m == 0)
+
+
+def factory_string(kind, count, dim):
+    if kind == "flat":
+        return "Flat"
+    if kind == "sq8":
+        return "SQ8"
+    if kind == "hnsw":
+        return "HNSW32"
+    if kind == "hnsw_sq8":
+        return "HNSW32_SQ8"
+    if kind == "ivf_pq" and count >= MIN_PQ_TRAINING:
+        return f"IVF{_nlist(count)},PQ{_pq_subquantizers(dim)}x8"
+    if kind in ("ivf_sq8", "ivf_pq"):
+        # 데이터가 적어 PQ를 학습할 수 없으면 SQ8로 대체
+        return f"IVF{_nlist(count)},SQ8"
+    raise ValueError(f"Unknown index kind: {kind}. Use one of {INDEX_KINDS}")
+
+
+def build_index(vectors, kind="ivf_sq8"):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    index = faiss.index_factory(dim, factory_string(kind, count, dim), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def set_search_params(index, nprobe=16, ef_search=64):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+
+
+def save_index(path, index, texts, metadatas, kind):
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(index, os.path.join(path, "index.faiss"))
+    db_path = os.path.join(path, "docstore.sqlite")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE docs (id INTEGER PRIMARY KEY, text TEXT, metadata TEXT)")
+        db.executemany(
+            "INSERT INTO docs (id, text, metadata) VALUES (?, ?, ?)",
+            [
+                (i, text, json.dumps(metadata or {}))
+                for i, (text, metadata) in enumerate(zip(texts, metadatas))
+            ],
+        )
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"kind": kind, "count": index.ntotal, "dim": index.d}, f)
+
+
+def read_index(path, mmap=True):
+    index_path = os.path.join(path, "index.faiss")
+    if mmap:
+        try:
+            return faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # 일부 인덱스 타입은 mmap을 지원하지 않음
+            pass
+    return faiss.read_index(index_path)
+
+
+class DiskIndex:
+    def __init__(self, path, mmap=True, nprobe=16, ef_search=64):
+        self.path = path
+        self.options = {"mmap": mmap, "nprobe": nprobe, "ef_search": ef_search}
+        self._open()
+
+    def _open(self):
+        self.index = read_index(self.path, self.options["mmap"])
+        set_search_params(self.index, self.options["nprobe"], self.options["ef_search"])
+        self.db = sqlite3.connect(
+            f"file:{os.path.join(self.path, 'docstore.sqlite')}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+
+    # st.cache_data로 캐시될 수 있도록 경로만 저장하고 다시 열기
+    def __getstate__(self):
+        return {"path": self.path, "options": self.options}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.options = state["options"]
+        self._open()
+
+    def search(self, vectors, k=4):
+        queries = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+        return self.index.search(queries, k)
+
+    def documents(self, ids):
+        ids = [int(i) for i in ids if i >= 0]
+        if not ids:
+            return []
+        placeholders = ",".join("?" for _ in ids)
+        rows = dict(
+            (row[0], row[1:])
+            for row in self.db.execute(
+                f"SELECT id, text, metadata FROM docs WHERE id IN ({placeholders})", ids
+            )
+        )
+        return [
+            Document(page_content=rows[i][0], metadata=json.loads(rows[i][1]))
+            for i in ids
+            if i in rows
+        ]
+
+    def as_retriever(self, embeddings, k=4):
+        return DiskIndexRetriever(index=self, embeddings=embeddings, k=k)
+
+
+class DiskIndexRetriever(BaseRetriever):
+    index: Any
+    embeddings: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        _, ids = self.index.search(self.embeddings.embed_query(query), self.k)
+        return self.index.documents(ids[0])
+
+
+def index_exists(path):
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def build_from_documents(path, docs, embeddings, kind="ivf_sq8"):
+    texts = [doc.page_content for doc in docs]
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    index = build_index(vectors, kind)
+    save_index(path, index, texts, [doc.metadata for doc in docs], kind)
+    return DiskIndex(path)
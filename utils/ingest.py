@@ -0,0 +1,224 @@
+"""
+Ingestion work that runs in the background job workers (see utils/jobs.py).
+
+Handlers take a JobContext and a JSON payload and return a JSON result the
+page turns back into a retriever or transcript. They report progress between
+steps, which is also where a cancelled job stops.
+"""
+import math
+import os
+import subprocess
+
+EMBED_BATCH = 64
+
+
+def index_document(context, payload):
+    """
+    Loads, splits and embeds a file, then saves a FAISS index to
+    payload["index_path"] (or uploads it to the vector service when the page
+    asked for a namespace). Repeated boilerplate and near-duplicate chunks are
+    dropped before embedding unless payload["ingest_filter"] is False.
+    """
+    from utils import resources
+    from utils.ingest_filter import IngestFilter
+    from utils.loaders import load_and_split
+
+    context.progress(0.0, "Loading file...")
+    splitter = resources.token_splitter(
+        chunk_size=payload.get("chunk_size", 600),
+        chunk_overlap=payload.get("chunk_overlap", 100),
+    )
+    ingest_filter = IngestFilter() if payload.get("ingest_filter", True) else None
+    docs = load_and_split(payload["file_path"], splitter, ingest_filter)
+    for doc in docs:
+        doc.metadata.update(payload.get("metadata", {}))
+    context.progress(0.2, f"Embedding {len(docs)} chunks...")
+
+    provider = payload.get("provider", "openai")
+    params = payload.get("embedding_params", {})
+    embeddings = resources.embeddings(provider, **params)
+    cached_embeddings = resources.cached_embeddings(provider, **params)
+    texts = [doc.page_content for doc in docs]
+    metadatas = [doc.metadata for doc in docs]
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH):
+        vectors.extend(cached_embeddings.embed_documents(texts[start : start + EMBED_BATCH]))
+        context.progress(
+            0.2 + 0.75 * len(vectors) / len(texts),
+            f"Embedding chunks ({len(vectors)}/{len(texts)})...",
+        )
+
+    if payload.get("namespace"):
+        from utils.vector_service import VectorServiceClient
+
+        client = VectorServiceClient()
+        # 컬렉션 namespace에는 문서마다 추가, 파일별 namespace는 한 번만 올림
+        if payload.get("append") or not client.exists(payload["namespace"]):
+            client.add(payload["namespace"], texts, metadatas, vectors)
+        return {
+            "namespace": payload["namespace"],
+            "chunks": len(texts),
+            "metadata": payload.get("metadata", {}),
+            "filter": ingest_filter.report() if ingest_filter is not None else None,
+        }
+
+    from langchain.vectorstores.faiss import FAISS
+
+    vectorstore = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas)
+    vectorstore.save_local(payload["index_path"])
+    return {
+        "index_path": payload["index_path"],
+        "chunks": len(texts),
+        "metadata": payload.get("metadata", {}),
+        "filter": ingest_filter.report() if ingest_filter is not None else None,
+    }
+
+
+def load_retriever(result, embeddings, k=4):
+    """Turns the result of an index_document job into a retriever."""
+    if "namespace" in result:
+        from utils.vector_service import ServiceRetriever, VectorServiceClient
+
+        return ServiceRetriever(
+            client=VectorServiceClient(),
+            namespace=result["namespace"],
+            embeddings=embeddings,
+            k=k,
+        )
+    from langchain.vectorstores.faiss import FAISS
+
+    vectorstore = FAISS.load_local(result["index_path"], embeddings)
+    return vectorstore.as_retriever(search_kwargs={"k": k})
+
+
+def load_collection(results, embeddings, k=4):
+    """
+    Retriever over the documents of several index_document jobs: their FAISS
+    indexes merged into one, or the shared namespace filtered to their digests.
+    """
+    if "namespace" in results[0]:
+        from utils.vector_service import ServiceRetriever, VectorServiceClient
+
+        return ServiceRetriever(
+            client=VectorServiceClient(),
+            namespace=results[0]["namespace"],
+            embeddings=embeddings,
+            k=k,
+            filter={"digest": [result["metadata"]["digest"] for result in results]},
+        )
+    from langchain.vectorstores.faiss import FAISS
+
+    vectorstore = FAISS.load_local(results[0]["index_path"], embeddings)
+    for result in results[1:]:
+        vectorstore.merge_from(FAISS.load_local(result["index_path"], embeddings))
+    return vectorstore.as_retriever(search_kwargs={"k": k})
+
+
+def extract_audio(video_path, audio_path, sample_rate=None):
+    command = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        video_path,
+        "-vn",
+        # Whisper는 16 kHz 모노만 쓰므로 미리 줄이면 업로드 크기도 줄어듦
+        *(["-ac", "1", "-ar", str(sample_rate)] if sample_rate else []),
+        audio_path,
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+
+
+def cut_audio_in_chunks(audio_path, chunk_size, chunks_folder, track=None):
+    """
+    Exports the chunks and returns their lengths in seconds. `track` is the
+    already loaded (e.g. trimmed) audio, if any.
+    """
+    from pydub import AudioSegment
+
+    os.makedirs(chunks_folder, exist_ok=True)
+    if track is None:
+        track = AudioSegment.from_mp3(audio_path)
+    chunk_len = chunk_size * 60 * 1000
+    chunks = math.ceil(len(track) / chunk_len)
+    durations = []
+    for i in range(chunks):
+        start_time = i * chunk_len
+        end_time = (i + 1) * chunk_len
+        chunk = track[start_time:end_time]
+        chunk.export(
+            f"{chunks_folder}/chunk_{i}.mp3",
+            format="mp3",
+        )
+        durations.append(len(chunk) / 1000)
+    return durations
+
+
+def transcribe_video(context, payload):
+    """
+    Extracts the audio of a video, cuts it into chunks and transcribes them
+    into payload["transcript_path"] with the backend in payload["backend"]
+    (default TRANSCRIBE_BACKEND, see utils/transcription.py). The openai
+    backend takes its API key from payload["transcribe_params"]["api_key"].
+
+    Unless payload["vad"] is False, long silences are removed first and the
+    map back to the video's time is saved next to the transcript; unless
+    payload["downsample"] is False, the audio is converted to 16 kHz mono.
+    """
+    transcript_path = payload["transcript_path"]
+    if os.path.exists(transcript_path):
+        return {"transcript_path": transcript_path}
+    from utils import vad
+    from utils.transcription import TRANSCRIBE_BACKEND, get_transcriber
+
+    video_path = payload["video_path"]
+    audio_path = os.path.splitext(video_path)[0] + ".mp3"
+    chunks_folder = payload["chunks_folder"]
+
+    chunk_minutes = payload.get("chunk_minutes", 10)
+    downsample = payload.get("downsample", True)
+
+    context.progress(0.0, "Extracting audio...")
+    extract_audio(video_path, audio_path, vad.SAMPLE_RATE if downsample else None)
+    track = None
+    offsets = None
+    vad_stats = None
+    if payload.get("vad", True):
+        from pydub import AudioSegment
+
+        context.progress(0.05, "Trimming silence...")
+        track, offsets, vad_stats = vad.trim_silence(
+            AudioSegment.from_mp3(audio_path), downsample=downsample
+        )
+        offsets.save(os.path.splitext(transcript_path)[0] + ".offsets.json")
+    context.progress(0.1, "Cutting audio segments...")
+    durations = cut_audio_in_chunks(audio_path, chunk_minutes, chunks_folder, track)
+
+    files = [f"{chunks_folder}/chunk_{i}.mp3" for i in range(len(durations))]
+    backend = payload.get("backend", TRANSCRIBE_BACKEND)
+    # 키는 API 백엔드만 사용, 로컬 모델은 무시
+    params = payload.get("transcribe_params", {}) if backend == "openai" else {}
+    transcriber = get_transcriber(backend, **params)
+    context.progress(0.2, f"Transcribing audio (0/{len(files)})...")
+    texts, stats = transcriber.transcribe(
+        files,
+        durations,
+        progress=lambda done, total: context.progress(
+            0.2 + 0.8 * done / total, f"Transcribing audio ({done}/{total})..."
+        ),
+    )
+    # 취소되거나 실패해도 반쪽짜리 대본이 남지 않도록 다 쓴 뒤에 이름을 바꿈
+    partial_path = f"{transcript_path}.part"
+    with open(partial_path, "w") as text_file:
+        for text in texts:
+            text_file.write(text)
+    os.replace(partial_path, transcript_path)
+    # 각 청크가 원본 영상에서 시작하는 위치(초)와 대본에서 시작하는 위치(글자)
+    starts = [sum(durations[:i]) for i in range(len(durations))]
+    chars = [sum(len(text) for text in texts[:i]) for i in range(len(texts))]
+    return {
+        "transcript_path": transcript_path,
+        "transcription": stats,
+        "vad": vad_stats,
+        "chunk_starts": [offsets.to_original(start) for start in starts] if offsets else starts,
+        "chunk_chars": chars,
+    }
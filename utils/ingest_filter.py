@@ -0,0 +1,150 @@
+"""
+Ingestion filter applied between loading and embedding.
+
+- Boilerplate: lines found on at least `min_fraction` of the pages (docs
+  navigation, sidebars, running PDF headers and footers) are removed from every
+  page. They are learned from the first `sample_pages` pages so large uploads
+  still stream; SiteGPT passes all its pages at once.
+- Near duplicates: each chunk gets a MinHash signature of its word shingles
+  and is dropped, before it is embedded, when an earlier chunk's signature
+  agrees on at least `threshold` of the hashes (the estimated Jaccard
+  similarity). Candidates are found with LSH bands, so the cost stays linear.
+
+`report()` counts what was removed and the embeddings (and index entries)
+saved: the dropped chunks plus the stripped text in chunks of the average
+size, an estimate because chunks can span pages.
+"""
+import hashlib
+import itertools
+import math
+from collections import Counter
+import numpy as np
+from utils import tracing
+from utils.context import _shingles
+
+
+def _normalize(line):
+    return " ".join(line.replace("\xa0", " ").split())
+
+
+def frequent_lines(pages, min_fraction=0.5, min_pages=3):
+    """Normalized lines that appear on at least `min_fraction` of `pages`."""
+    if len(pages) < min_pages:
+        return set()
+    counts = Counter()
+    for page in pages:
+        counts.update({_normalize(line) for line in page.page_content.split("\n")} - {""})
+    needed = max(min_pages, math.ceil(min_fraction * len(pages)))
+    return {line for line, count in counts.items() if count >= needed}
+
+
+class MinHashIndex:
+    def __init__(self, threshold=0.85, num_perm=64, rows=4, shingle_size=5):
+        rng = np.random.default_rng(0)
+        # (a * x + b) mod 2^64, a는 홀수
+        self.a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self.threshold = threshold
+        self.rows = rows
+        self.shingle_size = shingle_size
+        self.buckets = {}
+        self.signatures = []
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (
+                int.from_bytes(
+                    hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little"
+                )
+                for shingle in _shingles(text, self.shingle_size)
+            ),
+            dtype=np.uint64,
+        )
+        return (hashes[:, None] * self.a + self.b).min(axis=0)
+
+    def add(self, text):
+        """Adds `text` and returns True, or returns False if a near duplicate is indexed."""
+        signature = self.signature(text)
+        keys = [
+            (start, signature[start : start + self.rows].tobytes())
+            for start in range(0, len(signature), self.rows)
+        ]
+        candidates = {i for key in keys for i in self.buckets.get(key, ())}
+        for i in candidates:
+            if np.mean(self.signatures[i] == signature) >= self.threshold:
+                return False
+        for key in keys:
+            self.buckets.setdefault(key, []).append(len(self.signatures))
+        self.signatures.append(signature)
+        return True
+
+
+class IngestFilter:
+    def __init__(
+        self,
+        min_fraction=0.5,
+        min_pages=3,
+        sample_pages=50,
+        threshold=0.85,
+        min_line_chars=20,
+    ):
+        self.min_fraction = min_fraction
+        self.min_pages = min_pages
+        self.sample_pages = sample_pages
+        self.threshold = threshold
+        self.min_line_chars = min_line_chars
+        self.stats = {
+            "pages": 0,
+            "boilerplate_lines": 0,
+            "boilerplate_chars": 0,
+            "chunks": 0,
+            "chunk_chars": 0,
+            "duplicates": 0,
+        }
+
+    def strip(self, pages):
+        """Yields the pages without the lines repeated across them."""
+        pages = iter(pages)
+        sample = list(itertools.islice(pages, self.sample_pages))
+        boilerplate = frequent_lines(sample, self.min_fraction, self.min_pages)
+        for page in itertools.chain(sample, pages):
+            self.stats["pages"] += 1
+            if boilerplate:
+                page.page_content = self._strip_page(page.page_content, boilerplate)
+            yield page
+
+    def _strip_page(self, text, boilerplate):
+        lines = text.split("\n")
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        frequent = [_normalize(lines[i]) in boilerplate for i in filled]
+        removed = set()
+        for j, i in enumerate(filled):
+            # 짧은 줄(코드의 "}" 등)은 반복되는 블록 안에 있을 때만 지움
+            neighbours = (j > 0 and frequent[j - 1]) or (j + 1 < len(filled) and frequent[j + 1])
+            if frequent[j] and (len(lines[i].strip()) >= self.min_line_chars or neighbours):
+                removed.add(i)
+        self.stats["boilerplate_lines"] += len(removed)
+        self.stats["boilerplate_chars"] += sum(len(lines[i]) for i in removed)
+        return "\n".join(line for i, line in enumerate(lines) if i not in removed)
+
+    def dedupe(self, chunks):
+        """Returns the chunks without near duplicates of earlier ones."""
+        index = MinHashIndex(self.threshold)
+        kept = []
+        for chunk in chunks:
+            self.stats["chunks"] += 1
+            self.stats["chunk_chars"] += len(chunk.page_content)
+            if index.add(chunk.page_content):
+                kept.append(chunk)
+            else:
+                self.stats["duplicates"] += 1
+        return kept
+
+    def report(self):
+        stats = dict(self.stats)
+        mean_chunk = stats["chunk_chars"] / stats["chunks"] if stats["chunks"] else 0
+        stripped_chunks = round(stats["boilerplate_chars"] / mean_chunk) if mean_chunk else 0
+        stats["embeddings_saved"] = stats["duplicates"] + stripped_chunks
+        tracing.count("ingest_filter_duplicates", stats["duplicates"])
+        tracing.count("ingest_filter_embeddings_saved", stats["embeddings_saved"])
+        return stats
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import requests
+from typing import Type
+from langchain.tools import BaseTool
+from pydantic import BaseModel, Field
+
+alpha_vantage_api_key = os.environ.get("ALPHA_VANTAGE_API_KEY")
+ALPHA_VANTAGE_URL = "https://www.alphavantage.co/query"
+
+# 모델에 넘길 항목만 골라서 토큰을 줄임
+OVERVIEW_FIELDS = [
+    "Symbol",
+    "Name",
+    "Sector",
+    "Industry",
+    "MarketCapitalization",
+    "PERatio",
+    "PEGRatio",
+    "EPS",
+    "ProfitMargin",
+    "RevenueTTM",
+    "QuarterlyRevenueGrowthYOY",
+    "QuarterlyEarningsGrowthYOY",
+    "AnalystTargetPrice",
+    "52WeekHigh",
+    "52WeekLow",
+    "Beta",
+    "DividendYield",
+]
+INCOME_STATEMENT_FIELDS = [
+    "fiscalDateEnding",
+    "totalRevenue",
+    "grossProfit",
+    "operatingIncome",
+    "netIncome",
+    "ebitda",
+]
+INCOME_STATEMENT_YEARS = 3
+DESCRIPTION_CHARS = 300
+
+
+def compact(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def alpha_vantage_params(function, symbol):
+    return {"function": function, "symbol": symbol, "apikey": alpha_vantage_api_key}
+
+
+def alpha_vantage_error(response):
+    # 호출 한도 초과 등은 200 응답에 Note/Information/Error Message로 옴
+    for key in ("Error Message", "Note", "Information"):
+        if key in response:
+            return f"Alpha Vantage: {response[key]}"
+    return None
+
+
+def fetch_alpha_vantage(function, symbol):
+    r = requests.get(ALPHA_VANTAGE_URL, params=alpha_vantage_params(function, symbol))
+    return r.json()
+
+
+async def afetch_alpha_vantage(function, symbol):
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            ALPHA_VANTAGE_URL, params=alpha_vantage_params(function, symbol)
+        ) as r:
+            return await r.json(content_type=None)
+
+
+def summarize_overview(response):
+    summary = {field: response[field] for field in OVERVIEW_FIELDS if field in response}
+    if response.get("Description"):
+        summary["Description"] = response["Description"][:DESCRIPTION_CHARS]
+    return summary
+
+
+def summarize_income_statement(response):
+    return [
+        {field: report.get(field) for field in INCOME_STATEMENT_FIELDS}
+        for report in response.get("annualReports", [])[:INCOME_STATEMENT_YEARS]
+    ]
+
+
+class AlphaVantageTool(BaseTool):
+    """
+    Calls one Alpha Vantage function for a symbol and hands the model a compact
+    summary of the response. `_arun` uses aiohttp so the agent can fetch the
+    overview, income statement and prices of a symbol concurrently.
+    """
+
+    function: str = ""
+
+    def summarize(self, response):
+        return response
+
+    def _output(self, response):
+        return alpha_vantage_error(response) or compact(self.summarize(response))
+
+    def _run(self, symbol):
+        return self._output(fetch_alpha_vantage(self.function, symbol))
+
+    async def _arun(self, symbol):
+        return self._output(await afetch_alpha_vantage(self.function, symbol))
+
+
+class StockMarketSymbolSearchToolArgsSchema(BaseModel):
+    query: str = Field(
+        description="The query you will search for.Example query: Stock Market Symbol for Apple Company"
+    )
+
+
+class StockMarketSymbolSearchTool(BaseTool):
+    name = "StockMarketSymbolSearchTool"
+    description = """
+    Use this tool to find the stock market symbol for a company.
+    It takes a query as an argument.
+
+    """
+    args_schema: Type[
+        StockMarketSymbolSearchToolArgsSchema
+    ] = StockMarketSymbolSearchToolArgsSchema
+
+    def _run(self, query):
+        from langchain.utilities import DuckDuckGoSearchAPIWrapper
+
+        ddg = DuckDuckGoSearchAPIWrapper()
+        return ddg.run(query)
+
+    async def _arun(self, query):
+        # duckduckgo_search 클라이언트는 동기식이라 스레드에서 실행
+        return await asyncio.get_running_loop().run_in_executor(None, self._run, query)
+
+
+class CompanyOverviewArgsSchema(BaseModel):
+    symbol: str = Field(
+        description="Stock symbol of the company.Example: AAPL,TSLA",
+    )
+
+
+class CompanyOverviewTool(AlphaVantageTool):
+    name = "CompanyOverview"
+    description = """
+    Use this to get an overview of the financials of the company.
+    You should enter a stock symbol.
+    """
+    args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
+    function = "OVERVIEW"
+
+    def summarize(self, response):
+        return summarize_overview(response)
+
+
+class CompanyIncomeStatementTool(AlphaVantageTool):
+    name = "CompanyIncomeStatement"
+    description = """
+    Use this to get the income statement of a company.
+    You should enter a stock symbol.
+    """
+    args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
+    function = "INCOME_STATEMENT"
+
+    def summarize(self, response):
+        return summarize_income_statement(response)
+
+
+class CompanyStockPerformanceTool(AlphaVantageTool):
+    name = "CompanyStockPerformance"
+    description = """
+    Use this to get the weekly performance of a company stock: returns,
+    volatility, drawdown and moving averages.
+    You should enter a stock symbol.
+    """
+    args_schema: Type[CompanyOverviewArgsSchema] = CompanyOverviewArgsSchema
+    function = "TIME_SERIES_WEEKLY"
+
+    # 주가는 로컬 저장소에 쌓고 새로 고칠 때가 된 경우에만 받아옴
+    def _from_store(self, symbol, response=None):
+        from utils.prices import PriceStore, summarize
+
+        store = PriceStore()
+        if response is not None:
+            error = alpha_vantage_error(response)
+            if error is None:
+                store.update_weekly(symbol, response)
+            elif store.load(symbol) is None:
+                return error
+        return compact(summarize(symbol.upper(), store.load(symbol)))
+
+    def _needs_refresh(self, symbol):
+        from utils.prices import PriceStore
+
+        return PriceStore().needs_refresh(symbol)
+
+    def _run(self, symbol):
+        response = None
+        if self._needs_refresh(symbol):
+            response = fetch_alpha_vantage(self.function, symbol)
+        return self._from_store(symbol, response)
+
+    async def _arun(self, symbol):
+        response = None
+        if self._needs_refresh(symbol):
+            response = await afetch_alpha_vantage(self.function, symbol)
+        return self._from_store(symbol, response)
@@ -0,0 +1,446 @@
+"""
+Background job queue for ingestion (embedding uploads, transcribing videos).
+
+    python -m utils.jobs --workers 4
+
+Jobs live in a SQLite table shared by every Streamlit process, and worker
+processes claim them one at a time, so a large upload never blocks the script
+run that submitted it and several uploads are spread over the CPU cores.
+Workers report progress to the same table and the page polls it, and while a
+job runs its worker also writes a heartbeat every HEARTBEAT_INTERVAL seconds;
+a running job without one for STALE_AFTER seconds is claimed again, as its
+worker has died. Submitting a
+job whose key is already queued, running or done returns the existing job
+instead of starting a second one, unless the files a done job left behind
+(RESULT_PATHS) have since been deleted.
+
+Pages start a small pool inside the Streamlit process with `ensure_workers()`
+(JOB_WORKERS processes, 2 by default; set JOB_WORKERS=0 to turn it off and rely
+on workers started with the command above instead) and follow a job with
+`follow()`.
+"""
+import argparse
+import atexit
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import closing
+
+JOBS_DB = os.environ.get("JOBS_DB", "./.cache/jobs.sqlite")
+# Streamlit 프로세스 안에서 띄우는 워커 수, 0이면 띄우지 않고 따로 실행한 워커만 사용
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# 진행 보고와 별개로 실행 중인 워커가 주기적으로 남기는 신호
+HEARTBEAT_INTERVAL = 15
+# 이 시간 동안 heartbeat가 없는 running 작업은 워커가 죽은 것으로 보고 다시 할당
+STALE_AFTER = 120
+
+# kind -> "module:function", 워커 프로세스에서 처음 실행될 때 import
+HANDLERS = {
+    "index_document": "utils.ingest:index_document",
+    "transcribe_video": "utils.ingest:transcribe_video",
+}
+
+IN_FLIGHT = ("queued", "running")
+FINISHED = ("done", "failed", "cancelled")
+# 끝난 작업이 남긴 파일, 지워졌으면 같은 key로 제출할 때 작업을 다시 실행
+RESULT_PATHS = ("index_path", "transcript_path")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def result_missing(result):
+    return isinstance(result, dict) and any(key in result and not os.path.exists(result[key]) for key in RESULT_PATHS)
+
+
+class JobQueue:
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT,
+                    key TEXT,
+                    payload TEXT,
+                    status TEXT,
+                    progress REAL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    worker TEXT,
+                    created REAL,
+                    updated REAL,
+                    heartbeat REAL
+                )
+                """
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            if "heartbeat" not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (kind, key, status)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+    def _connect(self):
+        # autocommit, 트랜잭션이 필요한 곳에서만 BEGIN IMMEDIATE
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def submit(self, kind, payload, key=None):
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            if key is not None:
+                row = db.execute(
+                    "SELECT id, status, result FROM jobs"
+                    " WHERE kind = ? AND key = ? AND status IN (?, ?, ?)"
+                    " ORDER BY created DESC LIMIT 1",
+                    (kind, key, *IN_FLIGHT, "done"),
+                ).fetchone()
+                if row and not (row[1] == "done" and result_missing(json.loads(row[2] or "null"))):
+                    db.execute("COMMIT")
+                    return row[0]
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            db.execute(
+                "INSERT INTO jobs (id, kind, key, payload, status, created, updated)"
+                " VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, key, json.dumps(payload), now, now),
+            )
+            db.execute("COMMIT")
+        return job_id
+
+    def get(self, job_id):
+        jobs = self.get_many([job_id])
+        if not jobs:
+            raise KeyError(job_id)
+        return jobs[0]
+
+    def get_many(self, job_ids):
+        placeholders = ",".join("?" for _ in job_ids)
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, kind, key, status, progress, message, result, error,"
+                f" cancel_requested, created, updated FROM jobs WHERE id IN ({placeholders})",
+                list(job_ids),
+            ).fetchall()
+        jobs = {
+            row[0]: {
+                "id": row[0],
+                "kind": row[1],
+                "key": row[2],
+                "status": row[3],
+                "progress": row[4],
+                "message": row[5],
+                "result": json.loads(row[6]) if row[6] else None,
+                "error": row[7],
+                "cancel_requested": bool(row[8]),
+                "created": row[9],
+                "updated": row[10],
+            }
+            for row in rows
+        }
+        return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+    def cancel(self, job_id):
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE jobs SET status = 'cancelled', payload = NULL, updated = ?"
+                " WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            # 실행 중인 작업은 워커가 다음 진행 보고 때 멈춤
+            db.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+            db.execute("COMMIT")
+
+    def claim(self, worker):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT id, kind, payload FROM jobs"
+                " WHERE status = 'queued'"
+                " OR (status = 'running' AND COALESCE(heartbeat, updated) < ?)"
+                " ORDER BY created LIMIT 1",
+                (now - STALE_AFTER,),
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, updated = ?, heartbeat = ?"
+                " WHERE id = ?",
+                (worker, now, now, row[0]),
+            )
+            db.execute("COMMIT")
+        return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "worker": worker}
+
+    def heartbeat(self, job_id, worker):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker),
+            )
+
+    def report(self, job_id, progress, message=None):
+        """Stores progress and returns True if the job was asked to stop."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET progress = ?, message = COALESCE(?, message), updated = ?"
+                " WHERE id = ?",
+                (progress, message, time.time(), job_id),
+            )
+            row = db.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id, status, result=None, error=None):
+        # payload에는 API 키가 들어갈 수 있으므로 끝난 작업에서는 지움
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, payload = NULL, result = ?, error = ?,"
+                " progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END, updated = ?"
+                " WHERE id = ?",
+                (status, json.dumps(result), error, status, time.time(), job_id),
+            )
+
+    def stats(self):
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobContext:
+    """Passed to handlers so they can report progress and notice cancellation."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+
+    def progress(self, fraction, message=None):
+        if self.queue.report(self.job_id, max(0.0, min(fraction, 1.0)), message):
+            raise JobCancelled(self.job_id)
+
+
+_handlers = {}
+
+
+def get_handler(kind):
+    if kind not in _handlers:
+        module_name, function_name = HANDLERS[kind].split(":")
+        _handlers[kind] = getattr(importlib.import_module(module_name), function_name)
+    return _handlers[kind]
+
+
+def _beat(queue, job_id, worker, stop, interval):
+    while not stop.wait(interval):
+        try:
+            queue.heartbeat(job_id, worker)
+        except sqlite3.Error:
+            # DB가 잠시 잠겨 있어도 다음 주기에 다시 시도
+            traceback.print_exc()
+
+
+def run_job(queue, job):
+    from utils import rate_limit
+
+    context = JobContext(queue, job["id"])
+    # 진행 보고가 드문 긴 작업도 다른 워커가 다시 가져가지 않도록 heartbeat를 남김
+    stop = threading.Event()
+    beat = threading.Thread(
+        target=_beat,
+        args=(queue, job["id"], job["worker"], stop, HEARTBEAT_INTERVAL),
+        name="job-heartbeat",
+        daemon=True,
+    )
+    beat.start()
+    try:
+        # 백그라운드 작업의 OpenAI 호출은 채팅보다 뒤로 밀림
+        with rate_limit.priority(rate_limit.BACKGROUND):
+            result = get_handler(job["kind"])(context, job["payload"])
+    except JobCancelled:
+        queue.finish(job["id"], "cancelled")
+    except Exception as e:
+        traceback.print_exc()
+        queue.finish(job["id"], "failed", error=f"{type(e).__name__}: {e}")
+    else:
+        queue.finish(job["id"], "done", result=result)
+    finally:
+        stop.set()
+        beat.join()
+
+
+def run_worker(path=JOBS_DB, poll_interval=0.5, stop=None):
+    queue = JobQueue(path)
+    worker = f"{os.uname().nodename}:{os.getpid()}"
+    while stop is None or not stop.is_set():
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job)
+
+
+class WorkerPool:
+    def __init__(self, processes=None, path=JOBS_DB, poll_interval=0.5):
+        self.processes = processes or os.cpu_count() or 1
+        self.path = path
+        self.poll_interval = poll_interval
+        # Streamlit 프로세스의 스레드를 fork하지 않도록 spawn 사용
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.workers = []
+
+    def start(self):
+        for _ in range(self.processes):
+            # 핸들러 안에서 스플리터가 프로세스 풀을 쓸 수 있도록 daemon이 아닌 프로세스
+            process = self.context.Process(
+                target=run_worker,
+                args=(self.path, self.poll_interval, self.stop_event),
+                daemon=False,
+            )
+            process.start()
+            self.workers.append(process)
+        atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        for process in self.workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.workers = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def ensure_workers(processes=None):
+    """
+    Starts the in-process worker pool once per Streamlit process, with
+    JOB_WORKERS processes (2 by default). With JOB_WORKERS=0 no pool is
+    started and jobs wait for workers run with `python -m utils.jobs`.
+    """
+    global _pool
+    if processes is None:
+        processes = JOB_WORKERS
+    if processes == 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(processes).start()
+    return _pool
+
+
+def follow(kind, payload, key, label, poll_interval=0.5):
+    """
+    Submits the job once per session and returns its result, or None if it
+    failed or was cancelled. While the job runs it shows its progress with a
+    cancel button and reruns the script every `poll_interval` seconds instead
+    of returning, so nothing below the call runs until the job has finished.
+    """
+    return follow_many(kind, [(key, payload)], label, poll_interval)[0]
+
+
+def follow_many(kind, jobs, label, poll_interval=0.5):
+    """
+    Same as `follow` for a list of (key, payload) jobs that run in parallel
+    behind one progress bar. Returns one result (or None) per job.
+    """
+    import streamlit as st
+    from utils import tracing
+
+    queue = JobQueue()
+    ensure_workers()
+    state_keys = [f"job:{kind}:{key}" for key, _ in jobs]
+    for state_key, (key, payload) in zip(state_keys, jobs):
+        if state_key not in st.session_state:
+            st.session_state[state_key] = queue.submit(kind, payload, key=key)
+    job_ids = [st.session_state[state_key] for state_key in state_keys]
+    known = {
+        job["id"]
+        for job in queue.get_many(job_ids)
+        if not (job["status"] == "done" and result_missing(job["result"]))
+    }
+    for i, (key, payload) in enumerate(jobs):
+        # 작업 DB나 결과 파일이 지워졌으면 다시 제출
+        if job_ids[i] not in known:
+            job_ids[i] = queue.submit(kind, payload, key=key)
+            st.session_state[state_keys[i]] = job_ids[i]
+
+    current = queue.get_many(job_ids)
+    if any(job["status"] not in FINISHED for job in current):
+        # 실행마다 한 번만 상태를 읽어 그리고 잠시 뒤 다시 실행, 그 사이 스크립트 스레드는 비어 있음
+        bar = st.empty()
+        # 버튼을 누르면 다시 실행되면서 작업이 취소됨
+        if st.button("Cancel", key=f"cancel:{job_ids[0]}"):
+            for job_id in job_ids:
+                queue.cancel(job_id)
+            current = queue.get_many(job_ids)
+        if any(job["cancel_requested"] for job in current):
+            text = "Cancelling..."
+        elif len(current) == 1:
+            text = current[0]["message"] or label
+        else:
+            finished = sum(job["status"] in FINISHED for job in current)
+            text = f"{label} ({finished}/{len(current)})"
+        bar.progress(sum(job["progress"] for job in current) / len(current), text=text)
+        time.sleep(poll_interval)
+        st.rerun()
+
+    # 기다린 시간은 작업 생성부터 마지막 갱신까지로 기록
+    with tracing.span(kind, jobs=len(job_ids)) as span:
+        span["attributes"]["failed"] = sum(job["status"] != "done" for job in current)
+        span["attributes"]["seconds"] = max(job["updated"] for job in current) - min(
+            job["created"] for job in current
+        )
+
+    unfinished = [
+        (state_key, job)
+        for state_key, job in zip(state_keys, current)
+        if job["status"] != "done"
+    ]
+    for _, job in unfinished:
+        if job["status"] == "failed":
+            st.error(job["error"])
+        else:
+            st.info("The job was cancelled.")
+    if unfinished and st.button("Retry", key=f"retry:{job_ids[0]}"):
+        for state_key, _ in unfinished:
+            del st.session_state[state_key]
+        st.rerun()
+    return [job["result"] if job["status"] == "done" else None for job in current]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=JOBS_DB)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    args = parser.parse_args()
+    pool = WorkerPool(args.workers, args.db, args.poll_interval).start()
+    try:
+        for process in pool.workers:
+            process.join()
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,295 @@
+"""
+Exact LLM response cache shared by every page.
+
+    python -m utils.llm_cache stats
+    python -m utils.llm_cache clear
+
+Responses are keyed by the model's configuration and call parameters (model,
+temperature, functions, function_call, stop...) together with the full
+serialized messages, the same strings langchain hands to its global llm cache.
+They are stored in one SQLite table and the least recently used ones are
+dropped once the cache grows past `max_bytes`.
+
+LLM_CACHE_MODE selects how the cache is used:
+
+    cache   (default) reuse and store responses in LLM_CACHE_PATH
+    record  same as cache, and also write every response to LLM_CASSETTE
+    replay  answer only from LLM_CASSETTE; a prompt that was not recorded
+            raises CassetteMiss instead of calling the model
+    off     no caching
+
+A cassette is a JSON file, so a recorded session can be checked in and the
+app or a benchmark replayed offline with the same answers every time.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Optional, Sequence
+from langchain.load.dump import dumps
+from langchain.load.load import loads
+from langchain.schema import BaseCache
+from langchain.schema.messages import AIMessage, AIMessageChunk
+from langchain.schema.output import ChatGeneration
+
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "cache")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "./.cache/llm.sqlite")
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 << 20))
+LLM_CASSETTE = os.environ.get("LLM_CASSETTE", "./.cache/llm_cassette.json")
+MODES = ["cache", "record", "replay", "off"]
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def cache_key(prompt, llm_string):
+    return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class ResponseStore:
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                size INTEGER,
+                last_used REAL
+            ) WITHOUT ROWID
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.executemany(
+            "INSERT OR IGNORE INTO meta VALUES (?, 0)", [("bytes",), ("hits",), ("misses",)]
+        )
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.db.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+            self._add("hits" if row is not None else "misses", 1)
+            self.db.commit()
+        return row[0] if row is not None else None
+
+    def put(self, key, response):
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO responses VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._add("bytes", size if cursor.rowcount else 0)
+            self.db.commit()
+            self._evict()
+
+    def _evict(self, low_water=0.9):
+        # 가장 오래 쓰이지 않은 응답부터 지워 max_bytes의 90%까지 줄임
+        excess = self.nbytes - self.max_bytes
+        if excess <= 0:
+            return
+        excess += self.max_bytes * (1 - low_water)
+        evicted = []
+        freed = 0
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if freed >= excess:
+                break
+            evicted.append((key,))
+            freed += size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self._add("bytes", -freed)
+        self.db.commit()
+
+    def _add(self, name, value):
+        self.db.execute(
+            "UPDATE meta SET value = MAX(value + ?, 0) WHERE name = ?", (value, name)
+        )
+
+    def _meta(self, name):
+        return self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    @property
+    def nbytes(self):
+        return self._meta("bytes")
+
+    def stats(self):
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            hits, misses = self._meta("hits"), self._meta("misses")
+            return {
+                "entries": entries,
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.execute("UPDATE meta SET value = 0")
+            self.db.commit()
+
+
+class Cassette:
+    """
+    Recorded responses in a JSON file, `{key: {"llm", "prompt", "generations"}}`.
+    The prompt and model strings are kept next to each response so a recording
+    can be reviewed and diffed; only the key is used for lookups.
+    """
+
+    def __init__(self, path=LLM_CASSETTE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        return json.dumps(entry["generations"]) if entry is not None else None
+
+    def put(self, key, prompt, llm_string, response):
+        with self.lock:
+            self.entries[key] = {
+                "llm": llm_string,
+                "prompt": prompt,
+                "generations": json.loads(response),
+            }
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, suffix=".json", delete=False, encoding="utf-8"
+        ) as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(f.name, self.path)
+
+
+class LLMCache(BaseCache):
+    """
+    langchain llm cache backed by a ResponseStore and, in record/replay mode,
+    a Cassette. Hits and misses are counted on the current tracing span.
+    """
+
+    def __init__(
+        self,
+        mode=LLM_CACHE_MODE,
+        path=LLM_CACHE_PATH,
+        max_bytes=LLM_CACHE_MAX_BYTES,
+        cassette=LLM_CASSETTE,
+    ):
+        if mode not in MODES or mode == "off":
+            raise ValueError(f"Unknown llm cache mode: {mode}")
+        self.mode = mode
+        # replay는 녹화된 응답만 사용해야 결과가 항상 같음
+        self.store = ResponseStore(path, max_bytes) if mode != "replay" else None
+        self.cassette = Cassette(cassette) if mode in ("record", "replay") else None
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Any]]:
+        from utils import tracing
+
+        key = cache_key(prompt, llm_string)
+        response = self.cassette.get(key) if self.cassette is not None else None
+        if response is None and self.mode == "replay":
+            raise CassetteMiss(
+                f"No recorded response for this prompt in {self.cassette.path}. "
+                "Run with LLM_CACHE_MODE=record to record it."
+            )
+        if response is None:
+            response = self.store.get(key)
+            if response is not None and self.mode == "record":
+                self.cassette.put(key, prompt, llm_string, response)
+        tracing.count("llm_cache_hits" if response is not None else "llm_cache_misses")
+        return loads(response) if response is not None else None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Any]) -> None:
+        key = cache_key(prompt, llm_string)
+        response = dumps(list(return_val))
+        self.store.put(key, response)
+        if self.mode == "record":
+            self.cassette.put(key, prompt, llm_string, response)
+
+    def clear(self, **kwargs: Any) -> None:
+        if self.store is not None:
+            self.store.clear()
+
+
+def install(mode=LLM_CACHE_MODE, **params):
+    """Sets langchain's global llm cache for this process and returns it."""
+    from langchain.globals import set_llm_cache
+
+    cache = LLMCache(mode, **params) if mode != "off" else None
+    set_llm_cache(cache)
+    return cache
+
+
+def stream(model, messages, config=None, **kwargs):
+    """
+    `model.stream(messages, config, **kwargs)` through the global llm cache.
+    BaseChatModel.stream does not consult the cache, so a cached response is
+    yielded as a single chunk and a streamed one is stored once it completes.
+    """
+    from langchain.globals import get_llm_cache
+
+    cache = get_llm_cache()
+    if cache is None:
+        yield from model.stream(messages, config, **kwargs)
+        return
+    prompt = dumps(messages)
+    llm_string = model._get_llm_string(**kwargs)
+    generations = cache.lookup(prompt, llm_string)
+    if generations:
+        message = generations[0].message
+        yield AIMessageChunk(content=message.content, additional_kwargs=message.additional_kwargs)
+        return
+    message = None
+    for chunk in model.stream(messages, config, **kwargs):
+        message = chunk if message is None else message + chunk
+        yield chunk
+    if message is not None:
+        cache.update(
+            prompt,
+            llm_string,
+            [
+                ChatGeneration(
+                    message=AIMessage(
+                        content=message.content, additional_kwargs=message.additional_kwargs
+                    )
+                )
+            ],
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", default=LLM_CACHE_PATH)
+    args = parser.parse_args()
+    store = ResponseStore(args.path)
+    if args.command == "clear":
+        store.clear()
+    print(store.stats())
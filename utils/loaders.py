@@ -0,0 +1,105 @@
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+from langchain.schema import Document
+
+# 텍스트가 거의 없는 PDF 페이지는 스캔본으로 보고 Unstructured로 처리
+MIN_PDF_CHARS_PER_PAGE = 20
+PDF_SAMPLE_PAGES = 3
+TEXT_BLOCK_SIZE = 64 * 1024
+DOCX_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def iter_text(file_path):
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        block = []
+        size = 0
+        for line in f:
+            block.append(line)
+            size += len(line)
+            if size >= TEXT_BLOCK_SIZE:
+                yield Document(page_content="".join(block), metadata={"source": file_path})
+                block = []
+                size = 0
+        if block:
+            yield Document(page_content="".join(block), metadata={"source": file_path})
+
+
+def iter_pdf(file_path):
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    sample = [page.extract_text() or "" for page in reader.pages[:PDF_SAMPLE_PAGES]]
+    if sum(len(text.strip()) for text in sample) < MIN_PDF_CHARS_PER_PAGE * max(
+        len(sample), 1
+    ):
+        yield from iter_unstructured(file_path)
+        return
+    for i, page in enumerate(reader.pages):
+        text = sample[i] if i < len(sample) else page.extract_text() or ""
+        if text.strip():
+            yield Document(page_content=text, metadata={"source": file_path, "page": i})
+
+
+def iter_docx(file_path):
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open("word/document.xml") as f:
+            paragraphs = []
+            for _, element in ET.iterparse(f):
+                if element.tag == f"{DOCX_NS}p":
+                    text = "".join(node.text or "" for node in element.iter(f"{DOCX_NS}t"))
+                    if text:
+                        paragraphs.append(text)
+                    element.clear()
+    yield Document(page_content="\n".join(paragraphs), metadata={"source": file_path})
+
+
+def iter_unstructured(file_path):
+    # unstructured는 무거운 의존성을 불러오므로 필요할 때만 import
+    from langchain.document_loaders import UnstructuredFileLoader
+
+    yield from UnstructuredFileLoader(file_path).load()
+
+
+FAST_LOADERS = {
+    ".txt": iter_text,
+    ".md": iter_text,
+    ".pdf": iter_pdf,
+    ".docx": iter_docx,
+}
+
+
+def iter_pages(file_path):
+    """
+    Yields the file's pages as Documents using a lightweight parser for the
+    extension, falling back to UnstructuredFileLoader for other formats,
+    scanned PDFs and files the fast parser can't read.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    loader = FAST_LOADERS.get(extension, iter_unstructured)
+    loaded = False
+    try:
+        for page in loader(file_path):
+            loaded = True
+            yield page
+    except Exception:
+        if loaded or loader is iter_unstructured:
+            raise
+        yield from iter_unstructured(file_path)
+
+
+def load_and_split(file_path, text_splitter, ingest_filter=None):
+    """
+    Splits the pages of a file. With an IngestFilter, repeated lines are
+    stripped from the pages and near-duplicate chunks dropped.
+    """
+    pages = iter_pages(file_path)
+    if ingest_filter is not None:
+        pages = ingest_filter.strip(pages)
+    if hasattr(text_splitter, "split_pages"):
+        docs = list(text_splitter.split_pages(pages))
+    else:
+        docs = []
+        for page in pages:
+            docs.extend(text_splitter.split_documents([page]))
+    return ingest_filter.dedupe(docs) if ingest_filter is not None else docs
@@ -0,0 +1,145 @@
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+from utils.tokens import count_tokens
+
+# 요약은 요청 경로 밖에서 하나의 백그라운드 스레드로 처리
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+
+SUMMARY_PROMPT = """Progressively summarize the lines of conversation provided, adding onto the previous summary returning a new summary.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:"""
+
+
+def _words(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+class ConversationMemory:
+    """
+    Drop-in replacement for ConversationSummaryBufferMemory(return_messages=True).
+
+    Messages are stored with their token counts so the buffer total is kept
+    incrementally instead of being recounted on every turn.
+
+    - "window": keep the most recent messages within max_token_limit. No LLM calls.
+    - "retrieval": the recent window plus the older turns that share the most
+      words with the current question. No LLM calls. Only the last
+      max_archive_turns turns are kept for this, oldest dropped first.
+    - "summary": messages pushed out of the window are summarized by `llm` on a
+      background thread; until that finishes they are still returned verbatim.
+    """
+
+    modes = ("summary", "window", "retrieval")
+
+    def __init__(
+        self, mode="window", llm=None, max_token_limit=500, retrieval_k=2, max_archive_turns=100
+    ):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown memory mode: {mode}")
+        if mode == "summary" and llm is None:
+            raise ValueError("The summary memory mode needs an llm.")
+        self.mode = mode
+        self.llm = llm
+        self.max_token_limit = max_token_limit
+        self.retrieval_k = retrieval_k
+        self.max_archive_turns = max_archive_turns
+        self.buffer = deque()
+        self.buffer_tokens = 0
+        # 메시지는 턴(Human/AI 두 개) 단위로 들어오고, 단어 집합은 턴마다 한 번만 계산
+        self.archive = deque(maxlen=2 * max_archive_turns)
+        self.archive_words = deque(maxlen=max_archive_turns)
+        self.pending = []
+        self.summary = ""
+        self.future = None
+        self.summarizing = 0
+
+    def save_context(self, inputs, outputs):
+        self._add(HumanMessage(content=inputs["input"]))
+        self._add(AIMessage(content=outputs["output"]))
+        self._prune()
+
+    def load_memory_variables(self, inputs):
+        self._collect_summary()
+        history = []
+        if self.summary:
+            history.append(SystemMessage(content=self.summary))
+        if self.mode == "retrieval" and inputs.get("input"):
+            history.extend(self._relevant_turns(inputs["input"]))
+        history.extend(message for message, _ in self.pending)
+        history.extend(message for message, _ in self.buffer)
+        return {"history": history}
+
+    def clear(self):
+        self.buffer.clear()
+        self.buffer_tokens = 0
+        self.archive.clear()
+        self.archive_words.clear()
+        self.pending = []
+        self.summary = ""
+        self.future = None
+
+    def _add(self, message):
+        tokens = count_tokens(message.content)
+        self.buffer.append((message, tokens))
+        self.buffer_tokens += tokens
+
+    def _prune(self):
+        pruned = []
+        # Human/AI 한 턴씩 함께 빼서 archive가 항상 턴 단위로 짝을 이루게 함
+        while self.buffer_tokens > self.max_token_limit and len(self.buffer) > 2:
+            for _ in range(2):
+                message, tokens = self.buffer.popleft()
+                self.buffer_tokens -= tokens
+                pruned.append((message, tokens))
+        if not pruned:
+            return
+        if self.mode == "retrieval":
+            self.archive.extend(pruned)
+            for i in range(0, len(pruned), 2):
+                self.archive_words.append(
+                    _words(" ".join(message.content for message, _ in pruned[i : i + 2]))
+                )
+        elif self.mode == "summary":
+            self.pending.extend(pruned)
+            self._schedule_summary()
+
+    def _schedule_summary(self):
+        if self.future is not None or not self.pending:
+            return
+        messages = [message for message, _ in self.pending]
+        self.summarizing = len(messages)
+        self.future = _summary_executor.submit(self._summarize, self.summary, messages)
+
+    def _summarize(self, summary, messages):
+        lines = "\n".join(
+            f"{'Human' if isinstance(message, HumanMessage) else 'AI'}: {message.content}"
+            for message in messages
+        )
+        return self.llm.predict(SUMMARY_PROMPT.format(summary=summary, lines=lines))
+
+    def _collect_summary(self):
+        if self.future is None or not self.future.done():
+            return
+        future, self.future = self.future, None
+        try:
+            self.summary = future.result()
+        except Exception:
+            # 요약에 실패하면 메시지를 그대로 두고 다음 턴에 다시 시도
+            self._schedule_summary()
+            return
+        self.pending = self.pending[self.summarizing :]
+        self._schedule_summary()
+
+    def _relevant_turns(self, question):
+        query = _words(question)
+        scored = [(len(query & words), i) for i, words in enumerate(self.archive_words)]
+        best = sorted(i for score, i in sorted(scored, reverse=True)[: self.retrieval_k] if score)
+        return [self.archive[j][0] for i in best for j in (2 * i, 2 * i + 1)]
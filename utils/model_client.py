@@ -0,0 +1,429 @@
+"""
+Shared client layer for the OpenAI API.
+
+Every chat, embedding and Assistants call made through resources (or
+`openai_client`) goes through an Operation that:
+
+- waits for the model's rate limiter (utils/rate_limit.py),
+- shares one keep-alive connection pool per process instead of one per
+  model object,
+- enforces the operation's deadline (OPERATIONS), or the model's shorter
+  `request_timeout`, on the whole call, streamed responses included: every
+  request is sent with the time left as its HTTP timeout, so a call the
+  caller gave up on (or a losing duplicate) stops instead of holding a pool
+  thread, and one slow upstream call cannot stall a Streamlit run,
+- for idempotent operations (embeddings) sends one duplicate request when
+  the first has not answered after the operation's observed p95 and uses
+  whichever answers first, as long as the rate limiter has room for it,
+- records a latency histogram per operation (`stats()`).
+
+The async clients keep their own pools: httpx async connections belong to
+the event loop that opened them, so InvestorGPT runs every agent on one
+long-lived background loop.
+"""
+import asyncio
+import bisect
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures import wait
+from langchain.chat_models import ChatOpenAI
+from langchain.embeddings import OpenAIEmbeddings
+from langchain.pydantic_v1 import root_validator
+from utils import rate_limit, tracing
+
+MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 64))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 16))
+KEEPALIVE_EXPIRY = 60
+# deadline: 재시도까지 포함한 전체 호출 시간 한도(초), 스트림은 끝까지 읽는 시간 포함
+# hedge_after: p95를 알기 전까지 쓰는 중복 요청 기준(초)
+OPERATIONS = {
+    "chat": {"deadline": 90, "hedge": False},
+    "chat_stream": {"deadline": 90, "hedge": False},
+    "embeddings": {"deadline": 30, "hedge": True, "hedge_after": 2.0},
+    "assistants": {"deadline": 30, "hedge": False},
+}
+# p95를 믿을 수 있을 만큼 쌓이기 전에는 hedge_after 사용
+HEDGE_MIN_SAMPLES = 50
+
+
+class Histogram:
+    """Latency histogram with buckets growing by sqrt(2) from 5 ms to ~4 min."""
+
+    BOUNDS = [0.005 * 2 ** (i / 2) for i in range(32)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.BOUNDS[min(i, len(self.BOUNDS) - 1)]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_s": self.total / self.count if self.count else None,
+            "p50_s": self.quantile(0.5),
+            "p95_s": self.quantile(0.95),
+            "p99_s": self.quantile(0.99),
+        }
+
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_executor = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix="model-client")
+_http_client = None
+
+
+def observe(operation, seconds):
+    with _lock:
+        _histograms.setdefault(operation, Histogram()).observe(seconds)
+
+
+def _count(operation, name):
+    with _lock:
+        counters = _counters.setdefault(
+            operation, {"hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+        )
+        counters[name] += 1
+
+
+def stats():
+    with _lock:
+        return {
+            operation: {**histogram.summary(), **_counters.get(operation, {})}
+            for operation, histogram in _histograms.items()
+        }
+
+
+def deadline_exceeded(operation, deadline):
+    _count(operation, "deadline_exceeded")
+    return TimeoutError(f"{operation} call exceeded its {deadline}s deadline")
+
+
+def hedge_after(operation):
+    with _lock:
+        histogram = _histograms.get(operation)
+        if histogram is None or histogram.count < HEDGE_MIN_SAMPLES:
+            return OPERATIONS[operation]["hedge_after"]
+        return histogram.quantile(0.95)
+
+
+def _remaining(kwargs, deadline, operation, seconds):
+    """`kwargs` with the time left before `deadline` as the request timeout."""
+    left = deadline - time.perf_counter()
+    if left <= 0:
+        raise deadline_exceeded(operation, seconds)
+    timeout = kwargs.get("timeout")
+    if isinstance(timeout, (int, float)):
+        left = min(left, timeout)
+    return {**kwargs, "timeout": left}
+
+
+class DeadlineStream:
+    """Iterates a streamed response and closes it once `deadline` passes."""
+
+    def __init__(self, stream, deadline, operation, seconds):
+        self.stream = stream
+        self.deadline = deadline
+        self.operation = operation
+        self.seconds = seconds
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                if time.perf_counter() > self.deadline:
+                    raise deadline_exceeded(self.operation, self.seconds)
+                yield chunk
+        finally:
+            _close(self.stream)
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                if time.perf_counter() > self.deadline:
+                    raise deadline_exceeded(self.operation, self.seconds)
+                yield chunk
+        finally:
+            await _aclose(self.stream)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _close(stream):
+    # openai Stream은 close() 또는 response.close()로 연결을 돌려줌
+    close = getattr(stream, "close", None) or getattr(
+        getattr(stream, "response", None), "close", None
+    )
+    if close is not None:
+        close()
+
+
+async def _aclose(stream):
+    close = getattr(stream, "close", None) or getattr(
+        getattr(stream, "response", None), "aclose", None
+    )
+    if close is not None:
+        result = close()
+        if asyncio.iscoroutine(result):
+            await result
+
+
+def http_client(**params):
+    """The process-wide httpx.Client (keep-alive pool) for openai.OpenAI."""
+    global _http_client
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    if params:
+        return httpx.Client(limits=limits, **params)
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=limits)
+        return _http_client
+
+
+class Operation:
+    """
+    Wraps an openai resource (`chat.completions`, `embeddings`) so that every
+    `create` call goes through the limiter, deadline, hedging and histogram
+    of its operation. `estimate` returns the tokens to charge for a call.
+    `timeout` is the model's request_timeout (seconds); a call gets the
+    shorter of it and the operation's deadline.
+    """
+
+    def __init__(self, resource, operation, estimate, timeout=None):
+        self.resource = resource
+        self.operation = operation
+        self.estimate = estimate
+        self.timeout = timeout
+
+    def _name(self, kwargs):
+        return f"{self.operation}_stream" if kwargs.get("stream") else self.operation
+
+    def _deadline(self, operation):
+        deadline = OPERATIONS[operation]["deadline"]
+        # 튜플/httpx.Timeout 형태의 request_timeout은 연결 단위라 전체 한도로 쓰지 않음
+        if isinstance(self.timeout, (int, float)):
+            return min(self.timeout, deadline)
+        return deadline
+
+    def create(self, **kwargs):
+        operation = self._name(kwargs)
+        config = OPERATIONS[operation]
+        limiter = rate_limit.limiter(kwargs["model"])
+        tokens = self.estimate(kwargs)
+        limiter.acquire(tokens)
+        seconds = self._deadline(operation)
+        start = time.perf_counter()
+        deadline = start + seconds
+        primary = self._submit(kwargs, deadline, operation, seconds)
+        futures = [primary]
+        try:
+            if config["hedge"]:
+                try:
+                    response = primary.result(timeout=min(hedge_after(operation), seconds))
+                except FutureTimeout:
+                    # 추가 요청은 한도에 여유가 있을 때만 보냄
+                    if limiter.try_acquire(tokens):
+                        _count(operation, "hedged")
+                        tracing.add_event("hedged_request", operation=operation)
+                        futures.append(self._submit(kwargs, deadline, operation, seconds))
+                    response = self._first(futures, deadline, seconds, operation)
+            else:
+                response = self._first(futures, deadline, seconds, operation)
+        except Exception as e:
+            if rate_limit.is_rate_limit_error(e):
+                limiter.drain()
+            raise
+        finally:
+            # 아직 시작하지 않은 요청은 보내지 않음 (시작한 요청은 남은 시간 timeout으로 끝남)
+            for future in futures:
+                future.cancel()
+        observe(operation, time.perf_counter() - start)
+        if kwargs.get("stream"):
+            return DeadlineStream(response, deadline, operation, seconds)
+        limiter.settle(tokens, rate_limit.usage_tokens(response))
+        return response
+
+    def _submit(self, kwargs, deadline, operation, seconds):
+        # timeout은 스레드가 실제로 요청을 보낼 때의 남은 시간으로 계산
+        def call():
+            return self.resource.create(**_remaining(kwargs, deadline, operation, seconds))
+
+        return _executor.submit(call)
+
+    def _first(self, futures, deadline, seconds, operation):
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=max(deadline - time.perf_counter(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                raise deadline_exceeded(operation, seconds)
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        _count(operation, "hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+class AsyncOperation(Operation):
+    async def create(self, **kwargs):
+        operation = self._name(kwargs)
+        config = OPERATIONS[operation]
+        limiter = rate_limit.limiter(kwargs["model"])
+        tokens = self.estimate(kwargs)
+        await limiter.aacquire(tokens)
+        seconds = self._deadline(operation)
+        start = time.perf_counter()
+        deadline = start + seconds
+        primary = asyncio.ensure_future(
+            self.resource.create(**_remaining(kwargs, deadline, operation, seconds))
+        )
+        tasks = [primary]
+        try:
+            if config["hedge"]:
+                done, _ = await asyncio.wait(
+                    tasks, timeout=min(hedge_after(operation), seconds)
+                )
+                if not done and limiter.try_acquire(tokens):
+                    _count(operation, "hedged")
+                    tracing.add_event("hedged_request", operation=operation)
+                    tasks.append(
+                        asyncio.ensure_future(
+                            self.resource.create(**_remaining(kwargs, deadline, operation, seconds))
+                        )
+                    )
+            response = await self._afirst(tasks, deadline, seconds, operation)
+        except Exception as e:
+            if rate_limit.is_rate_limit_error(e):
+                limiter.drain()
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+        observe(operation, time.perf_counter() - start)
+        if kwargs.get("stream"):
+            return DeadlineStream(response, deadline, operation, seconds)
+        limiter.settle(tokens, rate_limit.usage_tokens(response))
+        return response
+
+    async def _afirst(self, tasks, deadline, seconds, operation):
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=max(deadline - time.perf_counter(), 0),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                raise deadline_exceeded(operation, seconds)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        _count(operation, "hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+
+
+def _client_params(values):
+    return {
+        "api_key": values["openai_api_key"],
+        "organization": values["openai_organization"],
+        "base_url": values["openai_api_base"],
+        "timeout": values["request_timeout"],
+        "max_retries": values["max_retries"],
+        "default_headers": values["default_headers"],
+        "default_query": values["default_query"],
+    }
+
+
+class SharedChatOpenAI(ChatOpenAI):
+    @root_validator()
+    def share_clients(cls, values):
+        # openai 0.x는 client가 모듈이라 감싸지 않음
+        if values.get("async_client") is not None:
+            import openai
+
+            client = openai.OpenAI(**_client_params(values), http_client=http_client())
+            # request_timeout(라우터 티어의 timeout)이 작업 기본 한도보다 짧으면 그것을 따름
+            timeout = values["request_timeout"]
+            values["client"] = Operation(
+                client.chat.completions, "chat", rate_limit.chat_tokens, timeout
+            )
+            values["async_client"] = AsyncOperation(
+                values["async_client"], "chat", rate_limit.chat_tokens, timeout
+            )
+        return values
+
+
+class SharedOpenAIEmbeddings(OpenAIEmbeddings):
+    @root_validator()
+    def share_clients(cls, values):
+        if values.get("async_client") is not None:
+            import openai
+
+            client = openai.OpenAI(**_client_params(values), http_client=http_client())
+            timeout = values["request_timeout"]
+            values["client"] = Operation(
+                client.embeddings, "embeddings", rate_limit.embedding_tokens, timeout
+            )
+            values["async_client"] = AsyncOperation(
+                values["async_client"], "embeddings", rate_limit.embedding_tokens, timeout
+            )
+        return values
+
+
+def openai_client(api_key, bucket="assistants"):
+    """
+    openai.OpenAI for APIs without a model per call (Assistants): requests
+    count against `bucket`, share the keep-alive pool settings and are timed
+    as the "assistants" operation.
+    """
+    import openai
+
+    requests = {}
+
+    def on_request(request):
+        rate_limit.limiter(bucket).acquire()
+        requests[id(request)] = time.perf_counter()
+
+    def on_response(response):
+        start = requests.pop(id(response.request), None)
+        if start is not None:
+            observe("assistants", time.perf_counter() - start)
+
+    client = http_client(
+        event_hooks={"request": [on_request], "response": [on_response]},
+        timeout=OPERATIONS["assistants"]["deadline"],
+    )
+    return openai.OpenAI(api_key=api_key, http_client=client)
@@ -0,0 +1,237 @@
+"""
+Runtime manager for the local Ollama server behind PrivateGPT.
+
+- `warm_up()` loads the model in the background as soon as the page opens, so
+  the first question does not pay the model load time.
+- Every request carries `keep_alive`, so the model and its KV cache stay
+  resident between questions instead of being unloaded after Ollama's default
+  five idle minutes.
+- Requests share one pooled requests.Session (keep-alive connections).
+- At most `parallel` requests (the server's OLLAMA_NUM_PARALLEL) are sent at
+  once; the rest wait here, and the queue depth and wait times are tracked.
+- Ollama reloads a model whenever its options (num_ctx, ...) change and
+  otherwise reuses the KV cache of the longest prompt prefix it has already
+  evaluated. The model's options are fixed per runtime and prompts keep the
+  stable part (instructions, then context) first and the question last, so
+  follow-up questions only evaluate the tokens that changed.
+  `prompt_eval_count` of each response shows how many tokens were evaluated.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import closing, contextmanager
+from typing import Any, Iterator, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from langchain.chat_models import ChatOllama
+from utils import tracing
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 1))
+# 모델 로딩은 오래 걸릴 수 있으므로 연결에만 timeout
+CONNECT_TIMEOUT = 10
+
+
+class OllamaRuntime:
+    def __init__(self, base_url, model, keep_alive=OLLAMA_KEEP_ALIVE, parallel=OLLAMA_NUM_PARALLEL):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.parallel = parallel
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(parallel * 2, 4))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.lock = threading.Lock()
+        self.warm = threading.Event()
+        self.warm_up_thread = None
+        self.metrics = {
+            "requests": 0,
+            "active": 0,
+            "waiting": 0,
+            "max_waiting": 0,
+            "queued": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "loads": 0,
+            "load_seconds": 0.0,
+            "prompt_eval_tokens": 0,
+            "errors": 0,
+        }
+
+    def warm_up(self, options=None, background=True):
+        """
+        Loads the model once; later calls return immediately. `options` must
+        be the ones the requests will use, or Ollama loads the model again.
+        """
+        with self.lock:
+            if self.warm_up_thread is None:
+                self.warm_up_thread = threading.Thread(
+                    target=self._warm_up, args=(options,), daemon=True
+                )
+                self.warm_up_thread.start()
+            thread = self.warm_up_thread
+        if not background:
+            thread.join()
+
+    def _warm_up(self, options):
+        # 프롬프트 없이 호출하면 Ollama가 모델만 메모리에 올림
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": "",
+                    "options": options or {},
+                    "stream": False,
+                    "keep_alive": self.keep_alive,
+                },
+                timeout=(CONNECT_TIMEOUT, None),
+            )
+            response.raise_for_status()
+            self._record(response.json())
+            self.warm.set()
+        except requests.RequestException:
+            # 다음 warm_up 호출에서 다시 시도
+            with self.lock:
+                self.metrics["errors"] += 1
+                self.warm_up_thread = None
+
+    @contextmanager
+    def admit(self):
+        start = time.perf_counter()
+        with self.lock:
+            self.metrics["waiting"] += 1
+            self.metrics["max_waiting"] = max(self.metrics["max_waiting"], self.metrics["waiting"])
+        queued = not self.slots.acquire(blocking=False)
+        if queued:
+            self.slots.acquire()
+        waited = time.perf_counter() - start
+        with self.lock:
+            self.metrics["waiting"] -= 1
+            self.metrics["active"] += 1
+            self.metrics["requests"] += 1
+            self.metrics["queued"] += int(queued)
+            self.metrics["wait_seconds"] += waited
+            self.metrics["max_wait_seconds"] = max(self.metrics["max_wait_seconds"], waited)
+        try:
+            tracing.add_event("ollama_admitted", waited=waited, queued=queued)
+            yield
+        finally:
+            with self.lock:
+                self.metrics["active"] -= 1
+            self.slots.release()
+
+    def generate(self, payload):
+        """
+        Streams the response lines of /api/generate. The slot is held until
+        the stream has been read to the end (or closed).
+        """
+        with self.admit():
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"keep_alive": self.keep_alive, **payload},
+                stream=True,
+                timeout=(CONNECT_TIMEOUT, None),
+            )
+            with closing(response):
+                response.encoding = "utf-8"
+                if response.status_code != 200:
+                    with self.lock:
+                        self.metrics["errors"] += 1
+                    optional_detail = response.json().get("error")
+                    raise ValueError(
+                        f"Ollama call failed with status code {response.status_code}."
+                        f" Details: {optional_detail}"
+                    )
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and '"done":true' in line.replace(" ", ""):
+                        self._record(json.loads(line))
+                    yield line
+        self.warm.set()
+
+    def _record(self, final):
+        # Ollama의 duration 값은 나노초 단위
+        load_seconds = final.get("load_duration", 0) / 1e9
+        with self.lock:
+            # 이미 올라가 있는 모델도 수 ms의 load_duration이 보고됨
+            if load_seconds > 0.1:
+                self.metrics["loads"] += 1
+                self.metrics["load_seconds"] += load_seconds
+            self.metrics["prompt_eval_tokens"] += final.get("prompt_eval_count", 0)
+        tracing.add_event(
+            "ollama_done",
+            load_seconds=load_seconds,
+            prompt_eval_tokens=final.get("prompt_eval_count", 0),
+            eval_tokens=final.get("eval_count", 0),
+        )
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+        stats["warm"] = self.warm.is_set()
+        stats["parallel"] = self.parallel
+        stats["mean_wait_seconds"] = (
+            stats["wait_seconds"] / stats["requests"] if stats["requests"] else 0.0
+        )
+        return stats
+
+
+_runtimes = {}
+_runtimes_lock = threading.Lock()
+
+
+def get_runtime(base_url, model, **params):
+    """One runtime (and connection pool and admission limit) per server and model."""
+    with _runtimes_lock:
+        runtime = _runtimes.get((base_url, model))
+        if runtime is None:
+            runtime = _runtimes[(base_url, model)] = OllamaRuntime(base_url, model, **params)
+        return runtime
+
+
+class ManagedChatOllama(ChatOllama):
+    """ChatOllama whose requests go through the shared OllamaRuntime."""
+
+    base_url: str = OLLAMA_BASE_URL
+    keep_alive: str = OLLAMA_KEEP_ALIVE
+    parallel: int = OLLAMA_NUM_PARALLEL
+
+    @property
+    def runtime(self):
+        return get_runtime(
+            self.base_url, self.model, keep_alive=self.keep_alive, parallel=self.parallel
+        )
+
+    def warm_up(self, background=True):
+        self.runtime.warm_up(self._default_params["options"], background)
+
+    def _create_stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        if self.stop is not None and stop is not None:
+            raise ValueError("`stop` found in both the input and default params.")
+        elif self.stop is not None:
+            stop = self.stop
+        elif stop is None:
+            stop = []
+        params = {**self._default_params, "stop": stop, **kwargs}
+        return self.runtime.generate({"prompt": prompt, **params})
+
+
+def status_panel(runtime):
+    """Sidebar line with the model state and the request queue."""
+    import streamlit as st
+
+    stats = runtime.stats()
+    state = "ready" if stats["warm"] else "loading..."
+    st.sidebar.caption(
+        f"{runtime.model}: {state} · active {stats['active']}/{stats['parallel']}"
+        f" · waiting {stats['waiting']} · avg wait {stats['mean_wait_seconds']:.2f}s"
+    )
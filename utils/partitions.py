@@ -0,0 +1,191 @@
+"""
+Per-product partitions of the SiteGPT docs index.
+
+Every product in PRODUCTS gets its own index (a FAISS store, a disk index or a
+vector service namespace), and a question is routed to the partitions it is
+about before the vector search:
+
+1. keywords: the product whose names or terms appear in the question as
+   whole words; a question naming several products searches every partition,
+2. otherwise the centroid (mean chunk embedding) of each partition closest to
+   the question embedding, plus any other within `margin` of it,
+3. otherwise, with no centroids, every partition.
+
+If the best chunk found in the chosen partitions is farther than
+`max_distance` from the question, the route was probably wrong and the
+other partitions are searched as well.
+
+The query is embedded once and the same vector searches every chosen
+partition, so a question only pays for the chunks of its products and adding
+products to PRODUCTS does not slow down or dilute the others.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, List
+import numpy as np
+from langchain.schema import BaseRetriever, Document
+from utils import tracing
+
+# URL 경로의 제품 이름: 화면에 보일 이름과 질문에서 찾을 단어
+PRODUCTS = {
+    "ai-gateway": {
+        "name": "AI Gateway",
+        "keywords": ["ai gateway", "gateway", "게이트웨이", "caching", "fallback", "analytics"],
+    },
+    "vectorize": {
+        "name": "Cloudflare Vectorize",
+        "keywords": ["vectorize", "벡터라이즈", "index", "인덱스", "vector", "벡터", "dimension"],
+    },
+    "workers-ai": {
+        "name": "Workers AI",
+        "keywords": ["workers ai", "워커스", "llama", "mistral", "neuron", "뉴런", "inference"],
+    },
+}
+
+
+def _keyword_pattern(keyword):
+    # 영어는 단어 전체가 같아야 하고("index"가 "reindexing"에 걸리지 않게),
+    # 한국어는 뒤에 붙는 조사를 허용("게이트웨이를")
+    suffix = "" if re.search(r"[가-힣]$", keyword) else r"(?!\w)"
+    return re.compile(r"(?<!\w)" + re.escape(keyword) + suffix)
+
+
+def product_for_url(url):
+    for slug in PRODUCTS:
+        if slug in url:
+            return slug
+    return None
+
+
+class QueryClassifier:
+    def __init__(self, centroids=None, products=PRODUCTS, margin=0.05, max_partitions=2):
+        self.centroids = {
+            slug: np.asarray(centroid, dtype=np.float32)
+            for slug, centroid in (centroids or {}).items()
+        }
+        self.products = products
+        self.patterns = {
+            slug: [_keyword_pattern(keyword.lower()) for keyword in product["keywords"]]
+            for slug, product in products.items()
+        }
+        self.margin = margin
+        self.max_partitions = max_partitions
+
+    def classify(self, question, vector, partitions):
+        """Returns the partitions to search and how they were chosen."""
+        text = question.lower()
+        matched = [
+            slug
+            for slug in partitions
+            if any(pattern.search(text) for pattern in self.patterns.get(slug, ()))
+        ]
+        if len(matched) == 1:
+            return matched, "keyword"
+        if matched:
+            # 여러 제품이 언급되면 비교 질문일 수 있으므로 좁히지 않음
+            return list(partitions), "all"
+        centroids = {slug: self.centroids[slug] for slug in partitions if slug in self.centroids}
+        if not centroids:
+            return list(partitions), "all"
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        similarity = {slug: float(centroid @ query) for slug, centroid in centroids.items()}
+        ranked = sorted(similarity, key=similarity.get, reverse=True)
+        top = similarity[ranked[0]]
+        return [
+            slug for slug in ranked[: self.max_partitions] if similarity[slug] >= top - self.margin
+        ], "centroid"
+
+
+def centroid(vectors):
+    mean = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+    return mean / (np.linalg.norm(mean) or 1.0)
+
+
+def save_manifest(path, partitions):
+    """`partitions` maps each product to {"chunks": n, "centroid": [...]}."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(partitions, f)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class FAISSPartition:
+    def __init__(self, store):
+        self.store = store
+
+    def search(self, vector, k):
+        return self.store.similarity_search_with_score_by_vector(vector, k)
+
+
+class DiskPartition:
+    def __init__(self, index):
+        self.index = index
+
+    def search(self, vector, k):
+        distances, ids = self.index.search(vector, k)
+        found = [(i, d) for i, d in zip(ids[0], distances[0]) if i >= 0]
+        docs = self.index.documents([i for i, _ in found])
+        return list(zip(docs, [float(d) for _, d in found]))
+
+
+class ServicePartition:
+    def __init__(self, client, namespace):
+        self.client = client
+        self.namespace = namespace
+
+    def search(self, vector, k):
+        return [
+            (Document(page_content=result["text"], metadata=result["metadata"]), result["score"])
+            for result in self.client.search(self.namespace, vector, k)
+        ]
+
+
+class PartitionedRetriever(BaseRetriever):
+    """
+    Searches only the partitions the classifier picks for each question, and
+    every partition when the best chunk found is farther than `max_distance`
+    (squared L2; 0.5 is a cosine similarity of 0.75 for unit-length vectors).
+    """
+
+    partitions: Dict[str, Any]
+    classifier: Any
+    embeddings: Any
+    k: int = 4
+    max_distance: float = 0.5
+
+    def route(self, query):
+        vector = self.embeddings.embed_query(query)
+        products, method = self.classifier.classify(query, vector, list(self.partitions))
+        tracing.add_event("partition_route", products=products, method=method)
+        tracing.count(f"partition_route:{method}")
+        return products, vector
+
+    def _search(self, products, vector):
+        found = []
+        for slug in products:
+            found.extend(self.partitions[slug].search(vector, self.k))
+        return found
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        products, vector = self.route(query)
+        found = self._search(products, vector)
+        best = min((distance for _, distance in found), default=None)
+        if len(products) < len(self.partitions) and (best is None or best > self.max_distance):
+            # 고른 파티션에서 가까운 청크를 못 찾으면 잘못 고른 것으로 보고 나머지도 검색
+            others = [slug for slug in self.partitions if slug not in products]
+            tracing.add_event("partition_widen", products=others, best_distance=best)
+            tracing.count("partition_route:widened")
+            found.extend(self._search(others, vector))
+        # 모든 파티션이 같은 임베딩의 L2 거리라 그대로 합쳐 정렬
+        found.sort(key=lambda pair: pair[1])
+        return [doc for doc, _ in found[: self.k]]
@@ -0,0 +1,127 @@
+"""
+Local weekly price store for InvestorGPT.
+
+Each symbol is one .npz file of column arrays (dates, open, high, low, close,
+volume) plus the time it was last refreshed. A refresh only appends the weeks
+that are newer than the stored ones (the latest, still open week is
+replaced), and symbols refreshed within REFRESH_AFTER seconds are not fetched
+again. Indicators are computed on the arrays with NumPy and summarized in a
+few hundred tokens for the agent.
+"""
+import os
+import re
+import tempfile
+import time
+import numpy as np
+
+PRICES_DIR = os.environ.get("PRICES_DIR", "./.cache/prices")
+REFRESH_AFTER = 12 * 60 * 60
+COLUMNS = {
+    "open": "1. open",
+    "high": "2. high",
+    "low": "3. low",
+    "close": "4. close",
+    "volume": "5. volume",
+}
+RETURN_WEEKS = (4, 13, 26, 52)
+# 주봉 10주/40주 ≈ 일봉 50일/200일 이동평균
+MOVING_AVERAGE_WEEKS = (10, 40)
+
+
+class PriceStore:
+    def __init__(self, root=PRICES_DIR, refresh_after=REFRESH_AFTER):
+        self.root = root
+        self.refresh_after = refresh_after
+
+    def _path(self, symbol):
+        return os.path.join(self.root, f"{re.sub(r'[^A-Za-z0-9.-]', '_', symbol.upper())}.npz")
+
+    def load(self, symbol):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def needs_refresh(self, symbol):
+        prices = self.load(symbol)
+        return prices is None or time.time() - float(prices["refreshed"]) > self.refresh_after
+
+    def update_weekly(self, symbol, response):
+        """
+        Merges an Alpha Vantage TIME_SERIES_WEEKLY response into the stored
+        arrays and returns the number of weeks that were added or replaced.
+        """
+        series = response["Weekly Time Series"]
+        stored = self.load(symbol)
+        dates = np.array(list(series), dtype="datetime64[D]")
+        if stored is not None and len(stored["dates"]):
+            # 저장된 마지막 주는 아직 진행 중이었을 수 있으므로 다시 받음
+            keep = dates >= stored["dates"][-1]
+        else:
+            keep = np.ones(len(dates), dtype=bool)
+        rows = [values for values, kept in zip(series.values(), keep) if kept]
+        new = {"dates": dates[keep]}
+        for column, key in COLUMNS.items():
+            new[column] = np.array([row[key] for row in rows], dtype=np.float64)
+        order = np.argsort(new["dates"])
+        new = {name: values[order] for name, values in new.items()}
+
+        if stored is not None:
+            older = stored["dates"] < new["dates"][0] if len(new["dates"]) else slice(None)
+            merged = {
+                name: np.concatenate([stored[name][older], new[name]])
+                for name in new
+            }
+        else:
+            merged = new
+        self._save(symbol, merged)
+        return len(new["dates"])
+
+    def _save(self, symbol, prices):
+        os.makedirs(self.root, exist_ok=True)
+        prices = {name: prices[name] for name in ["dates", *COLUMNS]}
+        with tempfile.NamedTemporaryFile(dir=self.root, suffix=".npz", delete=False) as f:
+            np.savez(f, refreshed=np.float64(time.time()), **prices)
+        os.replace(f.name, self._path(symbol))
+
+
+def moving_average(values, window):
+    cumulative = np.cumsum(np.insert(values, 0, 0.0))
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+
+def max_drawdown(values):
+    peaks = np.maximum.accumulate(values)
+    return float((values / peaks - 1).min())
+
+
+def summarize(symbol, prices):
+    dates = prices["dates"]
+    closes = prices["close"]
+    if not len(closes):
+        return {"symbol": symbol}
+    latest = closes[-1]
+    summary = {"symbol": symbol, "date": str(dates[-1]), "close": round(float(latest), 2)}
+    for weeks in RETURN_WEEKS:
+        if len(closes) > weeks:
+            summary[f"return_{weeks}w"] = round(float(latest / closes[-1 - weeks] - 1), 4)
+
+    last_year = closes[-53:]
+    log_returns = np.diff(np.log(last_year))
+    if len(log_returns) > 1:
+        summary["volatility_annualized"] = round(float(log_returns.std(ddof=1) * np.sqrt(52)), 4)
+    summary["max_drawdown_52w"] = round(max_drawdown(last_year), 4)
+    summary["max_drawdown_all"] = round(max_drawdown(closes), 4)
+    summary["high_52w"] = round(float(prices["high"][-52:].max()), 2)
+    summary["low_52w"] = round(float(prices["low"][-52:].min()), 2)
+
+    for weeks in MOVING_AVERAGE_WEEKS:
+        if len(closes) >= weeks:
+            average = moving_average(closes, weeks)
+            summary[f"ma_{weeks}w"] = round(float(average[-1]), 2)
+            summary[f"above_ma_{weeks}w"] = bool(latest > average[-1])
+    summary["avg_volume_13w"] = int(prices["volume"][-13:].mean())
+    summary["recent_closes"] = [round(float(close), 2) for close in closes[-8:]]
+    summary["history_weeks"] = int(len(closes))
+    return summary
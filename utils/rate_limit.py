@@ -0,0 +1,323 @@
+"""
+Rate limiter for outbound OpenAI traffic.
+
+    python -m utils.rate_limit stats
+
+Each model has a requests-per-minute and a tokens-per-minute token bucket
+(LIMITS, overridable with OPENAI_RATE_LIMITS="gpt-4-1106-preview=500:150000").
+A call waits until both buckets hold enough for it, so bursts from several
+pages and sessions are spread out instead of coming back as 429s. Chat calls
+are charged their prompt tokens plus `max_tokens` up front and settled with
+the usage OpenAI reports; a 429 empties the model's buckets so every caller
+backs off together. The OpenAI clients built in utils/model_client.py call
+the limiter before every request.
+
+Callers queue per model in priority order. Interactive calls (the default)
+go first; work running under `priority(BACKGROUND)`, such as the ingestion
+jobs, also leaves BACKGROUND_RESERVE of each bucket to interactive calls.
+With RATE_LIMIT_DB set (the default) the buckets live in SQLite and are
+shared by the app and the job workers; set it to "" for in-process buckets.
+"""
+import argparse
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+from utils import tracing
+from utils.tokens import count_tokens
+
+RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB", "./.cache/rate_limit.sqlite")
+# 모델 이름 앞부분: (분당 요청 수, 분당 토큰 수)
+LIMITS = {
+    "gpt-3.5-turbo": (3500, 160000),
+    "gpt-4": (500, 40000),
+    "gpt-4-1106-preview": (500, 150000),
+    "text-embedding-ada-002": (3000, 1000000),
+    "whisper-1": (50, 0),
+    "assistants": (500, 0),
+}
+LIMITS.update(
+    (model.strip(), tuple(int(value) for value in limits.split(":")))
+    for model, limits in (
+        entry.split("=", 1)
+        for entry in os.environ.get("OPENAI_RATE_LIMITS", "").split(",")
+        if "=" in entry
+    )
+)
+DEFAULT_LIMITS = (500, 90000)
+# max_tokens가 없을 때 응답 토큰 수 추정치
+COMPLETION_TOKENS = 512
+INTERACTIVE = 0
+BACKGROUND = 1
+BACKGROUND_RESERVE = 0.2
+
+_priority = contextvars.ContextVar("rate_limit_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def limits_for(model):
+    matches = [prefix for prefix in LIMITS if model.startswith(prefix)]
+    return LIMITS[max(matches, key=len)] if matches else DEFAULT_LIMITS
+
+
+def _refill(level, updated, capacity, now):
+    return min(capacity, level + (now - updated) * capacity / 60)
+
+
+class MemoryBuckets:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.levels = {}
+
+    def take(self, amounts, reserve):
+        """
+        `amounts` maps bucket names to (capacity, amount). Takes all of them
+        and returns 0, or takes nothing and returns the seconds to wait.
+        """
+        with self.lock:
+            now = time.time()
+            levels = {
+                name: _refill(*self.levels.get(name, (capacity, now)), capacity, now)
+                for name, (capacity, _) in amounts.items()
+            }
+            wait = _wait(levels, amounts, reserve)
+            if wait == 0:
+                for name, (_, amount) in amounts.items():
+                    self.levels[name] = (levels[name] - amount, now)
+            return wait
+
+    def set(self, name, capacity, level=None, delta=0):
+        with self.lock:
+            now = time.time()
+            current = _refill(*self.levels.get(name, (capacity, now)), capacity, now)
+            self.levels[name] = ((current if level is None else level) - delta, now)
+
+
+class SQLiteBuckets:
+    def __init__(self, path=RATE_LIMIT_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)"
+        )
+
+    def _levels(self, amounts, now):
+        levels = {}
+        for name, (capacity, _) in amounts.items():
+            row = self.db.execute(
+                "SELECT level, updated FROM buckets WHERE name = ?", (name,)
+            ).fetchone()
+            levels[name] = _refill(*(row or (capacity, now)), capacity, now)
+        return levels
+
+    def _store(self, levels, now):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+            [(name, level, now) for name, level in levels.items()],
+        )
+
+    def take(self, amounts, reserve):
+        # 여러 프로세스가 같은 버킷을 보므로 읽고 빼는 동안 쓰기 잠금을 잡음
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                levels = self._levels(amounts, now)
+                wait = _wait(levels, amounts, reserve)
+                if wait == 0:
+                    self._store(
+                        {name: levels[name] - amount for name, (_, amount) in amounts.items()},
+                        now,
+                    )
+            finally:
+                self.db.execute("COMMIT")
+            return wait
+
+    def set(self, name, capacity, level=None, delta=0):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                current = self._levels({name: (capacity, 0)}, now)[name]
+                self._store({name: (current if level is None else level) - delta}, now)
+            finally:
+                self.db.execute("COMMIT")
+
+
+def _wait(levels, amounts, reserve):
+    wait = 0.0
+    for name, (capacity, amount) in amounts.items():
+        # 한 번에 버킷보다 큰 요청은 가득 찼을 때 보내고 빚으로 남김
+        needed = min(amount + reserve * capacity, capacity)
+        if levels[name] < needed:
+            wait = max(wait, (needed - levels[name]) / (capacity / 60))
+    return wait
+
+
+class Limiter:
+    """Priority queue of the callers waiting for one model's buckets."""
+
+    def __init__(self, model, buckets):
+        self.model = model
+        self.rpm, self.tpm = limits_for(model)
+        self.buckets = buckets
+        self.condition = threading.Condition()
+        self.queue = []
+        self.order = itertools.count()
+        self.metrics = {}
+
+    def _amounts(self, requests, tokens):
+        amounts = {}
+        if self.rpm:
+            amounts[f"{self.model}:requests"] = (self.rpm, requests)
+        if self.tpm and tokens:
+            amounts[f"{self.model}:tokens"] = (self.tpm, tokens)
+        return amounts
+
+    def acquire(self, tokens=0, requests=1):
+        level = _priority.get()
+        reserve = BACKGROUND_RESERVE if level == BACKGROUND else 0.0
+        amounts = self._amounts(requests, tokens)
+        entry = (level, next(self.order))
+        start = time.perf_counter()
+        with self.condition:
+            heapq.heappush(self.queue, entry)
+            try:
+                while True:
+                    if self.queue[0] == entry:
+                        wait = self.buckets.take(amounts, reserve)
+                        if wait == 0:
+                            break
+                        # 앞의 대기자가 없는 동안만 버킷을 기다림
+                        self.condition.wait(min(wait, 1.0))
+                    else:
+                        self.condition.wait(1.0)
+            finally:
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+                self.condition.notify_all()
+        waited = time.perf_counter() - start
+        self._record(level, waited)
+        return waited
+
+    def try_acquire(self, tokens=0, requests=1):
+        """Takes the budget only if it is available right now, without queueing."""
+        level = _priority.get()
+        reserve = BACKGROUND_RESERVE if level == BACKGROUND else 0.0
+        return self.buckets.take(self._amounts(requests, tokens), reserve) == 0
+
+    async def aacquire(self, tokens=0, requests=1):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: context.run(self.acquire, tokens, requests)
+        )
+
+    def settle(self, estimated, actual):
+        if self.tpm and actual is not None and actual != estimated:
+            self.buckets.set(f"{self.model}:tokens", self.tpm, delta=actual - estimated)
+
+    def drain(self):
+        # 429를 받으면 모두가 같이 물러나도록 버킷을 비움
+        self.buckets.set(f"{self.model}:requests", self.rpm, level=0)
+        if self.tpm:
+            self.buckets.set(f"{self.model}:tokens", self.tpm, level=0)
+        tracing.add_event("rate_limited", model=self.model)
+
+    def _record(self, level, waited):
+        name = "interactive" if level == INTERACTIVE else "background"
+        with self.condition:
+            row = self.metrics.setdefault(
+                name, {"calls": 0, "waited": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            )
+            row["calls"] += 1
+            row["waited"] += int(waited > 0.01)
+            row["wait_seconds"] += waited
+            row["max_wait_seconds"] = max(row["max_wait_seconds"], waited)
+        if waited > 0.01:
+            tracing.add_event("rate_limit_wait", model=self.model, seconds=waited)
+            tracing.count("rate_limit_wait_ms", int(waited * 1000))
+
+
+_limiters: Dict[str, Limiter] = {}
+_limiters_lock = threading.Lock()
+_buckets = None
+
+
+def limiter(model):
+    global _buckets
+    with _limiters_lock:
+        if _buckets is None:
+            _buckets = SQLiteBuckets(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBuckets()
+        if model not in _limiters:
+            _limiters[model] = Limiter(model, _buckets)
+        return _limiters[model]
+
+
+def stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {
+        limiter.model: {
+            "rpm": limiter.rpm,
+            "tpm": limiter.tpm,
+            "queued": len(limiter.queue),
+            **limiter.metrics,
+        }
+        for limiter in limiters
+    }
+
+
+def is_rate_limit_error(error):
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+def chat_tokens(kwargs):
+    text = "".join(str(message.get("content") or "") for message in kwargs.get("messages", []))
+    if kwargs.get("functions"):
+        text += json.dumps(kwargs["functions"])
+    return count_tokens(text) + (kwargs.get("max_tokens") or COMPLETION_TOKENS)
+
+
+def embedding_tokens(kwargs):
+    inputs = kwargs.get("input", [])
+    if isinstance(inputs, str):
+        return count_tokens(inputs)
+    # langchain은 미리 토큰화한 정수 배열을 보냄
+    return sum(len(item) if isinstance(item, list) else count_tokens(item) for item in inputs)
+
+
+def usage_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["stats"])
+    parser.add_argument("--path", default=RATE_LIMIT_DB)
+    args = parser.parse_args()
+    buckets = SQLiteBuckets(args.path)
+    now = time.time()
+    for name, level, updated in buckets.db.execute("SELECT name, level, updated FROM buckets"):
+        capacity = limits_for(name.rsplit(":", 1)[0])[0 if name.endswith(":requests") else 1]
+        print(f"{name:<40} {_refill(level, updated, capacity, now):>12.0f} / {capacity}")
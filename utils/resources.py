@@ -0,0 +1,94 @@
+"""
+Models, embedders and splitters built once per process.
+
+Each factory is wrapped in st.cache_resource so the objects are keyed on their
+configuration and reused across reruns and sessions, and the langchain modules
+behind them are only imported the first time they are needed. Per-run state
+such as callbacks must be passed at invoke time (config={"callbacks": [...]}),
+never to these shared objects.
+"""
+import streamlit as st
+
+
+@st.cache_resource(show_spinner=False)
+def llm_cache():
+    from utils import llm_cache
+
+    return llm_cache.install()
+
+
+@st.cache_resource(show_spinner=False)
+def chat_model(provider="openai", **params):
+    # 모든 채팅 모델 호출이 같은 응답 캐시를 거치도록 먼저 설치
+    llm_cache()
+    if provider == "ollama":
+        # 모델 예열, keep_alive, 연결 재사용, 동시 요청 제한은 runtime이 담당
+        from utils.ollama_runtime import ManagedChatOllama
+
+        return ManagedChatOllama(**params)
+    # 모든 OpenAI 호출은 연결 풀, 모델별 요청/토큰 한도, deadline을 함께 씀
+    from utils.model_client import SharedChatOpenAI
+
+    return SharedChatOpenAI(**params)
+
+
+@st.cache_resource(show_spinner=False)
+def embeddings(provider="openai", **params):
+    if provider == "ollama":
+        from langchain.embeddings import OllamaEmbeddings
+
+        return OllamaEmbeddings(**params)
+    from utils.model_client import SharedOpenAIEmbeddings
+
+    return SharedOpenAIEmbeddings(**params)
+
+
+@st.cache_resource(show_spinner=False)
+def token_splitter(chunk_size, chunk_overlap, separator="\n"):
+    from utils.splitters import StreamingTokenSplitter
+
+    return StreamingTokenSplitter(
+        separator=separator,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def recursive_splitter(chunk_size, chunk_overlap):
+    from utils import splitters
+
+    return splitters.recursive_splitter(chunk_size, chunk_overlap)
+
+
+@st.cache_resource(show_spinner=False)
+def embedding_cache():
+    from utils.embedding_cache import EmbeddingCache
+
+    return EmbeddingCache()
+
+
+@st.cache_resource(show_spinner=False)
+def cached_embeddings(provider="openai", **params):
+    from utils.embedding_cache import CachedEmbeddings
+
+    return CachedEmbeddings(embeddings(provider, **params), embedding_cache())
+
+
+@st.cache_resource(show_spinner=False)
+def router(provider="openai", **params):
+    from utils.router import TIERS, Router
+
+    # tier마다 모델과 timeout/재시도만 다르고 나머지 설정은 같음
+    return Router(
+        {
+            tier: chat_model(
+                provider,
+                model=limits["model"],
+                request_timeout=limits["timeout"],
+                max_retries=limits["retries"],
+                **params,
+            )
+            for tier, limits in TIERS.items()
+        }
+    )
@@ -0,0 +1,258 @@
+"""
+Routes each chain step to a model tier.
+
+Steps are named "<page>/<step>" and ROUTES assigns each one a tier: bulk map
+work (one answer per retrieved chunk, one summary per transcript segment)
+runs on the fast tier and only the final synthesis on the strong one. A
+prompt longer than its tier's `max_prompt_tokens` moves up to the next tier
+that fits, and a call that times out, or whose model the API key cannot
+use, is retried once on the tier's `fallback`. Latency and token counts are
+kept per (step, tier, model) and added to the current tracing span.
+
+Both tiers default to gpt-3.5-turbo models, so routing alone does not change
+the cost. STRONG_MODEL=gpt-4-1106-preview (with STRONG_MAX_PROMPT_TOKENS=100000)
+improves the strong steps at about ten times the token price.
+
+Routes can be overridden without code changes, e.g.
+MODEL_ROUTES="sitegpt/choose=fast,quizgpt/generate=fast".
+"""
+import os
+import threading
+import time
+from collections import deque
+from langchain.schema.runnable import RunnableLambda
+from utils import llm_cache, tracing
+from utils.tokens import count_tokens
+
+TIERS = {
+    "fast": {
+        "model": os.environ.get("FAST_MODEL", "gpt-3.5-turbo-1106"),
+        "max_prompt_tokens": 12000,
+        "timeout": 30,
+        "retries": 0,
+        "fallback": "strong",
+    },
+    "strong": {
+        "model": os.environ.get("STRONG_MODEL", "gpt-3.5-turbo"),
+        "max_prompt_tokens": int(os.environ.get("STRONG_MAX_PROMPT_TOKENS", 12000)),
+        "timeout": 90,
+        "retries": 1,
+        "fallback": "fast",
+    },
+}
+ROUTES = {
+    "sitegpt/answer": "fast",
+    "sitegpt/choose": "strong",
+    "meetinggpt/summarize": "fast",
+    "meetinggpt/refine": "strong",
+    "quizgpt/generate": "strong",
+}
+ROUTES.update(
+    route.strip().split("=", 1)
+    for route in os.environ.get("MODEL_ROUTES", "").split(",")
+    if "=" in route
+)
+# 최근 호출만으로 p50/p95를 계산
+LATENCY_WINDOW = 200
+
+
+def timeout_errors():
+    errors = [TimeoutError]
+    try:
+        import requests
+
+        errors.append(requests.Timeout)
+    except ImportError:
+        pass
+    try:
+        import openai
+
+        # openai 1.x는 APITimeoutError, 0.x는 openai.error.Timeout
+        errors.append(getattr(openai, "APITimeoutError", None) or openai.error.Timeout)
+    except (ImportError, AttributeError):
+        pass
+    return tuple(errors)
+
+
+def model_unavailable_errors():
+    try:
+        import openai
+    except ImportError:
+        return ()
+    # 키에 모델 권한이 없으면 404(NotFoundError) 또는 403(PermissionDeniedError)
+    return tuple(
+        error
+        for error in (
+            getattr(openai, "NotFoundError", None),
+            getattr(openai, "PermissionDeniedError", None),
+        )
+        if error is not None
+    )
+
+
+def fallback_errors():
+    return timeout_errors() + model_unavailable_errors()
+
+
+def prompt_text(prompt):
+    if hasattr(prompt, "to_string"):
+        return prompt.to_string()
+    if isinstance(prompt, list):
+        return "\n".join(str(message.content) for message in prompt)
+    return str(prompt)
+
+
+def message_tokens(message):
+    function_call = message.additional_kwargs.get("function_call", {})
+    return count_tokens(str(message.content) + function_call.get("arguments", ""))
+
+
+class StepStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = {}
+
+    def record(self, step, tier, model, seconds, prompt_tokens, completion_tokens, fallback=False):
+        with self.lock:
+            row = self.rows.setdefault(
+                (step, tier, model),
+                {
+                    "calls": 0,
+                    "fallbacks": 0,
+                    "seconds": 0.0,
+                    "latencies": deque(maxlen=LATENCY_WINDOW),
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                },
+            )
+            row["calls"] += 1
+            row["fallbacks"] += int(fallback)
+            row["seconds"] += seconds
+            row["latencies"].append(seconds)
+            row["prompt_tokens"] += prompt_tokens
+            row["completion_tokens"] += completion_tokens
+
+    def summary(self, prefix=""):
+        with self.lock:
+            rows = []
+            for (step, tier, model), row in sorted(self.rows.items()):
+                if not step.startswith(prefix):
+                    continue
+                latencies = sorted(row["latencies"])
+                rows.append(
+                    {
+                        "step": step,
+                        "tier": tier,
+                        "model": model,
+                        "calls": row["calls"],
+                        "fallbacks": row["fallbacks"],
+                        "mean_s": row["seconds"] / row["calls"],
+                        "p50_s": latencies[len(latencies) // 2],
+                        "p95_s": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+                        "prompt_tokens": row["prompt_tokens"],
+                        "completion_tokens": row["completion_tokens"],
+                    }
+                )
+            return rows
+
+
+stats = StepStats()
+
+
+class Router:
+    """
+    `models` maps tier names to chat models, `tiers` holds each tier's limits
+    (see TIERS). `invoke`/`stream` take the formatted prompt of a step.
+    """
+
+    def __init__(self, models, tiers=TIERS, routes=ROUTES):
+        self.models = models
+        self.tiers = tiers
+        self.routes = routes
+
+    def choose(self, step, prompt_tokens):
+        tier = self.routes.get(step, "strong")
+        if prompt_tokens <= self.tiers[tier]["max_prompt_tokens"]:
+            return tier
+        # 컨텍스트가 넘치면 들어가는 가장 작은 tier로 올림
+        larger = sorted(
+            (limits["max_prompt_tokens"], name)
+            for name, limits in self.tiers.items()
+            if limits["max_prompt_tokens"] >= prompt_tokens
+        )
+        return larger[0][1] if larger else tier
+
+    def model_name(self, tier):
+        return self.tiers[tier]["model"]
+
+    def _record(self, step, tier, start, prompt_tokens, message, fallback):
+        seconds = time.perf_counter() - start
+        completion_tokens = message_tokens(message)
+        stats.record(
+            step, tier, self.model_name(tier), seconds, prompt_tokens, completion_tokens, fallback
+        )
+        tracing.count(f"{step}:{tier}")
+        tracing.count(f"{step}:prompt_tokens", prompt_tokens)
+        tracing.count(f"{step}:completion_tokens", completion_tokens)
+
+    def invoke(self, step, prompt, config=None, **kwargs):
+        prompt_tokens = count_tokens(prompt_text(prompt))
+        tier = self.choose(step, prompt_tokens)
+        start = time.perf_counter()
+        fallback = False
+        try:
+            message = self.models[tier].invoke(prompt, config, **kwargs)
+        except fallback_errors():
+            fallback_tier = self.tiers[tier].get("fallback")
+            if fallback_tier is None:
+                raise
+            tracing.add_event("model_fallback", step=step, tier=tier, to=fallback_tier)
+            tier, fallback = fallback_tier, True
+            message = self.models[tier].invoke(prompt, config, **kwargs)
+        self._record(step, tier, start, prompt_tokens, message, fallback)
+        return message
+
+    def stream(self, step, messages, config=None, **kwargs):
+        """
+        Streams the step's answer through the llm cache. The fallback is only
+        tried when the error happens before the first chunk.
+        """
+        prompt_tokens = count_tokens(prompt_text(messages))
+        tier = self.choose(step, prompt_tokens)
+        start = time.perf_counter()
+        fallback = False
+        message = None
+        try:
+            for chunk in llm_cache.stream(self.models[tier], messages, config, **kwargs):
+                message = chunk if message is None else message + chunk
+                yield chunk
+        except fallback_errors():
+            fallback_tier = self.tiers[tier].get("fallback")
+            if message is not None or fallback_tier is None:
+                raise
+            tracing.add_event("model_fallback", step=step, tier=tier, to=fallback_tier)
+            tier, fallback = fallback_tier, True
+            for chunk in llm_cache.stream(self.models[tier], messages, config, **kwargs):
+                message = chunk if message is None else message + chunk
+                yield chunk
+        if message is not None:
+            self._record(step, tier, start, prompt_tokens, message, fallback)
+
+    def runnable(self, step, **kwargs):
+        """The step as a Runnable, to be piped after its prompt."""
+        return RunnableLambda(
+            lambda prompt, config: self.invoke(step, prompt, config, **kwargs)
+        ).with_config(run_name=step)
+
+
+def stats_panel(page):
+    """Sidebar toggle with the latency and token stats of `page`'s steps."""
+    import streamlit as st
+
+    if not st.sidebar.checkbox("Show model routes", key=f"router_panel:{page}"):
+        return
+    rows = stats.summary(prefix=f"{page.lower()}/")
+    if not rows:
+        st.sidebar.caption("No model calls recorded yet.")
+        return
+    st.sidebar.dataframe(rows, use_container_width=True)
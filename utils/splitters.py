@@ -0,0 +1,149 @@
+import copy
+import itertools
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from utils.tokens import get_encoding
+
+# from_tiktoken_encoder()의 기본 인코딩과 동일하게 맞춤
+DEFAULT_ENCODING = "gpt2"
+
+
+def token_length(text, encoding_name=DEFAULT_ENCODING):
+    return len(
+        get_encoding(encoding_name).encode(
+            text, allowed_special=set(), disallowed_special="all"
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def get_length_function(encoding_name=DEFAULT_ENCODING):
+    @lru_cache(maxsize=2**16)
+    def length_function(text):
+        return token_length(text, encoding_name)
+
+    return length_function
+
+
+def _measure_pieces(args):
+    text, separator, encoding_name = args
+    pieces = [piece for piece in re.split(re.escape(separator), text) if piece != ""]
+    return [(piece, token_length(piece, encoding_name)) for piece in pieces]
+
+
+def _measure_batch(batch):
+    return [_measure_pieces(args) for args in batch]
+
+
+class StreamingTokenSplitter:
+    """
+    Token-based splitter that produces the same chunks as
+    CharacterTextSplitter.from_tiktoken_encoder(separator, chunk_size, chunk_overlap)
+    applied to the pages joined by the separator, but consumes the pages one at a
+    time and never holds the whole document in memory.
+
+    Token counts are computed once per piece. When more than `parallel_threshold`
+    pages come in, the counting is spread over a pool of `processes` workers
+    (default: one per CPU, 1 disables it) and the cheap merge stays in this
+    process, so the output is unchanged. Only a few batches per worker are
+    in flight at a time, so pages are still read as the chunks are consumed.
+    """
+
+    def __init__(
+        self,
+        chunk_size=600,
+        chunk_overlap=100,
+        separator="\n",
+        encoding_name=DEFAULT_ENCODING,
+        processes=None,
+        parallel_threshold=100,
+        batch_size=8,
+    ):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size})."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separator = separator
+        self.encoding_name = encoding_name
+        self.processes = processes
+        self.parallel_threshold = parallel_threshold
+        self.batch_size = batch_size
+
+    def split_documents(self, documents):
+        return list(self.split_pages(documents))
+
+    def split_pages(self, pages):
+        chunk = []
+        total = 0
+        separator_len = token_length(self.separator, self.encoding_name)
+        for metadata, pieces in self._measured_pages(pages):
+            for piece, length in pieces:
+                if total + length + (separator_len if chunk else 0) > self.chunk_size:
+                    if chunk:
+                        document = self._join(chunk)
+                        if document is not None:
+                            yield document
+                        while total > self.chunk_overlap or (
+                            total + length + (separator_len if chunk else 0)
+                            > self.chunk_size
+                            and total > 0
+                        ):
+                            total -= chunk[0][1] + (separator_len if len(chunk) > 1 else 0)
+                            chunk = chunk[1:]
+                chunk.append((piece, length, metadata))
+                total += length + (separator_len if len(chunk) > 1 else 0)
+        document = self._join(chunk)
+        if document is not None:
+            yield document
+
+    def _join(self, chunk):
+        # 청크의 메타데이터는 첫 조각이 속한 페이지를 따름
+        text = self.separator.join(piece for piece, _, _ in chunk).strip()
+        if not text:
+            return None
+        return Document(page_content=text, metadata=copy.deepcopy(chunk[0][2]))
+
+    def _measured_pages(self, pages):
+        pages = iter(pages)
+        head = list(itertools.islice(pages, self.parallel_threshold + 1))
+        if self.processes != 1 and len(head) > self.parallel_threshold:
+            pages = itertools.chain(head, pages)
+            # executor.map은 입력을 처음에 모두 제출하므로 워커당 두 배치만 미리 보냄
+            window = 2 * (self.processes or os.cpu_count() or 1)
+            pending = deque()
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                while True:
+                    while len(pending) < window:
+                        batch = list(itertools.islice(pages, self.batch_size))
+                        if not batch:
+                            break
+                        jobs = [
+                            (page.page_content, self.separator, self.encoding_name)
+                            for page in batch
+                        ]
+                        future = executor.submit(_measure_batch, jobs)
+                        pending.append(([page.metadata for page in batch], future))
+                    if not pending:
+                        return
+                    metadata, future = pending.popleft()
+                    yield from zip(metadata, future.result())
+        for page in itertools.chain(head, pages):
+            yield page.metadata, _measure_pieces(
+                (page.page_content, self.separator, self.encoding_name)
+            )
+
+
+def recursive_splitter(chunk_size, chunk_overlap, encoding_name=DEFAULT_ENCODING):
+    # RecursiveCharacterTextSplitter.from_tiktoken_encoder()와 같은 결과, 인코더와 길이는 캐시
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=get_length_function(encoding_name),
+    )
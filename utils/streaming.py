@@ -0,0 +1,56 @@
+import json
+
+
+class JsonArrayStream:
+    """
+    Incremental scanner for a streamed JSON object such as the function-call
+    arguments `{"questions": [{...}, {...}]}`.
+
+    `feed()` takes the next chunk of text and returns the objects of the
+    top-level object's arrays that were completed by it, so each one can be
+    shown as soon as its closing brace arrives. Every character is scanned
+    once; only the text of the item in progress is kept.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.item = None
+        self.text = []
+
+    def feed(self, chunk):
+        completed = []
+        start = 0 if self.item is not None else None
+        for i, char in enumerate(chunk):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                # { [ { : 최상위 객체 안 배열의 원소가 시작됨
+                if char == "{" and self.stack == ["{", "["]:
+                    self.item = []
+                    start = i
+                self.stack.append(char)
+            elif char in "}]":
+                self.stack.pop()
+                if self.item is not None and self.stack == ["{", "["]:
+                    self.item.append(chunk[start : i + 1])
+                    completed.append(json.loads("".join(self.item)))
+                    self.item = None
+                    start = None
+        if self.item is not None:
+            self.item.append(chunk[start:])
+        self.text.append(chunk)
+        return completed
+
+    def result(self):
+        """The whole document, parsed once the stream has ended."""
+        return json.loads("".join(self.text))
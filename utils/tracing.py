@@ -0,0 +1,343 @@
+import contextvars
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from langchain.callbacks.base import BaseCallbackHandler
+
+# 내보내기 설정: TRACE_JSONL 경로에 JSONL로, OTEL_EXPORTER_OTLP_ENDPOINT가 있으면 OTLP/HTTP로 전송
+TRACE_JSONL = os.environ.get("TRACE_JSONL")
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "fullstack-gpt")
+
+# OTLP 전송은 요청 경로 밖의 스레드 하나가 처리, 수집기가 느려 쌓이면 새 trace는 버림
+OTLP_QUEUE_SIZE = 100
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    Spans of one request (one Streamlit run of a page). Spans are plain dicts so
+    they can be written to JSONL as-is and converted to OTLP on export.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.lock = threading.Lock()
+        self.root = self.start_span(name, parent=None)
+
+    def start_span(self, name, parent=None, kind="internal", **attributes):
+        span = {
+            "trace_id": self.trace_id,
+            "span_id": secrets.token_hex(8),
+            "parent_id": parent["span_id"] if parent else None,
+            "name": name,
+            "kind": kind,
+            "start": time.time_ns(),
+            "end": None,
+            "attributes": attributes,
+            "events": [],
+        }
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def end_span(self, span, **attributes):
+        span["attributes"].update(attributes)
+        span["end"] = time.time_ns()
+
+    @contextmanager
+    def span(self, name, kind="internal", **attributes):
+        parent = _current_span.get() or self.root
+        span = self.start_span(name, parent, kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span["attributes"]["error"] = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def callback_handler(self):
+        return TracingCallbackHandler(self)
+
+    def waterfall(self):
+        start = self.root["start"]
+        rows = []
+        depth = {None: -1}
+        for span in sorted(self.spans, key=lambda span: span["start"]):
+            depth[span["span_id"]] = depth.get(span["parent_id"], 0) + 1
+            end = span["end"] or time.time_ns()
+            rows.append(
+                {
+                    "span": "  " * depth[span["span_id"]] + span["name"],
+                    "kind": span["kind"],
+                    "start_ms": (span["start"] - start) / 1e6,
+                    "end_ms": (end - start) / 1e6,
+                    "duration_ms": (end - span["start"]) / 1e6,
+                    "attributes": json.dumps(span["attributes"], default=str),
+                }
+            )
+        return rows
+
+
+@contextmanager
+def trace(name, store=None):
+    """
+    Starts a trace for one request. Spans opened with `span()` anywhere below it
+    (including in utils/) are attached to it. On exit the trace is exported and,
+    when `store` (st.session_state) is given, kept there for `trace_panel(name)`.
+    """
+    current = Trace(name)
+    trace_token = _current_trace.set(current)
+    span_token = _current_span.set(current.root)
+    try:
+        yield current
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        current.end_span(current.root)
+        if store is not None:
+            store[f"trace:{name}"] = current
+        export(current)
+
+
+@contextmanager
+def span(name, kind="internal", **attributes):
+    current = _current_trace.get()
+    if current is None:
+        yield {"attributes": attributes, "events": []}
+        return
+    with current.span(name, kind, **attributes) as opened:
+        yield opened
+
+
+def add_event(name, **attributes):
+    current = _current_span.get()
+    if current is not None:
+        current["events"].append(
+            {"name": name, "time": time.time_ns(), "attributes": attributes}
+        )
+
+
+def count(name, value=1):
+    # 캐시 히트, 외부 호출 수 등을 현재 span의 속성으로 누적
+    current = _current_span.get()
+    if current is not None:
+        current["attributes"][name] = current["attributes"].get(name, 0) + value
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Records LangChain chain, LLM, retriever and tool runs as spans of `trace`,
+    including time to first token and token usage.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.runs = {}
+
+    def _start(self, run_id, parent_run_id, name, kind, **attributes):
+        parent = self.runs.get(parent_run_id) or _current_span.get() or self.trace.root
+        self.runs[run_id] = self.trace.start_span(name, parent, kind, **attributes)
+
+    def _end(self, run_id, **attributes):
+        span = self.runs.pop(run_id, None)
+        if span is not None:
+            self.trace.end_span(span, **attributes)
+
+    def _error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("id", ["chain"])[-1]
+        self._start(run_id, parent_run_id, name, "chain")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    on_chain_error = _error
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, _model_name(serialized, kwargs), "llm", external=True)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, _model_name(serialized, kwargs), "llm", external=True)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        span = self.runs.get(run_id)
+        if span is None:
+            return
+        attributes = span["attributes"]
+        if "first_token_ms" not in attributes:
+            attributes["first_token_ms"] = (time.time_ns() - span["start"]) / 1e6
+        attributes["streamed_tokens"] = attributes.get("streamed_tokens", 0) + 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self._end(run_id, **{f"tokens.{key}": value for key, value in usage.items()})
+
+    on_llm_error = _error
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "retriever", "retriever", query=query)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, documents=len(documents))
+
+    on_retriever_error = _error
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("name", "tool")
+        self._start(run_id, parent_run_id, name, "tool", external=True, input=input_str)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=len(str(output)))
+
+    on_tool_error = _error
+
+
+def _model_name(serialized, kwargs):
+    params = kwargs.get("invocation_params") or {}
+    return params.get("model_name") or params.get("model") or (serialized or {}).get("id", ["llm"])[-1]
+
+
+def export(trace):
+    if TRACE_JSONL:
+        os.makedirs(os.path.dirname(TRACE_JSONL) or ".", exist_ok=True)
+        with open(TRACE_JSONL, "a") as f:
+            for span in trace.spans:
+                f.write(json.dumps(span, default=str) + "\n")
+    if OTLP_ENDPOINT:
+        try:
+            _otlp_queue().put_nowait(trace)
+        except queue.Full:
+            pass
+
+
+_otlp_pending = None
+_otlp_lock = threading.Lock()
+
+
+def _otlp_queue():
+    global _otlp_pending
+    with _otlp_lock:
+        if _otlp_pending is None:
+            _otlp_pending = queue.Queue(maxsize=OTLP_QUEUE_SIZE)
+            threading.Thread(
+                target=_send_otlp, args=(_otlp_pending,), name="trace-export", daemon=True
+            ).start()
+    return _otlp_pending
+
+
+def _send_otlp(pending):
+    import requests
+
+    while True:
+        trace = pending.get()
+        try:
+            requests.post(
+                OTLP_ENDPOINT.rstrip("/") + "/v1/traces",
+                json=to_otlp(trace),
+                timeout=2,
+            )
+        except requests.RequestException:
+            pass
+        finally:
+            pending.task_done()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def to_otlp(trace):
+    kinds = {"internal": 1, "llm": 3, "tool": 3, "retriever": 1, "chain": 1}
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "utils.tracing"},
+                        "spans": [
+                            {
+                                "traceId": span["trace_id"],
+                                "spanId": span["span_id"],
+                                "parentSpanId": span["parent_id"] or "",
+                                "name": span["name"],
+                                "kind": kinds.get(span["kind"], 1),
+                                "startTimeUnixNano": str(span["start"]),
+                                "endTimeUnixNano": str(span["end"] or span["start"]),
+                                "attributes": _otlp_attributes(
+                                    {"kind": span["kind"], **span["attributes"]}
+                                ),
+                                "events": [
+                                    {
+                                        "name": event["name"],
+                                        "timeUnixNano": str(event["time"]),
+                                        "attributes": _otlp_attributes(event["attributes"]),
+                                    }
+                                    for event in span["events"]
+                                ],
+                            }
+                            for span in trace.spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def trace_panel(page):
+    """
+    Sidebar toggle that shows the waterfall of the session's last traces of
+    `page` (traces named "<page>/<step>").
+    """
+    import altair as alt
+    import pandas as pd
+    import streamlit as st
+
+    if not st.sidebar.checkbox("Show trace", key=f"trace_panel:{page}"):
+        return
+    prefix = f"trace:{page}/"
+    traces = [value for key, value in st.session_state.items() if key.startswith(prefix)]
+    if not traces:
+        st.sidebar.caption("No trace recorded yet.")
+        return
+    for current in sorted(traces, key=lambda current: current.root["start"]):
+        rows = pd.DataFrame(current.waterfall())
+        with st.expander(f"Trace: {current.name}", expanded=True):
+            st.altair_chart(
+                alt.Chart(rows)
+                .mark_bar()
+                .encode(
+                    x=alt.X("start_ms", title="ms"),
+                    x2="end_ms",
+                    y=alt.Y("span", sort=None, title=None),
+                    color="kind",
+                    tooltip=["span", "duration_ms", "attributes"],
+                ),
+                use_container_width=True,
+            )
+            st.dataframe(rows, use_container_width=True)
@@ -0,0 +1,190 @@
+"""
+Transcription backends for MeetingGPT.
+
+    python -m utils.transcription bench chunk_0.mp3 chunk_1.mp3 --backends openai local
+
+TRANSCRIBE_BACKEND picks the backend for a deployment:
+
+    openai  (default) Whisper API ("whisper-1"), one upload per audio chunk,
+            TRANSCRIBE_WORKERS chunks at a time under the whisper-1 rate limit,
+            with the given api_key (default OPENAI_API_KEY)
+    local   faster-whisper (CTranslate2) on the CPU, WHISPER_MODEL quantized to
+            WHISPER_COMPUTE_TYPE, one model per process in a pool of
+            TRANSCRIBE_WORKERS processes; no network and no API key
+
+Both return the plain text of each chunk, like the API's `text` field, so the
+transcript file is the same whichever backend wrote it. Every run reports its
+real-time factor (processing seconds / audio seconds, lower is faster); the
+bench command measures it on this machine for each backend.
+"""
+import argparse
+import contextvars
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from utils import tracing
+
+TRANSCRIBE_BACKEND = os.environ.get("TRANSCRIBE_BACKEND", "openai")
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", 0)) or None
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "small")
+WHISPER_COMPUTE_TYPE = os.environ.get("WHISPER_COMPUTE_TYPE", "int8")
+
+
+def audio_seconds(path):
+    from pydub.utils import mediainfo
+
+    return float(mediainfo(path).get("duration") or 0)
+
+
+class Transcriber(ABC):
+    name = None
+
+    @abstractmethod
+    def executor(self):
+        """Executor the chunks are transcribed in, shut down after each run."""
+
+    @abstractmethod
+    def task(self):
+        """Module-level function path -> text, run in the executor."""
+
+    def submit(self, executor, file):
+        return executor.submit(self.task(), file)
+
+    def transcribe(self, files, durations=None, progress=None):
+        """
+        Transcribes the audio files in order and returns their texts and the
+        run's stats. `durations` are the files' lengths in seconds, when the
+        caller already knows them. `progress(done, total)` is called after
+        each file.
+        """
+        start = time.perf_counter()
+        executor = self.executor()
+        try:
+            futures = [self.submit(executor, file) for file in files]
+            texts = []
+            for i, future in enumerate(futures):
+                texts.append(future.result())
+                if progress is not None:
+                    progress(i + 1, len(files))
+        finally:
+            # 작업이 취소되면 남은 청크는 시작하지 않음
+            executor.shutdown(wait=True, cancel_futures=True)
+        seconds = time.perf_counter() - start
+        audio = sum(durations if durations is not None else map(audio_seconds, files))
+        stats = {
+            "backend": self.name,
+            "chunks": len(files),
+            "audio_seconds": audio,
+            "transcribe_seconds": seconds,
+            "real_time_factor": seconds / audio if audio else None,
+        }
+        tracing.add_event("transcribed", **stats)
+        return texts, stats
+
+
+def _transcribe_openai(path, api_key=None):
+    import openai
+    from utils import rate_limit
+
+    rate_limit.limiter("whisper-1").acquire()
+    with open(path, "rb") as audio_file:
+        # openai 1.x는 클라이언트, 0.x는 모듈 함수
+        if hasattr(openai, "OpenAI"):
+            return openai.OpenAI(api_key=api_key).audio.transcriptions.create(
+                model="whisper-1", file=audio_file
+            ).text
+        return openai.Audio.transcribe("whisper-1", audio_file, api_key=api_key)["text"]
+
+
+class OpenAITranscriber(Transcriber):
+    name = "openai"
+
+    def __init__(self, workers=TRANSCRIBE_WORKERS, api_key=None):
+        # 업로드는 I/O라 스레드로 충분
+        self.workers = workers or 4
+        self.api_key = api_key
+
+    def executor(self):
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcribe")
+
+    def task(self):
+        return _transcribe_openai
+
+    def submit(self, executor, file):
+        # 스레드에서도 작업의 rate limit 우선순위(BACKGROUND)를 따르도록 context 복사
+        return executor.submit(
+            contextvars.copy_context().run, self.task(), file, self.api_key
+        )
+
+
+_local_model = None
+
+
+def _load_local(model, compute_type, threads):
+    global _local_model
+    from faster_whisper import WhisperModel
+
+    _local_model = WhisperModel(
+        model, device="cpu", compute_type=compute_type, cpu_threads=threads
+    )
+
+
+def _transcribe_local(path):
+    segments, _ = _local_model.transcribe(path, beam_size=5)
+    # API의 text와 같은 형태: 구간 텍스트를 이어 붙이고 앞뒤 공백 제거
+    return "".join(segment.text for segment in segments).strip()
+
+
+class LocalTranscriber(Transcriber):
+    name = "local"
+
+    def __init__(
+        self,
+        workers=TRANSCRIBE_WORKERS,
+        model=WHISPER_MODEL,
+        compute_type=WHISPER_COMPUTE_TYPE,
+    ):
+        cpus = os.cpu_count() or 1
+        # 프로세스마다 모델을 한 번 올리고 CPU 코어를 나눠 씀
+        self.workers = workers or max(1, cpus // 4)
+        self.threads = max(1, cpus // self.workers)
+        self.model = model
+        self.compute_type = compute_type
+
+    def executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_load_local,
+            initargs=(self.model, self.compute_type, self.threads),
+        )
+
+    def task(self):
+        return _transcribe_local
+
+
+BACKENDS = {
+    "openai": OpenAITranscriber,
+    "local": LocalTranscriber,
+}
+
+
+def get_transcriber(backend=TRANSCRIBE_BACKEND, **params):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend: {backend}. Use one of {list(BACKENDS)}")
+    return BACKENDS[backend](**params)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--workers", type=int, default=TRANSCRIBE_WORKERS)
+    args = parser.parse_args()
+    for backend in args.backends:
+        _, stats = get_transcriber(backend, workers=args.workers).transcribe(args.files)
+        print(
+            f"{backend:<8} {stats['audio_seconds']:>8.1f}s audio"
+            f" {stats['transcribe_seconds']:>8.1f}s  RTF {stats['real_time_factor']:.3f}"
+        )
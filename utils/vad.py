@@ -0,0 +1,138 @@
+"""
+Voice activity trimming for MeetingGPT audio.
+
+Silences longer than `min_silence` (breaks, waiting for people to join,
+muted stretches) are cut out before the audio is chunked and transcribed, so
+transcription time, upload bytes and API cost shrink with the silence removed.
+Speech is found per 30 ms frame by its energy above the recording's own noise
+floor (the quietest frames), with `padding` kept around every region so words
+are not clipped. Energy does not tell speech from loud music, so music is
+kept.
+
+The trimmed audio comes with an OffsetMap from trimmed time back to the
+original recording, so a position in the transcript (a chunk start, a
+segment timestamp) still points at the right moment of the video.
+"""
+import bisect
+import json
+import numpy as np
+
+FRAME_MS = 30
+SAMPLE_RATE = 16000
+
+
+def frame_db(samples, rate, frame_ms=FRAME_MS):
+    """Energy of each frame in dB."""
+    size = max(int(rate * frame_ms / 1000), 1)
+    frames = len(samples) // size
+    if not frames:
+        return np.empty(0, dtype=np.float32)
+    x = np.asarray(samples[: frames * size], dtype=np.float32).reshape(frames, size)
+    return 10 * np.log10((x * x).mean(axis=1) + 1e-10)
+
+
+def speech_regions(
+    samples,
+    rate,
+    frame_ms=FRAME_MS,
+    margin_db=12.0,
+    min_silence=1.0,
+    padding=0.3,
+):
+    """Returns the (start, end) seconds of speech in `samples` (mono)."""
+    db = frame_db(samples, rate, frame_ms)
+    if not len(db):
+        return []
+    # 가장 조용한 10% 프레임을 배경 소음으로 보고 그보다 margin_db 큰 프레임을 음성으로 판단
+    voiced = db > np.percentile(db, 10) + margin_db
+    frame = frame_ms / 1000
+    duration = len(samples) / rate
+    regions = []
+    for start, end in _runs(voiced):
+        start, end = max(start * frame - padding, 0.0), min(end * frame + padding, duration)
+        # min_silence보다 짧은 침묵은 자르지 않음
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def _runs(mask):
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+class OffsetMap:
+    """Maps seconds in the trimmed audio to seconds in the original one."""
+
+    def __init__(self, segments):
+        # (잘린 오디오에서의 시작, 원본에서의 시작, 길이)
+        self.segments = [tuple(segment) for segment in segments]
+        self.starts = [segment[0] for segment in self.segments]
+
+    @classmethod
+    def from_regions(cls, regions):
+        segments = []
+        trimmed = 0.0
+        for start, end in regions:
+            segments.append((trimmed, start, end - start))
+            trimmed += end - start
+        return cls(segments)
+
+    @property
+    def trimmed_seconds(self):
+        return sum(length for _, _, length in self.segments)
+
+    def to_original(self, seconds):
+        if not self.segments:
+            return seconds
+        i = max(bisect.bisect_right(self.starts, seconds) - 1, 0)
+        trimmed_start, original_start, length = self.segments[i]
+        return original_start + min(max(seconds - trimmed_start, 0.0), length)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.segments, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+
+def trim_silence(track, downsample=True, **params):
+    """
+    Returns `track` (a pydub AudioSegment) without its long silences, the
+    OffsetMap back to `track` and stats. With `downsample` the audio is also
+    converted to 16 kHz mono, all Whisper uses.
+    """
+    from pydub import AudioSegment
+
+    if downsample:
+        track = track.set_frame_rate(SAMPLE_RATE).set_channels(1)
+    mono = track.set_channels(1) if track.channels > 1 else track
+    samples = np.array(mono.get_array_of_samples())
+    # 오디오는 ms 단위로 자르므로 오프셋도 ms로 맞춤
+    regions = [
+        (round(start, 3), round(end, 3))
+        for start, end in speech_regions(samples, mono.frame_rate, **params)
+    ]
+    # 구간마다 이어 붙이면 매번 전체를 복사하므로 raw 데이터를 한 번에 합침
+    trimmed = AudioSegment(
+        data=b"".join(
+            track[int(start * 1000) : int(end * 1000)].raw_data for start, end in regions
+        ),
+        sample_width=track.sample_width,
+        frame_rate=track.frame_rate,
+        channels=track.channels,
+    )
+    offsets = OffsetMap.from_regions(regions)
+    original = len(track) / 1000
+    stats = {
+        "original_seconds": original,
+        "speech_seconds": offsets.trimmed_seconds,
+        "removed_fraction": 1 - offsets.trimmed_seconds / original if original else 0.0,
+        "regions": len(regions),
+    }
+    return trimmed, offsets, stats
@@ -0,0 +1,390 @@
+"""
+Local retrieval service shared by every Streamlit replica.
+
+    python -m utils.vector_service --port 8765 --max-loaded 8
+
+Each namespace ("documentgpt/<file>", "sitegpt/cloudflare", ...) lives in its own
+directory: the vectors in an append-only float32 file that is memory-mapped for
+search, and the texts and metadata in SQLite. Replicas send embeddings they
+computed themselves, so the service never needs an API key. Only the most
+recently used namespaces stay mapped; the rest are closed (LRU) once no
+request is using them.
+
+Pages use it when VECTOR_SERVICE_URL is set, through `service_retriever()`.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List
+import numpy as np
+import requests
+from langchain.schema import BaseRetriever, Document
+
+VECTOR_SERVICE_URL = os.environ.get("VECTOR_SERVICE_URL")
+NAMESPACE_PATTERN = re.compile(r"^[\w.-]+(/[\w.-]+)*$")
+
+
+def namespace_name(tenant, corpus):
+    corpus = re.sub(r"[^\w.-]", "_", corpus).strip(".")
+    return f"{tenant}/{corpus}"
+
+
+class Namespace:
+    def __init__(self, path, dim=None):
+        self.path = path
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        else:
+            if dim is None:
+                raise KeyError(path)
+            self.dim = dim
+            with open(meta_path, "w") as f:
+                json.dump({"dim": dim}, f)
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.db = sqlite3.connect(os.path.join(path, "docs.sqlite"), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, text TEXT, metadata TEXT)"
+        )
+        self.vectors = None
+        # 요청이 사용 중인 동안은 LRU에서 닫지 않음 (NamespaceStore.use)
+        self.pins = 0
+        self._map()
+
+    def _map(self):
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        count = size // (4 * self.dim)
+        self.vectors = (
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+            if count
+            else np.zeros((0, self.dim), dtype=np.float32)
+        )
+
+    @property
+    def count(self):
+        return len(self.vectors)
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes
+
+    def add(self, texts, metadatas, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        with self.lock:
+            if self.vectors is None:
+                raise KeyError("namespace was evicted")
+            start = self.count
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            self.db.executemany(
+                "INSERT INTO docs (id, text, metadata) VALUES (?, ?, ?)",
+                [
+                    (start + i, text, json.dumps(metadata or {}))
+                    for i, (text, metadata) in enumerate(zip(texts, metadatas))
+                ],
+            )
+            self.db.commit()
+            self._map()
+        return len(vectors)
+
+    def search(self, embedding, k=4, filter=None, block=65536):
+        query = np.asarray(embedding, dtype=np.float32)
+        with self.lock:
+            vectors = self.vectors
+            allowed = self._filter_ids(filter) if filter else None
+        if vectors is None:
+            raise KeyError("namespace was evicted")
+        if not len(vectors):
+            return []
+        distances = np.empty(len(vectors), dtype=np.float32)
+        # 블록 단위로 계산해 매핑된 파일 전체를 한 번에 메모리에 올리지 않음
+        for start in range(0, len(vectors), block):
+            chunk = vectors[start : start + block]
+            distances[start : start + len(chunk)] = ((chunk - query) ** 2).sum(axis=1)
+        if allowed is not None:
+            mask = np.full(len(vectors), np.inf, dtype=np.float32)
+            ids = allowed[allowed < len(vectors)]
+            mask[ids] = 0
+            distances += mask
+        k = min(k, len(vectors))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        top = [int(i) for i in top if np.isfinite(distances[i])]
+        with self.lock:
+            # 거리를 계산하는 동안 닫혔으면 닫힌 DB를 읽지 않음
+            if self.vectors is None:
+                raise KeyError("namespace was evicted")
+            rows = self._rows(top)
+        return [
+            {"text": rows[i][0], "metadata": json.loads(rows[i][1]), "score": float(distances[i])}
+            for i in top
+            if i in rows
+        ]
+
+    def _filter_ids(self, filter):
+        # {"key": value} 는 같은 값, {"key": [a, b]} 는 그중 하나
+        clauses = []
+        params = []
+        for key, item in filter.items():
+            values = item if isinstance(item, list) else [item]
+            placeholders = ",".join("?" for _ in values)
+            clauses.append(f"json_extract(metadata, ?) IN ({placeholders})")
+            params += [f'$."{key}"', *values]
+        clauses = " AND ".join(clauses)
+        rows = self.db.execute(f"SELECT id FROM docs WHERE {clauses}", params).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def _rows(self, ids):
+        if not ids:
+            return {}
+        placeholders = ",".join("?" for _ in ids)
+        rows = self.db.execute(
+            f"SELECT id, text, metadata FROM docs WHERE id IN ({placeholders})", ids
+        ).fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def close(self):
+        with self.lock:
+            self.vectors = None
+            self.db.close()
+
+
+class NamespaceStore:
+    def __init__(self, root, max_loaded=8):
+        self.root = root
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _path(self, name):
+        if not NAMESPACE_PATTERN.match(name) or ".." in name:
+            raise ValueError(f"Invalid namespace: {name}")
+        return os.path.join(self.root, name)
+
+    @contextmanager
+    def use(self, name, dim=None):
+        """The loaded namespace, kept open until the block ends."""
+        with self.lock:
+            if name in self.loaded:
+                self.loaded.move_to_end(name)
+                namespace = self.loaded[name]
+            else:
+                namespace = Namespace(self._path(name), dim)
+                self.loaded[name] = namespace
+            namespace.pins += 1
+            self._evict()
+        try:
+            yield namespace
+        finally:
+            with self.lock:
+                namespace.pins -= 1
+                self._evict()
+
+    def _evict(self):
+        # 오래 안 쓴 것부터 닫되 사용 중인 것은 건너뜀 (요청이 끝날 때 다시 정리)
+        for name in list(self.loaded):
+            if len(self.loaded) <= self.max_loaded:
+                break
+            if not self.loaded[name].pins:
+                self.loaded.pop(name).close()
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self._path(name), "meta.json"))
+
+    def delete(self, name):
+        import shutil
+
+        with self.lock:
+            namespace = self.loaded.pop(name, None)
+            if namespace:
+                namespace.close()
+            shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "loaded": {
+                    name: {"count": namespace.count, "bytes": namespace.nbytes}
+                    for name, namespace in self.loaded.items()
+                },
+                "max_loaded": self.max_loaded,
+            }
+
+
+def make_handler(store):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _route(self):
+            # /namespaces/<name>[/add|/search]
+            path = self.path.split("?")[0].strip("/")
+            if path == "stats":
+                return "stats", None
+            if not path.startswith("namespaces/"):
+                return None, None
+            name = path[len("namespaces/") :]
+            for action in ("add", "search"):
+                if name.endswith(f"/{action}"):
+                    return action, name[: -len(action) - 1]
+            return "namespace", name
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _handle(self, method):
+            try:
+                action, name = self._route()
+                if method == "GET" and action == "stats":
+                    return self._send(200, store.stats())
+                if method == "GET" and action == "namespace":
+                    if not store.exists(name):
+                        return self._send(404, {"error": "not found"})
+                    with store.use(name) as namespace:
+                        info = {"count": namespace.count, "dim": namespace.dim}
+                    return self._send(200, info)
+                if method == "DELETE" and action == "namespace":
+                    store.delete(name)
+                    return self._send(200, {"deleted": name})
+                if method == "POST" and action == "add":
+                    body = self._body()
+                    embeddings = body["embeddings"]
+                    dim = len(embeddings[0]) if embeddings else None
+                    with store.use(name, dim=dim) as namespace:
+                        added = namespace.add(
+                            body["texts"],
+                            body.get("metadatas") or [{}] * len(body["texts"]),
+                            embeddings,
+                        )
+                        count = namespace.count
+                    return self._send(200, {"added": added, "count": count})
+                if method == "POST" and action == "search":
+                    if not store.exists(name):
+                        return self._send(404, {"error": "not found"})
+                    body = self._body()
+                    with store.use(name) as namespace:
+                        results = namespace.search(
+                            body["embedding"], body.get("k", 4), body.get("filter")
+                        )
+                    return self._send(200, {"results": results})
+                self._send(404, {"error": "not found"})
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+        def log_message(self, *args: Any):
+            pass
+
+    return Handler
+
+
+def serve(root="./.cache/vector_service", host="127.0.0.1", port=8765, max_loaded=8):
+    store = NamespaceStore(root, max_loaded)
+    server = ThreadingHTTPServer((host, port), make_handler(store))
+    server.serve_forever()
+
+
+class VectorServiceClient:
+    def __init__(self, url=None, timeout=30):
+        self.url = (url or VECTOR_SERVICE_URL or "http://127.0.0.1:8765").rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def exists(self, namespace):
+        r = self.session.get(f"{self.url}/namespaces/{namespace}", timeout=self.timeout)
+        return r.status_code == 200
+
+    def add(self, namespace, texts, metadatas, embeddings, batch_size=512):
+        for start in range(0, len(texts), batch_size):
+            end = start + batch_size
+            r = self.session.post(
+                f"{self.url}/namespaces/{namespace}/add",
+                json={
+                    "texts": texts[start:end],
+                    "metadatas": metadatas[start:end],
+                    "embeddings": embeddings[start:end],
+                },
+                timeout=self.timeout,
+            )
+            r.raise_for_status()
+
+    def search(self, namespace, embedding, k=4, filter=None):
+        r = self.session.post(
+            f"{self.url}/namespaces/{namespace}/search",
+            json={"embedding": embedding, "k": k, "filter": filter},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        return r.json()["results"]
+
+    def delete(self, namespace):
+        self.session.delete(f"{self.url}/namespaces/{namespace}", timeout=self.timeout)
+
+
+class ServiceRetriever(BaseRetriever):
+    client: Any
+    namespace: str
+    embeddings: Any
+    k: int = 4
+    filter: dict = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        results = self.client.search(
+            self.namespace, self.embeddings.embed_query(query), self.k, self.filter
+        )
+        return [
+            Document(page_content=result["text"], metadata=result["metadata"])
+            for result in results
+        ]
+
+
+def service_retriever(namespace, docs, embeddings, k=4, client=None):
+    """
+    Returns a retriever over `namespace`, embedding and uploading `docs` first
+    if the service doesn't have the namespace yet. `docs` may be a callable so
+    loading and splitting is skipped when the namespace already exists.
+    """
+    client = client or VectorServiceClient()
+    if not client.exists(namespace):
+        docs = docs() if callable(docs) else docs
+        texts = [doc.page_content for doc in docs]
+        client.add(
+            namespace,
+            texts,
+            [doc.metadata for doc in docs],
+            embeddings.embed_documents(texts),
+        )
+    return ServiceRetriever(client=client, namespace=namespace, embeddings=embeddings, k=k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default="./.cache/vector_service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-loaded", type=int, default=8)
+    args = parser.parse_args()
+    serve(args.root, args.host, args.port, args.max_loaded)